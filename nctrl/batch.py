@@ -0,0 +1,222 @@
+import os
+import glob
+import json
+import shutil
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .cache import content_key
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+RESULTS = 'results.csv'
+
+
+def find_sessions(paths, pattern='model.pd'):
+    """
+    Expand directories (searched recursively for `pattern`) and glob patterns to spktag model files.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        else:
+            files.extend(glob.glob(path, recursive=True))
+    return sorted({os.path.abspath(f) for f in files if os.path.isfile(f)})
+
+
+def available_memory():
+    """Available physical memory in bytes (MemAvailable on Linux)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def estimate_memory(spike_file, factor=8):
+    """
+    Rough peak memory of processing one session.
+
+    Unpickling model.pd dominates the first load of a session, and the
+    DataFrame takes a few times the pickle's size.
+    """
+    return os.path.getsize(spike_file) * factor
+
+
+def process_session(spike_file, targets=(0.2,), directions=('up',), bin_size=0.1, B_bins=10, B2_bins=600,
+                    min_fr=0.5, cache_dir=None):
+    """
+    Per-unit statistics and a decoder parameter sweep for one session.
+
+    Every unit firing at least `min_fr` Hz is evaluated with DynamicFrThreshold
+    and RateController for each (target, direction) pair. Decisions come from
+    predict_batch and predict calls are not timed (the cpu_* columns are NaN;
+    `nctrl evaluate` measures them for one unit).
+
+    The session's derived arrays are memory-mapped from `cache_dir`, which
+    belongs to this job and is removed at the end, so screening neither
+    evicts the interactive cache nor another worker's session. Without
+    `cache_dir` they are kept in memory.
+
+    Returns:
+        pd.DataFrame: One row per (unit, decoder, target, direction).
+    """
+    from .unit import Unit
+
+    unit = Unit()
+    try:
+        unit.load(spike_file, cache=cache_dir or False)
+        return _sweep(unit, spike_file, targets, directions, bin_size, B_bins, B2_bins, min_fr)
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _sweep(unit, spike_file, targets, directions, bin_size, B_bins, B2_bins, min_fr):
+    from .report import unit_stats
+    from .evaluate import evaluate
+    from .decoder import DynamicFrThreshold, RateController
+
+    stats = unit_stats(unit, bin_size, B_bins).reset_index()
+    counts = unit.spike_count(bin_size)
+
+    rows = []
+    for i_unit in np.flatnonzero(unit.spike_fr >= min_fr):
+        unit_id = i_unit + 1
+        for target_fr, direction in itertools.product(targets, directions):
+            dynamic = DynamicFrThreshold()
+            dynamic.fit(unit_id=unit_id, target_fr=target_fr, bin_size=bin_size, B_bins=B_bins, B2_bins=B2_bins,
+                        direction=direction)
+            controller = RateController()
+            controller.fit(unit_id=unit_id, target_fr=target_fr, bin_size=bin_size, B_bins=B_bins, direction=direction)
+            result = evaluate({'dynamic': dynamic, 'controller': controller}, np.asarray(counts[i_unit]), bin_size,
+                              B_bins, target_fr, window=B2_bins * bin_size, timing=False)
+            result = result.reset_index().assign(unit=unit_id, target_fr=target_fr, direction=direction)
+            rows.append(result)
+
+    sweep = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=['unit', 'decoder'])
+    table = stats.merge(sweep, on='unit', how='left')
+    table.insert(0, 'session', spike_file)
+    return table
+
+
+def run_batch(paths, out_dir='./batch', n_jobs=None, memory_limit=None, **kwargs):
+    """
+    Process many sessions on a process pool, resumably.
+
+    Sessions already listed as done in `out_dir/manifest.json` with an
+    unchanged content hash are skipped. Jobs are submitted only while the
+    summed memory estimate of running jobs stays below `memory_limit`
+    (default: 80% of the available memory), so large sessions run with
+    fewer neighbours. If a worker still dies (e.g. OOM-killed), the pool is
+    rebuilt and the sessions it was running are retried once, each alone;
+    a session that dies again is marked failed. Each session's table is written to
+    `out_dir/sessions/<sha1>.csv` and all of them are combined into
+    `out_dir/results.csv`.
+
+    Args:
+        paths (list of str): Directories and/or glob patterns.
+        out_dir (str, optional): Output directory. Defaults to './batch'.
+        n_jobs (int, optional): Maximum worker processes. Defaults to os.cpu_count().
+        memory_limit (int, optional): Memory budget in bytes for running jobs.
+        **kwargs: Passed to process_session.
+
+    Returns:
+        pd.DataFrame: The consolidated results table.
+    """
+    session_dir = os.path.join(out_dir, 'sessions')
+    os.makedirs(session_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST)
+    manifest = _load_manifest(manifest_file)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    memory_limit = memory_limit or int(available_memory() * 0.8)
+
+    pending = []
+    for spike_file in find_sessions(paths):
+        key = content_key(spike_file)
+        entry = manifest.get(spike_file)
+        if entry is not None and entry['key'] == key and entry['status'] == 'done':
+            continue
+        pending.append((spike_file, key, estimate_memory(spike_file)))
+    logger.info(f'Batch: {len(pending)} sessions to process, {len(manifest)} in manifest')
+
+    running = {}
+    retried = set()
+    pool = ProcessPoolExecutor(max_workers=n_jobs)
+    try:
+        while pending or running:
+            reserved = sum(job[2] for job in running.values())
+            broken = False
+            while pending and len(running) < n_jobs and (not running or reserved + pending[0][2] <= memory_limit):
+                job = pending[0]
+                try:
+                    # each job caches its session privately, see process_session
+                    future = pool.submit(process_session, job[0], cache_dir=os.path.join(out_dir, 'cache', job[1]),
+                                         **kwargs)
+                except BrokenProcessPool:
+                    broken = True  # the running jobs fail too and are handled below
+                    break
+                pending.pop(0)
+                running[future] = job
+                reserved += job[2]
+
+            done = wait(running, return_when=FIRST_COMPLETED)[0] if running else ()
+            for future in done:
+                spike_file, key, _ = running.pop(future)
+                try:
+                    table = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    # the killed worker left its private cache behind
+                    shutil.rmtree(os.path.join(out_dir, 'cache', key), ignore_errors=True)
+                    if spike_file not in retried:
+                        # unknown which job exhausted the memory: retry each with the whole budget, i.e. alone
+                        retried.add(spike_file)
+                        pending.insert(0, (spike_file, key, memory_limit))
+                        logger.warning(f'Batch: worker died while processing {spike_file}, retrying it alone')
+                        continue
+                    logger.error(f'Batch: {spike_file} failed: worker died again ({e})')
+                    manifest[spike_file] = {'key': key, 'status': 'failed', 'error': f'worker died: {e}'}
+                except Exception as e:
+                    logger.error(f'Batch: {spike_file} failed: {e}')
+                    manifest[spike_file] = {'key': key, 'status': 'failed', 'error': str(e)}
+                else:
+                    table.to_csv(os.path.join(session_dir, f'{key}.csv'), index=False)
+                    manifest[spike_file] = {'key': key, 'status': 'done', 'result': f'sessions/{key}.csv'}
+                    logger.info(f'Batch: {spike_file} done ({len(table)} rows)')
+                _save_manifest(manifest_file, manifest)
+            if broken:
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=n_jobs)
+    finally:
+        pool.shutdown()
+
+    tables = [pd.read_csv(os.path.join(out_dir, entry['result']))
+              for entry in manifest.values() if entry['status'] == 'done']
+    results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    results.to_csv(os.path.join(out_dir, RESULTS), index=False)
+    return results
+
+
+def _load_manifest(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(filename, manifest):
+    tmp = f'{filename}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, filename)
@@ -0,0 +1,151 @@
+import os
+import json
+import shutil
+import contextlib
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.expanduser('~/.cache/nctrl/sessions')
+
+
+def file_hash(filename, block_size=1 << 20):
+    """SHA-1 of a file's content."""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def content_key(filename, cache_dir=CACHE_DIR):
+    """
+    Content hash of `filename`, memoized by (path, size, mtime).
+
+    Hashing a large model file on every run would cost more than loading the
+    cache, so the hash is only recomputed when the file's size or mtime change.
+    """
+    stat = os.stat(filename)
+    path = os.path.abspath(filename)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    index_file = os.path.join(cache_dir, 'stat.json')
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    entry = index.get(path)
+    if entry is not None and entry['stamp'] == stamp:
+        return entry['sha1']
+
+    sha1 = file_hash(filename)
+    index[path] = {'stamp': stamp, 'sha1': sha1}
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{index_file}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, index_file)
+    return sha1
+
+
+class SessionCache:
+    """
+    Content-addressed cache of arrays derived from one spktag model file.
+
+    Each session gets a directory named by the SHA-1 of the model file; every
+    entry is a plain .npy file that is loaded memory-mapped, so repeat runs
+    only touch the pages they use. Writes go through a temporary file and an
+    atomic rename. Sessions are evicted least-recently-used first once the
+    cache holds more than `max_sessions` sessions or `max_bytes` bytes.
+
+    Args:
+        spike_file (str): Path to the spktag model file.
+        cache_dir (str, optional): Cache root. Defaults to ~/.cache/nctrl/sessions.
+        max_sessions (int, optional): Sessions kept after eviction. Defaults to 16.
+        max_bytes (int, optional): Total bytes kept after eviction. Defaults to 4 GiB.
+    """
+    def __init__(self, spike_file, cache_dir=CACHE_DIR, max_sessions=16, max_bytes=4 << 30):
+        self.spike_file = spike_file
+        self.cache_dir = cache_dir
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.key = content_key(spike_file, cache_dir)
+        self.session_dir = os.path.join(cache_dir, self.key)
+        os.makedirs(self.session_dir, exist_ok=True)
+        os.utime(self.session_dir)  # mark as most recently used
+
+    def path(self, name):
+        return os.path.join(self.session_dir, f'{name}.npy')
+
+    def __contains__(self, name):
+        return os.path.isfile(self.path(name))
+
+    def get(self, name, mmap_mode='r'):
+        """Load entry `name` (memory-mapped by default), or None if it is not cached."""
+        try:
+            return np.load(self.path(name), mmap_mode=mmap_mode, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f'Dropping unreadable cache entry {name}: {e}')
+            os.remove(self.path(name))
+            return None
+
+    def put(self, name, array):
+        """Store `array` under `name` and return it memory-mapped."""
+        filename = self.path(name)
+        tmp = f'{filename[:-4]}.{os.getpid()}.tmp.npy'
+        np.save(tmp, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(tmp, filename)
+        self.evict()
+        return self.get(name)
+
+    @contextlib.contextmanager
+    def open(self, name, shape, dtype):
+        """
+        Create entry `name` as a writable memory map, filled inside the with block.
+
+        The entry is only published (atomically) when the block exits without an error.
+        """
+        filename = self.path(name)
+        tmp = f'{filename[:-4]}.{os.getpid()}.tmp.npy'
+        array = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+        try:
+            yield array
+            array.flush()
+        except BaseException:
+            del array
+            os.remove(tmp)
+            raise
+        del array
+        os.replace(tmp, filename)
+
+    def get_or_compute(self, name, func):
+        """Return entry `name`, computing and storing it with func() on a miss."""
+        array = self.get(name)
+        if array is None:
+            array = self.put(name, func())
+        return array
+
+    def evict(self):
+        """Remove least recently used sessions beyond max_sessions / max_bytes."""
+        sessions = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir():
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                sessions.append((entry.stat().st_mtime, size, entry.path))
+        sessions.sort(reverse=True)
+        total = 0
+        for i, (_, size, path) in enumerate(sessions):
+            total += size
+            if path != self.session_dir and (i >= self.max_sessions or total > self.max_bytes):
+                logger.info(f'Evicting cached session {os.path.basename(path)}')
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        """Remove this session's entries."""
+        shutil.rmtree(self.session_dir, ignore_errors=True)
+        os.makedirs(self.session_dir, exist_ok=True)
@@ -0,0 +1,118 @@
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+def correlogram(t1, t2=None, bin_size=25, window_bins=50, chunk_size=1000000):
+    """
+    Cross-correlogram of two sorted spike trains with a sorted-merge sweep.
+
+    Pairs are found by comparing each spike with its k-th successor for
+    k = 1, 2, ... until no successor lies within the lag window, so the cost
+    is proportional to the number of pairs inside the window rather than to
+    all pairs. Trains are swept in chunks of `chunk_size` spikes (plus the
+    window overlap), which bounds memory on long sessions.
+
+    Parameters
+    ----------
+    t1 : ndarray
+        Sorted spike times (samples) of the reference train.
+    t2 : ndarray, optional
+        Sorted spike times of the target train. None gives the autocorrelogram of t1.
+    bin_size : int
+        Bin size in samples (25 = 1 ms at 25 kHz).
+    window_bins : int
+        Number of bins; bin i holds lags in [(i - window_bins // 2) * bin_size,
+        (i - window_bins // 2 + 1) * bin_size).
+    chunk_size : int
+        Number of reference spikes per chunk.
+
+    Returns
+    -------
+    ndarray
+        Counts per lag bin, shape (window_bins,). Positive lags mean t2 after t1.
+    """
+    half = window_bins // 2
+    max_lag = (window_bins - half) * bin_size
+    counts = np.zeros(window_bins, dtype=np.int64)
+
+    def add(lag):
+        bins = half + lag // bin_size
+        counts[:] += np.bincount(bins[(bins >= 0) & (bins < window_bins)], minlength=window_bins)
+
+    if t2 is None:
+        t, label = np.asarray(t1), None
+    else:
+        t = np.concatenate((t1, t2))
+        order = np.argsort(t, kind='mergesort')
+        t = t[order]
+        label = (order >= len(t1)).astype(np.int8)  # 0: t1, 1: t2
+
+    for start in range(0, len(t), chunk_size):
+        stop = min(start + chunk_size, len(t))
+        ext = np.searchsorted(t, t[stop - 1] + max_lag, side='right')
+        t_chunk = t[start:ext]
+        n_ref = stop - start
+        for k in itertools.count(1):
+            n = min(n_ref, len(t_chunk) - k)
+            if n <= 0:
+                break
+            lag = t_chunk[k:k + n] - t_chunk[:n]
+            near = lag <= max_lag
+            if not near.any():
+                break
+            if label is None:
+                add(lag[near])
+                add(-lag[near])
+            else:
+                l_ref, l_next = label[start:start + n], label[start + k:start + k + n]
+                add(lag[near & (l_ref == 0) & (l_next == 1)])    # t2 spike after t1 spike
+                add(-lag[near & (l_ref == 1) & (l_next == 0)])   # t1 spike after t2 spike
+    return counts
+
+
+def _correlogram_pair(args):
+    t1, t2, kwargs = args
+    return correlogram(t1, t2, **kwargs)
+
+
+def autocorrelograms(spike_trains, n_jobs=None, **kwargs):
+    """
+    Autocorrelograms of a list of sorted spike trains, shape (n_train, window_bins).
+
+    With n_jobs > 1 trains are processed on a process pool.
+    """
+    jobs = [(t, None, kwargs) for t in spike_trains]
+    return np.array(_map(_correlogram_pair, jobs, n_jobs))
+
+
+def crosscorrelograms(spike_trains, pairs=None, n_jobs=None, **kwargs):
+    """
+    Pairwise cross-correlograms on demand.
+
+    Parameters
+    ----------
+    spike_trains : list of ndarray
+        Sorted spike times (samples) per unit.
+    pairs : list of (int, int), optional
+        Unit index pairs; defaults to all pairs i < j.
+    n_jobs : int, optional
+        Number of worker processes; None or 1 computes in this process.
+
+    Returns
+    -------
+    dict
+        (i, j) -> counts per lag bin.
+    """
+    if pairs is None:
+        pairs = list(itertools.combinations(range(len(spike_trains)), 2))
+    jobs = [(spike_trains[i], spike_trains[j], kwargs) for i, j in pairs]
+    return dict(zip(pairs, _map(_correlogram_pair, jobs, n_jobs)))
+
+
+def _map(func, jobs, n_jobs):
+    if n_jobs is None or n_jobs <= 1 or len(jobs) <= 1:
+        return [func(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(func, jobs, chunksize=max(len(jobs) // (4 * n_jobs), 1)))
+
@@ -1,26 +1,129 @@
+import os
 import click
 from .core import NCtrl
+from .output import OUTPUTS
 from .unit import Unit
 
 @click.group()
 def main():
     pass
 
+def tuning_options(f):
+    """CPU affinity, SCHED_FIFO and GC options of the BMI loop, see nctrl.tuning."""
+    f = click.option('--cpus', default=None, help="CPUs for the BMI loop, e.g. '2,3' or 'isolated'")(f)
+    f = click.option('--fifo', default=None, type=int, help='Run the BMI loop SCHED_FIFO at this priority')(f)
+    f = click.option('--gc-freeze/--no-gc-freeze', default=True,
+                     help='Freeze the GC and collect at safe points of the BMI loop')(f)
+    f = click.option('--gc-full-every', default=60, type=int,
+                     help='Make every n-th scheduled GC collection a full one (default 60)')(f)
+    return f
+
+def make_tuning(cpus, fifo, gc_freeze, gc_full_every):
+    from .tuning import RuntimeTuning
+    return RuntimeTuning(cpus=cpus, fifo_priority=fifo, gc_freeze=gc_freeze, gc_full_every=gc_full_every)
+
 @main.command()
-@click.option('--port', default=None, help='Serial port to use')
+@click.option('--port', default=None, help="Serial port, or the datagram output's host:port or Unix socket path")
 @click.option('--prbfile', default=None, help='Path to PRB file')
-@click.option('--output', default='laser', help='Output type')
-def bmi(port, prbfile, output):
-    nctrl = NCtrl(prbfile=prbfile, output_port=port, output_type=output)
+@click.option('--output', default='laser', type=click.Choice(list(OUTPUTS)), help='Output backend')
+@tuning_options
+def bmi(port, prbfile, output, cpus, fifo, gc_freeze, gc_full_every):
+    # initialization continues in the background while the GUI comes up
+    nctrl = NCtrl(prbfile=prbfile, output_port=port, output_type=output, wait=False,
+                  tuning=make_tuning(cpus, fifo, gc_freeze, gc_full_every))
     nctrl.show()
 
 @main.command()
 @click.option('--file', default=None, help='Path to spktag model file')
 @click.option('--id', default=None, help='Unit ID to simulate')
-def unit(file, id):
+@click.option('--report', default=None, help='Write a PDF/HTML summary of all units instead of plotting')
+@click.option('--jobs', default=None, type=int, help='Worker processes for --report')
+def unit(file, id, report, jobs):
     unit = Unit()
     unit.load(file)
-    if id:
+    if report:
+        from .report import write_report
+        print(write_report(unit, report, n_jobs=jobs).to_string(float_format='{:.2f}'.format))
+    elif id:
         unit.simulate(id)
     else:
-        unit.plot()
\ No newline at end of file
+        unit.plot()
+
+@main.command()
+@click.option('--file', default='./spktag/model.pd', help='Path to spktag model file')
+@click.option('--id', default=1, type=int, help='Unit ID to condition')
+@click.option('--target', default=0.2, type=float, help='Target laser rate (Hz)')
+@click.option('--direction', default='up', type=click.Choice(['up', 'down']), help='Conditioning direction')
+@click.option('--bin-size', default=0.1, type=float, help='Bin size (s)')
+def evaluate(file, id, target, direction, bin_size):
+    from .evaluate import evaluate_session
+    result = evaluate_session(file, unit_id=id, target_fr=target, bin_size=bin_size, direction=direction)
+    print(result.to_string())
+
+@main.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--out', default='./batch', help='Output directory (manifest, per-session and consolidated tables)')
+@click.option('--target', 'targets', default=[0.2], type=float, multiple=True, help='Target laser rate (Hz), repeatable')
+@click.option('--direction', 'directions', default=['up'], type=click.Choice(['up', 'down']), multiple=True,
+              help='Conditioning direction, repeatable')
+@click.option('--bin-size', default=0.1, type=float, help='Bin size (s)')
+@click.option('--min-fr', default=0.5, type=float, help='Skip the decoder sweep for units below this rate (Hz)')
+@click.option('--jobs', default=None, type=int, help='Maximum worker processes')
+@click.option('--memory', default=None, type=float, help='Memory budget for running jobs (GB)')
+def batch(paths, out, targets, directions, bin_size, min_fr, jobs, memory):
+    """Screen spktag sessions (directories or globs) for BMI candidate units."""
+    from .batch import run_batch
+    from .log import setup_logging
+    os.makedirs(out, exist_ok=True)
+    setup_logging(os.path.join(out, 'batch.log'))
+    results = run_batch(paths, out, n_jobs=jobs, memory_limit=int(memory * 1e9) if memory else None,
+                        targets=targets, directions=directions, bin_size=bin_size, min_fr=min_fr)
+    print(f'{len(results)} rows written to {os.path.join(out, "results.csv")}')
+
+@main.command()
+@click.argument('protocol_file')
+@click.option('--port', default=None, help="Serial port, or the datagram output's host:port or Unix socket path")
+@click.option('--prbfile', default=None, help='Path to PRB file')
+@click.option('--output', default='laser', type=click.Choice(list(OUTPUTS)), help='Output backend')
+@tuning_options
+def run(protocol_file, port, prbfile, output, cpus, fifo, gc_freeze, gc_full_every):
+    """Run an experiment protocol (JSON/YAML schedule of decoder epochs) headless."""
+    import time
+    from .protocol import Protocol
+    protocol = Protocol.load(protocol_file)
+    nctrl = NCtrl(prbfile=prbfile, output_port=port, output_type=output,
+                  tuning=make_tuning(cpus, fifo, gc_freeze, gc_full_every))
+    try:
+        nctrl.start_protocol(protocol)
+        # epochs are switched by the BMI loop on FPGA time; just wait for the last one to end
+        while nctrl.protocol_epoch() < len(protocol.epochs):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if nctrl.running:
+            nctrl.stop_bmi()
+
+@main.command()
+@click.option('--port', default=None, help="Serial port, or the datagram output's host:port or Unix socket path")
+@click.option('--prbfile', default=None, help='Path to PRB file')
+@click.option('--output', default='laser', type=click.Choice(list(OUTPUTS)), help='Output backend')
+@click.option('--host', default='127.0.0.1', help='Control API bind address')
+@click.option('--api-port', default=7070, type=int, help='Control API TCP port')
+@click.option('--unix', 'unix_path', default=None, help='Serve the control API on this Unix socket instead of TCP')
+@click.option('--interval', default=1.0, type=float, help='Seconds between streamed rate updates')
+@tuning_options
+def serve(port, prbfile, output, host, api_port, unix_path, interval, cpus, fifo, gc_freeze, gc_full_every):
+    """Run the BMI headless, controlled over a JSON-lines socket API."""
+    import asyncio
+    from .server import ControlServer
+    nctrl = NCtrl(prbfile=prbfile, output_port=port, output_type=output,
+                  tuning=make_tuning(cpus, fifo, gc_freeze, gc_full_every))
+    server = ControlServer(nctrl, host=host, port=api_port, unix_path=unix_path, interval=interval)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if nctrl.running:
+            nctrl.stop_bmi()
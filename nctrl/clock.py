@@ -0,0 +1,165 @@
+import mmap
+import logging
+import collections
+import numpy as np
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FPGA_RATE = 25000  # FPGA timestamps are in samples at 25 kHz
+DEVICE_WRAP = 1 << 32  # Teensy micros() is a uint32
+
+
+class LinearFit:
+    """
+    Windowed lower-envelope fit of y = intercept + slope * x.
+
+    Clock samples carry a positive, variable error (transport delay or ping
+    round trip). Within each `window` of x only the sample with the smallest
+    error is kept, and a line is fitted through the last `n_windows` kept
+    samples, which tracks both the offset and the drift between two clocks.
+    Until the samples span `min_windows` windows a slope would be mostly
+    noise, so only the offset to the newest sample is used.
+
+    Args:
+        window (float, optional): Window length in units of x. Defaults to 1.0.
+        n_windows (int, optional): Windows used for the fit. Defaults to 60.
+        min_windows (int, optional): Span needed to fit the slope. Defaults to 10.
+    """
+    def __init__(self, window=1.0, n_windows=60, min_windows=10):
+        self.window = window
+        self.min_windows = min_windows
+        self.points = collections.deque(maxlen=n_windows)
+        self._window = None
+        self._best = None
+        self.intercept = 0.0
+        self.slope = 1.0
+        self.n = 0
+
+    def add(self, x, y, error):
+        """Add a sample; returns True when the fit was updated."""
+        i_window = int(x // self.window)
+        if i_window != self._window:
+            self._window = i_window
+            self._best = (x, y, error)
+            self.points.append(self._best)
+        elif error < self._best[2]:
+            self._best = (x, y, error)
+            self.points[-1] = self._best
+        else:
+            return False
+        self._fit()
+        return True
+
+    def _fit(self):
+        x, y, _ = np.array(self.points).T
+        if x[-1] - x[0] >= self.min_windows * self.window:
+            x0 = x[0]
+            self.slope, intercept = np.polyfit(x - x0, y, 1)
+            self.intercept = intercept - self.slope * x0
+        else:
+            self.slope = 1.0
+            self.intercept = y[-1] - x[-1]
+        self.n = len(x)
+
+    def __call__(self, x):
+        return self.intercept + self.slope * x
+
+
+class ClockSync:
+    """
+    Maps FPGA timestamps to the output device's clock.
+
+    Two fits are combined:
+
+    - FPGA -> host: `observe_fpga` with a spike timestamp and the host
+      `perf_counter` when the spike was read. Reading only ever delays a
+      spike, so the lower envelope is the clock relation, up to the
+      minimum transport delay (a constant that shifts all triggers alike).
+    - host -> device: `observe_ping` with the host times around a ping and
+      the device's micros() in the reply; the midpoint of the fastest round
+      trip per window is used.
+
+    The fitted parameters live in a shared anonymous memory map, so a forked
+    BMI process that sends triggers sees pings done by the parent.
+
+    Args:
+        fpga_window (float, optional): Fit window for FPGA samples (s). Defaults to 1.0.
+        ping_window (float, optional): Fit window for pings (s). Defaults to 5.0.
+        n_windows (int, optional): Windows per fit. Defaults to 60.
+    """
+    def __init__(self, fpga_window=1.0, ping_window=5.0, n_windows=60):
+        self.fpga_fit = LinearFit(fpga_window, n_windows)
+        self.device_fit = LinearFit(ping_window, n_windows)
+        # [fpga intercept, fpga slope, device intercept, device slope, fpga ready, device ready]
+        self._mmap = mmap.mmap(-1, 6 * 8)
+        self.params = np.frombuffer(self._mmap, dtype=np.float64)
+        self.params[:] = (0, 1, 0, 1, 0, 0)
+        self._last_device = None
+        self._device_offset = 0
+        self.rtt = REGISTRY.histogram('nctrl_clock_ping_rtt_seconds', 'Round trip of clock sync pings',
+                                      buckets=(1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2))
+        self.drift = {name: REGISTRY.gauge('nctrl_clock_drift_ppm', 'Clock drift relative to the host', {'clock': name})
+                      for name in ('fpga', 'device')}
+
+    @property
+    def ready(self):
+        """True once both the FPGA and the device clock have been observed."""
+        return bool(self.params[4] and self.params[5])
+
+    def observe_fpga(self, timestamp, host_time):
+        """
+        Add an FPGA sample.
+
+        Args:
+            timestamp (int): FPGA timestamp of a spike (samples).
+            host_time (float): perf_counter() when the spike was read.
+        """
+        t = timestamp / FPGA_RATE
+        if self.fpga_fit.add(t, host_time, host_time - t):
+            self.params[0:2] = self.fpga_fit.intercept, self.fpga_fit.slope
+            self.params[4] = 1
+            self.drift['fpga'].set((1 / self.fpga_fit.slope - 1) * 1e6)
+
+    def observe_ping(self, host_send, host_recv, device_us):
+        """
+        Add a ping.
+
+        Args:
+            host_send (float): perf_counter() before the ping was written.
+            host_recv (float): perf_counter() after the reply was read.
+            device_us (int): The device's micros() in the reply.
+        """
+        if self._last_device is not None and device_us < self._last_device:
+            self._device_offset += DEVICE_WRAP  # micros() wraps every 71.6 min
+        self._last_device = device_us
+        rtt = host_recv - host_send
+        self.rtt.observe(rtt)
+        if self.device_fit.add((host_send + host_recv) / 2, (device_us + self._device_offset) / 1e6, rtt):
+            self.params[2:4] = self.device_fit.intercept, self.device_fit.slope
+            self.params[5] = 1
+            self.drift['device'].set((self.device_fit.slope - 1) * 1e6)
+
+    def reset_device(self):
+        """Forget the device clock, e.g. after the device reconnected and may have rebooted."""
+        self.device_fit = LinearFit(self.device_fit.window, self.device_fit.points.maxlen, self.device_fit.min_windows)
+        self._last_device = None
+        self._device_offset = 0
+        self.params[5] = 0
+
+    def fpga_to_host(self, timestamp):
+        """Host perf_counter time of an FPGA timestamp."""
+        return self.params[0] + self.params[1] * (timestamp / FPGA_RATE)
+
+    def host_to_device(self, host_time):
+        """Device micros() (unwrapped, float) at a host perf_counter time."""
+        return (self.params[2] + self.params[3] * host_time) * 1e6
+
+    def fpga_to_device(self, timestamp):
+        """Device micros() (uint32, as the firmware sees it) at an FPGA timestamp."""
+        return int(self.host_to_device(self.fpga_to_host(timestamp))) % DEVICE_WRAP
+
+    def __repr__(self):
+        return (f'ClockSync(ready={self.ready}, fpga drift {self.drift["fpga"].value:.1f} ppm, '
+                f'device drift {self.drift["device"].value:.1f} ppm)')
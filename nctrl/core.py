@@ -1,18 +1,25 @@
 import os
 import sys
+import json
+import time
 import numpy as np
 import logging
-from PyQt5.QtWidgets import QApplication
 
 logger = logging.getLogger(__name__)
 
-from spiketag.base import probe
 from spiketag.realtime import BMI
 
 from .decoder import *
-from .output import Laser
-from .gui import NCtrlGUI
-from .utils import kill_existing_processes, FastBinner
+from .output import OUTPUTS
+from .log import setup_logging
+from .record import SessionRecorder, KIND_EPOCH
+from .stream import FetReader, SpikeRecord, FET_DEVICE
+from .snapshot import SnapshotStore, SnapshotWriter, get_state, set_state
+from .metrics import REGISTRY, MetricsServer
+from .utils import kill_existing_processes, FastBinner, SpikeCountSketch, SpikeRing, RatePyramid
+from .startup import StartupTimer, Initializer, discover_devices, find_probe_file, load_probe
+
+NEVER = np.iinfo(np.int64).max  # event time that is never reached
 
 
 class NCtrl:
@@ -27,68 +34,137 @@ class NCtrl:
         prb (spiketag.base.probe): Probe object.
         bmi (spiketag.realtime.BMI): BMI object.
         dec (Union[FrThreshold, Spikes]): Decoder object.
-        output (Callable): Output function (e.g., Laser).
+        output (Output): Output backend (e.g., Laser), see `set_output`.
+        recorder (SessionRecorder): Recorder of decoder decisions, or None.
         gui (nctrl_gui): GUI object for the NCtrl system.
 
     Args:
         prbfile (str, optional): Path to the probe file. If None, attempts to find one.
         fetfile (str, optional): Path to the feature file. Defaults to './fet.bin'.
-        output_type (str, optional): Type of output. Defaults to 'laser'.
+        output_type (str, optional): Output backend, a key of `OUTPUTS`. Defaults to 'laser'.
         output_port (str, optional): Port for the output device.
+        record_dir (str, optional): Directory for session records. None disables recording.
+        metrics_port (int, optional): Local port for the Prometheus metrics endpoint. None disables it.
+        wait (bool, optional): Block until the probe, output and BMI are initialized. With False they
+            initialize on background threads; see `ready` and `wait_ready`. Defaults to True.
+        snapshot_interval (float, optional): Seconds between snapshots of the binner and decoder state
+            in `record_dir`, see `set_snapshot`. None disables them. Defaults to 1.0.
+        tuning (RuntimeTuning, optional): CPU affinity, scheduling and GC settings for the BMI loop.
     """
-    def __init__(self, prbfile=None, fetfile='./fet.bin', output_type='laser', output_port=None):
-        self.set_logger()
-        self.set_probe(prbfile)
-        self.set_output(output_type, output_port)
-        self.set_bmi(fetfile)
+    def __init__(self, prbfile=None, fetfile='./fet.bin', output_type='laser', output_port=None, record_dir='./session',
+                 metrics_port=9100, wait=True, snapshot_interval=1.0, tuning=None):
+        self.running = False
+        self.bmi_params = None
+        self.tuning = tuning
+        self.set_snapshot(record_dir, snapshot_interval)
+        self.startup = StartupTimer()
+        with self.startup.phase('logging'):
+            self.set_logger()
+            self.set_metrics(metrics_port)
+
+        # probe, serial output and FPGA come up concurrently (and alongside the GUI when wait=False)
+        self.init = Initializer(self.startup)
+        self.init.submit('devices', self.set_devices)
+        self.init.submit('probe', self.set_probe, prbfile)
+        self.init.submit('output', self.set_output, output_type, output_port, after=('devices',))
+        self.init.submit('bmi', self.set_bmi, fetfile, after=('probe', 'devices'))
+        self.init.submit('recorder', self.set_recorder, record_dir, after=('bmi',))
+        if wait:
+            self.wait_ready()
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until initialization finished.
+
+        Raises:
+            Exception: The first initialization failure.
+        """
+        self.init.wait(timeout)
+        logger.info(self.startup.report())
+
+    def ready(self, step=None):
+        """True if initialization `step` (or all of it) finished successfully."""
+        return self.init.done(step)
     
     def set_logger(self):
-        log_format = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
-        logging.basicConfig(filename='bmi.log',
-                            filemode='w',
-                            level=logging.INFO,
-                            format=log_format,
-                            force=True)
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter(log_format))
-        logger.addHandler(console_handler)
+        setup_logging(filename='bmi.log', level=logging.INFO)
 
-    def set_probe(self, prbfile):
-        def _find_probe_file(prbfile):
-            """Find a suitable probe file."""
-            if prbfile and os.path.isfile(prbfile):
-                return prbfile
-
-            directories = ['.', os.path.expanduser('~/Work/probe-files')]
-            for directory in directories:
-                prb_files = [f for f in os.listdir(directory) if f.endswith('.prb')]
-                if prb_files:
-                    return os.path.join(directory, prb_files[0])
-            return None
+    def set_metrics(self, metrics_port=9100):
+        """
+        Serve the metrics registry on a local port.
+
+        Args:
+            metrics_port (int, optional): TCP port on 127.0.0.1. None disables the endpoint.
+        """
+        self.metrics = REGISTRY
+        self.metrics_server = None
+        if metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(REGISTRY, port=metrics_port)
+            except OSError as e:
+                logger.warning(f'Metrics endpoint disabled: {e}')
 
-        self.prbfile = _find_probe_file(prbfile)
+    def set_devices(self):
+        self.devices = discover_devices()
+
+    def set_probe(self, prbfile):
+        self.prbfile = find_probe_file(prbfile)
         if not self.prbfile:
             raise FileNotFoundError('nctrl.NCtrl: No probe file found. Please provide a probe file.')
 
         logger.info(f'Loading probe file {self.prbfile}')
-        self.prb = probe()
-        self.prb.load(self.prbfile)
+        self.prb = load_probe(self.prbfile)
 
     def set_bmi(self, fetfile):
         logger.info('Loading BMI')
         for attempt in range(2):
             try:
-                self.bmi = NCtrlBMI(prb=self.prb, fetfile=fetfile, output=self.output)
+                self.bmi = NCtrlBMI(prb=self.prb, fetfile=fetfile, output=getattr(self, 'output', None))
+                self.bmi.tuning = self.tuning
                 self.n_units = self.bmi.fpga.n_units
                 return
             except Exception as e:
-                if attempt == 0:
+                # killing other users of the FPGA only helps if the device exists
+                if attempt == 0 and getattr(self, 'devices', {}).get('fpga', True):
                     logger.error(f"Error initializing BMI: {e}")
                     logger.error("Attempting to kill existing processes and retry...")
                     kill_existing_processes()
                 else:
                     raise
 
+    def make_decoder(self, decoder='fr', binner=None, **kwargs):
+        """
+        Build and fit a decoder without installing it.
+
+        Binner-mode decoders are connected to `binner`, whose 'decode' events
+        then drive the decoder, the output and the session record.
+
+        Args:
+            decoder (str, optional): Decoder key, see `set_decoder`. Defaults to 'fr'.
+            binner (FastBinner, optional): Binner feeding a binner-mode decoder.
+            **kwargs: Additional arguments to pass to the decoder's fit method.
+
+        Returns:
+            tuple: (decoder, BMI mode)
+        """
+        decoder_class, mode = DECODERS.get(decoder, (FrThreshold, 'binner'))
+        dec = decoder_class()
+        dec.fit(**kwargs)
+
+        if mode == 'binner':
+            unit = getattr(dec, 'unit_id', -1)
+            decoder_calls = self.bmi.decoder_calls
+
+            @binner.connect
+            def on_decode(X):
+                decoder_calls.inc()
+                y = dec.predict(X)
+                timestamp = int((binner.last_bin + 1) / binner.time_to_bin)  # end of the decoded bin
+                self.output(y, timestamp)
+                if self.recorder is not None:
+                    self.recorder.record(timestamp, unit, X.sum(), getattr(dec, 'nspike', 0), y, y != 0)
+        return dec, mode
+
     def set_decoder(self, decoder='fr', **kwargs):
         """
         Set the decoder for the BMI system.
@@ -97,80 +173,497 @@ class NCtrl:
             decoder (str, optional): Type of decoder to use.
                 'fr': FrThreshold
                 'spikes': Spikes
-                'singleSpike': SingleSpike
+                'single': SingleSpike
+                'dynamic': DynamicFrThreshold
+                'multi': MultiDynamicFrThreshold
+                'rate': RateController
+                'print': Print
             **kwargs: Additional arguments to pass to the decoder's fit method.
         """
-        decoder_map = {
-            'fr': (FrThreshold, 'binner'),
-            'single': (SingleSpike, 'spike'),
-            'dynamic': (DynamicFrThreshold, 'binner'),
-            'print': (Print, 'spike')
-        }
-        decoder_class, mode = decoder_map.get(decoder, (FrThreshold, 'binner'))
-
-        self.dec = decoder_class()
-        self.dec.fit(**kwargs)
+        self.dec, mode = self.make_decoder(decoder, getattr(self.bmi, 'binner', None), **kwargs)
         self.bmi.mode = mode
         self.bmi.output = self.output
+        self.bmi.recorder = self.recorder
         self.bmi.set_decoder(dec=self.dec)
 
-        if mode == 'binner':
-            @self.bmi.binner.connect
-            def on_decode(X):
-                y = self.dec.predict(X)
-                self.output(y)
+    def configure(self, decoder='fr', unit_id=None, unit_ids=None, nspike=1, target_fr=0.2, bin_size=0.1, B_bins=10,
+                  B2_bins=600, direction='up'):
+        """
+        Build the binners and decoder of one BMI configuration without installing them.
+
+        Args:
+            decoder (str, optional): Decoder key, see `set_decoder`. None builds an idle
+                configuration that only records spikes. Defaults to 'fr'.
+            unit_id (int, optional): Unit for single-unit decoders.
+            unit_ids (list of int, optional): Units for 'multi' and 'spikes'.
+            nspike (int, optional): Spike count threshold for 'fr'. Defaults to 1.
+            target_fr (float, optional): Target laser rate (Hz) for 'dynamic', 'multi' and 'rate'. Defaults to 0.2.
+            bin_size (float, optional): Bin size in seconds. Defaults to 0.1.
+            B_bins (int, optional): Bins per decoding window. Defaults to 10.
+            B2_bins (int, optional): Monitoring bins for 'dynamic' and 'multi'. Defaults to 600.
+            direction (str, optional): 'up' or 'down'. Defaults to 'up'.
+
+        Returns:
+            dict: 'mode', 'binner' and 'dec', see `NCtrlBMI.apply`.
+
+        Raises:
+            ValueError: If the decoder is unknown or its units are missing.
+        """
+        if decoder in ('fr', 'dynamic', 'rate', 'single') and unit_id is None:
+            raise ValueError(f"Decoder '{decoder}' needs a unit_id")
+        if decoder in ('multi', 'spikes') and not unit_ids:
+            raise ValueError(f"Decoder '{decoder}' needs at least one unit in unit_ids")
+        binner = dec = None
+        mode = None
+        if decoder == 'fr':
+            binner = self.bmi.make_binner(bin_size=bin_size, B_bins=B_bins, id=unit_id, sketch=True)
+            dec, mode = self.make_decoder(decoder, binner, unit_id=unit_id, nspike=nspike, B_bins=B_bins)
+            logger.info(f"Fr BMI: bin size {bin_size} s, Bin number {B_bins}")
+            logger.info(f"Unit ID: {unit_id}, threshold {nspike}")
+        elif decoder in ('dynamic', 'rate'):
+            binner = self.bmi.make_binner(bin_size=bin_size, B_bins=B_bins, id=unit_id, sketch=True)
+            kwargs = dict(B2_bins=B2_bins) if decoder == 'dynamic' else {}
+            dec, mode = self.make_decoder(decoder, binner, unit_id=unit_id, target_fr=target_fr, bin_size=bin_size,
+                                          B_bins=B_bins, direction=direction, **kwargs)
+            logger.info(f"{'Fr' if decoder == 'dynamic' else 'Rate PID'} BMI: bin size {bin_size} s, "
+                        f"Bin number (threshold) {B_bins}" + (f", monitor {B2_bins}" if decoder == 'dynamic' else ''))
+            logger.info(f"Unit ID: {unit_id}, target FR {target_fr} Hz")
+        elif decoder == 'multi':
+            binner = self.bmi.make_binner(bin_size=bin_size, B_bins=B_bins)
+            dec, mode = self.make_decoder(decoder, binner, unit_ids=unit_ids, target_fr=target_fr, bin_size=bin_size,
+                                          B_bins=B_bins, B2_bins=B2_bins, direction=direction)
+            logger.info(f"Multi FR BMI: bin size {bin_size} s, Bin number (threshold) {B_bins}, monitor {B2_bins}")
+            logger.info(f"Unit IDs: {unit_ids}, target FR {target_fr} Hz each")
+        elif decoder == 'single':
+            dec, mode = self.make_decoder(decoder, unit_id=unit_id)
+            logger.info(f"Single spike BMI: Unit ID {unit_id}")
+        elif decoder == 'spikes':
+            binner = self.bmi.make_binner(bin_size=bin_size, B_bins=1)
+            dec, mode = self.make_decoder(decoder, binner, unit_ids=unit_ids)
+            logger.info(f"Spikes BMI: bin size {bin_size} s")
+            logger.info(f"Unit IDs: {unit_ids} -> TTL channels 0-{len(unit_ids) - 1}")
+        elif decoder == 'print':
+            dec, mode = self.make_decoder(decoder)
+            logger.info('Printing BMI messages')
+        elif decoder is not None:
+            raise ValueError(f'Unknown decoder: {decoder}')
+        return {'mode': mode, 'binner': binner, 'dec': dec}
+
+    def start_bmi(self, decoder='fr', unit_id=None, unit_ids=None, nspike=1, target_fr=0.2, bin_size=0.1, B_bins=10,
+                  B2_bins=600, direction='up'):
+        """
+        Configure binners and decoder, turn the output on and start the BMI.
+
+        This is what the GUI's BMI button and the remote control API do.
+        Arguments are those of `configure`. If a recent snapshot was taken
+        with the same arguments, the binner and decoder state resume from it.
+
+        Raises:
+            ValueError: If the decoder is unknown or its units are missing (nothing is started).
+        """
+        params = dict(decoder=decoder, unit_id=unit_id, unit_ids=unit_ids, nspike=nspike, target_fr=target_fr,
+                      bin_size=bin_size, B_bins=B_bins, B2_bins=B2_bins, direction=direction)
+        config = self.configure(**params)
+        self.bmi_params = params
+        self.output.on()
+        self.dec = config['dec']
+        self.bmi.output = self.output
+        self.bmi.recorder = self.recorder
+        self.bmi.set_schedule([])
+        self.bmi.apply(config)
+        if self.snapshot is not None:
+            meta = {'params': self.bmi_params, 'n_units': int(self.bmi.fpga.n_units)}
+            self.bmi.set_snapshot(SnapshotWriter(self.snapshot, meta), self.snapshot_interval, self.load_snapshot(meta))
+        if config['dec'] is not None:
+            self.bmi.set_decoder(dec=config['dec'])
+        logger.info(f"Laser latency: {self.output.latency} ms, duration: {self.output.duration} ms")
+
+        logger.info('Starting BMI')
+        self.bmi.start(gui_queue=False)
+        self.running = True
+
+    def start_protocol(self, protocol):
+        """
+        Run an experiment protocol: a schedule of decoder epochs on FPGA time.
+
+        Every epoch's binners and decoder are built before the BMI starts, so
+        the BMI loop switches epochs by swapping references at the first spike
+        past each boundary. Epoch boundaries are written to the session record
+        as KIND_EPOCH records, and the protocol next to it as protocol.json.
+
+        Args:
+            protocol (Protocol): Protocol to run, see `nctrl.protocol`.
+
+        Raises:
+            ValueError: If an epoch names an unknown decoder (nothing is started).
+        """
+        schedule = []
+        for i, epoch in enumerate(protocol.epochs):
+            logger.info(f"Protocol epoch {i} '{epoch['name']}': {epoch['duration']} s, decoder {epoch['decoder']}")
+            config = self.configure(epoch['decoder'], **epoch['params'])
+            config.update(name=epoch['name'], duration=epoch['duration'], laser=epoch['laser'])
+            schedule.append(config)
+
+        self.protocol = protocol
+        self.bmi_params = {'protocol': protocol.name}
+        if self.recorder is not None:
+            protocol.save(os.path.join(self.recorder.path, 'protocol.json'))
+        self.output.on()
+        self.bmi.output = self.output
+        self.bmi.recorder = self.recorder
+        self.bmi.set_schedule(schedule)
+        self.bmi.set_snapshot(None)  # epochs swap the state anyway; protocols restart from the beginning
+        logger.info(f"Starting protocol '{protocol.name}': {len(schedule)} epochs, {protocol.duration} s")
+        self.bmi.start(gui_queue=False)
+        self.running = True
+
+    def protocol_epoch(self):
+        """Index of the running protocol epoch; -1 before the first spike, the epoch count once finished."""
+        return int(self.bmi.epoch_gauge.value)
+
+    def stop_bmi(self):
+        """Turn the output off, stop the BMI and flush the session record."""
+        self.output.off()
+        self.bmi.stop()
+        if self.recorder is not None:
+            self.recorder.flush()
+        self.running = False
+        logger.info('Stopping BMI')
+
+    def set_snapshot(self, record_dir='./session', interval=1.0, max_age=600):
+        """
+        Set up crash recovery snapshots of the live binner and decoder state.
+
+        While the BMI runs (without a protocol), its loop copies the state every
+        `interval` seconds of FPGA time and a background thread writes it to
+        `record_dir`/snapshot.bin. `start_bmi` resumes from that snapshot if it
+        was taken with the same parameters and unit count and is at most
+        `max_age` seconds old; `snapshot.clear()` forces a fresh start.
+
+        Args:
+            record_dir (str, optional): Directory of the snapshot file. None disables snapshots.
+            interval (float, optional): Seconds between snapshots. None disables snapshots. Defaults to 1.0.
+            max_age (float, optional): Oldest snapshot (s) to resume from. Defaults to 600.
+        """
+        enabled = record_dir is not None and interval is not None
+        self.snapshot = SnapshotStore(os.path.join(record_dir, 'snapshot.bin')) if enabled else None
+        self.snapshot_interval = interval
+        self.snapshot_max_age = max_age
+
+    def load_snapshot(self, meta):
+        """The state of the latest snapshot if it matches `meta` and is recent enough, else None."""
+        snapshot = self.snapshot.read() if self.snapshot is not None else None
+        if snapshot is None:
+            return None
+        state, snapshot_meta = snapshot
+        age = time.time() - snapshot_meta['wall_time']
+        if (snapshot_meta.get('params') != json.loads(json.dumps(meta['params']))
+                or snapshot_meta.get('n_units') != meta['n_units']):
+            logger.info('Snapshot was taken with other BMI parameters, starting fresh')
+            return None
+        if age > self.snapshot_max_age:
+            logger.info(f'Snapshot is {age:.0f} s old, starting fresh')
+            return None
+        logger.info(f"Resuming from the snapshot at {snapshot_meta['timestamp'] / 25000:.3f} s ({age:.1f} s ago)")
+        return state
+
+    def set_recorder(self, record_dir='./session'):
+        """
+        Set the session recorder for decoder decisions.
+
+        Args:
+            record_dir (str, optional): Root directory for session records. None disables recording.
+        """
+        self.recorder = SessionRecorder(record_dir) if record_dir is not None else None
+        self.bmi.recorder = self.recorder
     
     def set_output(self, output_type='laser', output_port=None):
         """
         Set the output type for the BMI system.
 
         Args:
-            output_type (str, optional): Type of output to use. Defaults to 'laser'.
-            output_port (str, optional): Port for the output device.
+            output_type (str, optional): Type of output to use: 'laser' (serial Teensy), 'null'
+                (discard, to run without hardware), 'memory' (record triggers in memory) or
+                'datagram' (send triggers over UDP or a Unix socket). Defaults to 'laser'.
+            output_port (str, optional): Port for the output device, or the datagram address.
+
+        Raises:
+            ValueError: If the output type is unknown.
         """
+        if output_type not in OUTPUTS:
+            raise ValueError(f"Unknown output type {output_type!r}, expected one of {sorted(OUTPUTS)}")
+        if output_type == 'laser' and output_port is None and getattr(self, 'devices', {}).get('laser'):
+            output_port = self.devices['laser'][0]
+        self.output = OUTPUTS[output_type](output_port)
         if output_type == 'laser':
-            self.output = Laser(output_port)
+            self.output.start_sync()
 
     def show(self):
         """Display the GUI for the NCtrl system."""
+        from PyQt5.QtWidgets import QApplication
+        from .gui import NCtrlGUI
+
         app = QApplication(sys.argv)
-        self.gui = NCtrlGUI(nctrl=self)
-        self.gui.show()
+        with self.startup.phase('gui'):
+            self.gui = NCtrlGUI(nctrl=self)
+            self.gui.show()
         app.exec_()
 
 
 class NCtrlBMI(BMI):
-    def __init__(self, prb, fetfile, ttlport=None, mode='binner', output=None):
+    def __init__(self, prb, fetfile, ttlport=None, mode='binner', output=None, fet_source=FET_DEVICE):
         super().__init__(prb, fetfile, ttlport)
         self.mode = mode
+        self.fet_source = fet_source  # FET records for the loop: the FPGA device, a fet.bin to replay, or None
         self.output = output
-        self.fr_binner = None
+        self.recorder = None
+        self.schedule = []
+        self.snapshot = None
+        self.snapshot_interval = 1.0
+        self.resume_state = None
+        self.tuning = None  # RuntimeTuning applied by the loop's thread
+        self.epoch_gauge = REGISTRY.gauge('nctrl_protocol_epoch', 'Running protocol epoch, -1 before it starts')
+        self.spike_ring = SpikeRing(20000)  # recent spikes for the raster view
+        self.rate_pyramid = RatePyramid(self.fpga.n_units + 1)  # session firing-rate history for the rate view
+        self.spikes_total = REGISTRY.counter('nctrl_bmi_spikes_total', 'Spikes read from the FPGA')
+        self.decoder_calls = REGISTRY.counter('nctrl_bmi_decoder_calls_total', 'Decoder predict calls')
+        self.loop_lag = REGISTRY.histogram('nctrl_bmi_loop_lag_seconds', 'Processing lag behind the FPGA clock, sampled every 256 spikes')
 
     def BMI_core_func(self, gui_queue, model=None):
         self.model = model
+        self._lag_offset = None
+        self._clock = getattr(self.output, 'clock', None)  # FPGA -> output clock, for absolute triggers
+        if self.tuning is not None:
+            self.tuning.apply()
+        # resume, protocol epochs, snapshots and GC happen at FPGA times; one comparison per spike checks for them
+        self._boundaries = None
+        self._next_epoch = -1 if self.schedule else NEVER
+        self._next_snapshot = -1 if self.snapshot is not None else NEVER
+        self._next_gc = -1 if self.tuning is not None and self.tuning.gc_freeze else NEVER
+        next_event = -1 if self.resume_state is not None else min(self._next_epoch, self._next_snapshot, self._next_gc)
+        reader = self.open_fet()
+        if reader is not None:
+            self._batch_loop(reader, next_event)
+        else:
+            self._spike_loop(next_event)
+
+    def _spike_loop(self, next_event):
+        """Process spikes one by one from spiketag's read_bmi."""
+        n_spikes = 0
+        ring_append = self.spike_ring.append
+        pyramid_input = self.rate_pyramid.input
         while True:
             bmi_output = self.read_bmi()
+            ring_append(bmi_output.timestamp, bmi_output.grp_id, bmi_output.spk_id)
+            pyramid_input(bmi_output.timestamp, bmi_output.spk_id)
+            if bmi_output.timestamp >= next_event:
+                next_event = self._on_event(bmi_output.timestamp)
+            self.spikes_total.inc()
+            n_spikes += 1
+            if n_spikes & 0xFF == 0:
+                self._observe_clock(bmi_output.timestamp)
 
             if self.mode == 'binner':
                 self.binner.input(bmi_output)
-                if self.fr_binner is not None:
-                    self.fr_binner.input(bmi_output)
             elif self.mode == 'spike':
-                y = self.dec.predict(bmi_output)
-                self.output(y)
-                
-    def set_binner(self, bin_size, B_bins, id=None):
+                self._predict_spike(bmi_output)
+
+    def _batch_loop(self, reader, next_event):
+        """Process FET records in the batches read from `reader`; returns at the end of a replayed file."""
+        spike = SpikeRecord()  # reused for spike-mode decoders
+        for records in reader:
+            timestamps, grp_ids, spk_ids = records['frame_id'], records['group_id'], records['spike_id']
+            n = len(records)
+            self.spike_ring.extend(timestamps, grp_ids, spk_ids)
+            self.rate_pyramid.input_batch(timestamps, spk_ids)
+            self.spikes_total.inc(n)
+            self._observe_clock(int(timestamps[-1]))
+            start = 0
+            while start < n:
+                # split the batch at the spikes where events are due
+                if timestamps[start] >= next_event:
+                    next_event = self._on_event(int(timestamps[start]))
+                stop = n if timestamps[-1] < next_event else int(np.searchsorted(timestamps, next_event))
+                stop = max(stop, start + 1)
+                if self.mode == 'binner':
+                    self.binner.input_batch(timestamps[start:stop], spk_ids[start:stop])
+                elif self.mode == 'spike':
+                    for i in range(start, stop):
+                        spike.timestamp, spike.grp_id = int(timestamps[i]), int(grp_ids[i])
+                        spike.spk_id = int(spk_ids[i])
+                        self._predict_spike(spike)
+                start = stop
+        logger.info(f'End of {reader.name}')
+
+    def _predict_spike(self, spike):
+        self.decoder_calls.inc()
+        y = self.dec.predict(spike)
+        self.output(y, spike.timestamp)
+        if self.recorder is not None:
+            self.recorder.record(spike.timestamp, spike.spk_id, 1, 0, y or 0, y == 1)
+
+    def _observe_clock(self, timestamp):
+        # host time minus FPGA time; its minimum is the transport delay, the excess is lag
+        host_time = time.perf_counter()
+        lag = host_time - timestamp / 25000
+        self._lag_offset = lag if self._lag_offset is None else min(self._lag_offset, lag)
+        self.loop_lag.observe(lag - self._lag_offset)
+        if self._clock is not None:
+            self._clock.observe_fpga(timestamp, host_time)
+
+    def open_fet(self):
+        """
+        Open `fet_source` for zero-copy batch reading.
+
+        The FPGA device can only be open once, and spiketag's BMI already
+        holds it (as `r32`), so the live loop reads through that handle and
+        copies the stream to the fet.bin that read_bmi would have written
+        (spiketag's `fd`, or `fetfile` opened for appending). A fet.bin given
+        as `fet_source` is replayed without a copy.
+
+        Returns None, to read spike by spike through spiketag's read_bmi, if
+        there is no source or it cannot be opened (e.g. no FPGA device).
+        """
+        if self.fet_source is None:
+            return None
+        try:
+            if self.fet_source == FET_DEVICE and getattr(self, 'r32', None) is not None:
+                tee = getattr(self, 'fd', None)
+                if tee is None and self.fetfile is not None:
+                    tee = os.open(self.fetfile, os.O_CREAT | os.O_WRONLY | os.O_APPEND)
+                reader = FetReader(self.r32, tee=tee)
+            else:
+                reader = FetReader(self.fet_source)
+        except OSError as e:
+            logger.warning(f'Reading spikes through spiketag, {self.fet_source} not available: {e}')
+            return None
+        logger.info(f'Reading FET records from {reader.name}')
+        return reader
+
+    def _on_event(self, timestamp):
+        """Handle the resume, epoch, snapshot and GC events due at FPGA time `timestamp`; returns the next event time."""
+        if self.resume_state is not None:
+            self.restore(self.resume_state, timestamp)
+            self.resume_state = None
+        while timestamp >= self._next_epoch:
+            if self._boundaries is None:
+                # the protocol clock starts at the first spike
+                durations = [int(round(epoch['duration'] * 25000)) for epoch in self.schedule]
+                self._boundaries = timestamp + np.cumsum([0] + durations)
+                self._i_epoch = 0
+            else:
+                self._i_epoch += 1
+            self._start_epoch(self._i_epoch, int(self._boundaries[self._i_epoch]))
+            self._next_epoch = self._boundaries[self._i_epoch + 1] if self._i_epoch < len(self.schedule) else NEVER
+        if timestamp >= self._next_snapshot:
+            # copying the arrays is all the loop does; the snapshot thread serializes and writes
+            self.snapshot.submit(self.get_state(), timestamp)
+            self._next_snapshot = timestamp + int(self.snapshot_interval * 25000)
+        if timestamp >= self._next_gc:
+            binner = self.binner if self.mode == 'binner' else None
+            if binner is None or int(timestamp * binner.time_to_bin) == binner.last_bin:
+                # this spike does not close a bin, so no decode is waiting
+                self.tuning.collect()
+                due = timestamp + int(self.tuning.gc_interval * 25000)
+            else:
+                due = timestamp
+            if binner is not None:
+                # next safe point: the middle of a bin, half a bin away from any decode
+                due = int((int(due * binner.time_to_bin) + 0.5) / binner.time_to_bin)
+            self._next_gc = max(due, timestamp + 1)
+        return min(self._next_epoch, self._next_snapshot, self._next_gc)
+
+    def get_state(self):
+        """Copy of the binner and decoder state, see `nctrl.snapshot`."""
+        state = {}
+        for name in ('binner', 'dec'):
+            obj = getattr(self, name, None)
+            if obj is not None:
+                state.update(get_state(obj, f'{name}.'))
+        return state
+
+    def restore(self, state, timestamp):
+        """
+        Load a state from `get_state` into the installed binner and decoder at FPGA time `timestamp`.
+
+        The binner continues from its last bin, so spikes missed while the
+        BMI was down count as empty bins. If the FPGA clock restarted since the
+        snapshot, binning continues from the current bin with the history kept.
+        """
+        for name in ('binner', 'dec'):
+            obj = getattr(self, name, None)
+            if obj is not None:
+                set_state(obj, state, f'{name}.')
+        binner = getattr(self, 'binner', None)
+        if binner is not None:
+            binner.last_bin = min(binner.last_bin, int(timestamp * binner.time_to_bin))
+        logger.info(f'BMI state restored at {timestamp / 25000:.3f} s')
+
+    def _start_epoch(self, i_epoch, timestamp):
+        """Switch to protocol epoch `i_epoch` (idle once past the last one) at FPGA time `timestamp`."""
+        self.epoch_gauge.set(i_epoch)
+        if i_epoch == len(self.schedule):
+            self.apply({'mode': None, 'binner': None, 'dec': None})
+            logger.info(f'Protocol finished at {timestamp / 25000:.3f} s')
+        else:
+            epoch = self.schedule[i_epoch]
+            binner = epoch['binner']
+            if binner is not None:
+                # start binning at the boundary, not at FPGA time 0
+                binner.last_bin = int(timestamp * binner.time_to_bin)
+            self.apply(epoch)
+            if self.output is not None and epoch['laser']:
+                self.output.send_settings(**epoch['laser'])  # write only, never waits for the device
+            logger.info(f"Protocol epoch {i_epoch} '{epoch['name']}' started at {timestamp / 25000:.3f} s")
+        if self.recorder is not None:
+            self.recorder.record(timestamp, -1, i_epoch, 0, 0, 0, kind=KIND_EPOCH)
+
+    def apply(self, config):
+        """
+        Install a configuration built by `NCtrl.configure`.
+
+        Only references are swapped, so this is cheap enough for the BMI loop.
+        A configuration without a binner keeps the current one for the views.
+        """
+        self.mode = config['mode']
+        self.dec = config['dec']
+        if config['binner'] is not None:
+            self.binner = config['binner']
+
+    def set_snapshot(self, writer, interval=1.0, resume_state=None):
+        """
+        Set periodic state snapshots and the state to resume from at the first spike.
+
+        Args:
+            writer (SnapshotWriter): Destination of the snapshots, None disables them.
+            interval (float, optional): Seconds of FPGA time between snapshots. Defaults to 1.0.
+            resume_state (dict, optional): State from `get_state` to load before the first spike.
+        """
+        self.snapshot = writer
+        self.snapshot_interval = interval
+        self.resume_state = resume_state
+
+    def set_schedule(self, schedule):
+        """
+        Set the protocol epochs run by the BMI loop.
+
+        Args:
+            schedule (list of dict): Configurations from `NCtrl.configure`, each
+                with 'name', 'duration' (s) and 'laser' settings. Empty for no protocol.
+        """
+        self.schedule = schedule
+        self.epoch_gauge.set(-1)
+
+    def make_binner(self, bin_size, B_bins, id=None, name='binner', sketch=False):
         N_units = self.fpga.n_units + 1 # The unit #0, no matter from which group, is always noise
-        self.binner = FastBinner(bin_size, N_units, B_bins, id)
+        # the sketch replays the threshold rule on every bin so the GUI can recommend a spike count;
+        # only single-unit threshold decoders get one, it costs ~15 us per bin
+        sketch = SpikeCountSketch(1 if id is not None else N_units, B_bins) if sketch else None
         logger.info(
-            f'BMI binner: {B_bins} bins ' + 
+            f'BMI {name.replace("_", " ")}: {B_bins} bins ' +
             (f'{N_units} units, each bin is {bin_size} seconds' if id is None else f'for unit {id}')
         )
-    
-    def set_fr_binner(self, bin_size=5, B_bins=360, id=None):
-        n_units = self.fpga.n_units + 1
-        self.fr_binner = FastBinner(bin_size, n_units, B_bins, id)
-        logger.info(
-            f'BMI fr binner: {B_bins} bins ' + 
-            (f'{n_units} units, each bin is {bin_size} seconds' if id is None else f'for unit {id}')
-        )
\ No newline at end of file
+        return FastBinner(bin_size, N_units, B_bins, id, name=name, sketch=sketch)
+
+    def set_binner(self, bin_size, B_bins, id=None):
+        self.binner = self.make_binner(bin_size, B_bins, id)
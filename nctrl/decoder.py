@@ -1,30 +1,149 @@
+import math
 import numpy as np
 import logging
 logger = logging.getLogger(__name__)
-log_format = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(log_format))
-logger.addHandler(console_handler)
 
 from spiketag.analysis import Decoder
 
 from .utils import CircularBuffer
+from .log import LogSampler
+
+
+def window_sum(counts, B_bins):
+    """
+    Spike count of each B_bins window ending at each bin, as FastBinner emits it.
+
+    The binner starts empty, so the first windows are zero-padded.
+    """
+    csum = np.cumsum(counts, axis=0, dtype=np.int64)
+    csum[B_bins:] -= csum[:-B_bins].copy()
+    return csum
+
+
+def _unit_counts(counts, unit_id):
+    """(T,) counts of one unit from (T,) counts or a (T, N) binned matrix."""
+    counts = np.asarray(counts)
+    return counts[:, unit_id] if counts.ndim == 2 else counts
+
+
+def _chunk_window_sum(decoder, counts, B_bins, unit_id):
+    """
+    window_sum of the unit_id column(s) for a predict_batch call.
+
+    The windows continue over the last B_bins - 1 bins of the decoder's
+    previous call, so a session fed in chunks gives the same sums as one
+    call. Before the first call, or when B_bins or the number of columns
+    changed, they are zero-padded like a fresh binner.
+    """
+    counts = np.asarray(counts)
+    tail = getattr(decoder, '_batch_tail', None)
+    if tail is None or tail.shape != (B_bins - 1,) + counts.shape[1:]:
+        tail = np.zeros((B_bins - 1,) + counts.shape[1:], dtype=counts.dtype)
+    counts = np.concatenate((tail, counts))
+    decoder._batch_tail = counts[len(counts) - (B_bins - 1):].copy()
+    return window_sum(_unit_counts(counts, unit_id), B_bins)[B_bins - 1:]
+
+
+def _trigger_runs(met, B_bins, is_active, active_count):
+    """
+    Vectorized onset/repeat rule of FrThreshold.predict along axis 0.
+
+    A trigger fires at the first bin of every run of bins meeting the
+    threshold and then every B_bins bins while the run lasts. A run already
+    active before the first bin continues from `active_count`.
+
+    Returns
+    -------
+    fired : ndarray
+        Boolean triggers, same shape as met.
+    is_active, active_count : ndarray
+        State after the last bin.
+    """
+    met = np.asarray(met, dtype=bool)
+    if not len(met):
+        return met, is_active, active_count
+    idx = np.arange(len(met)).reshape((-1,) + (1,) * (met.ndim - 1))
+    prev = np.concatenate((np.broadcast_to(is_active, met.shape[1:])[None], met[:-1]))
+    run_start = np.where(met & ~prev, idx, np.iinfo(np.int64).min)
+    # a continuing run started active_count + 1 bins before the first one
+    run_start[0] = np.where(met[0] & prev[0], -(np.asarray(active_count) + 1), run_start[0])
+    position = idx - np.maximum.accumulate(run_start, axis=0)
+    fired = met & (position % B_bins == 0)
+    return fired, met[-1].copy(), np.where(met[-1], position[-1] % B_bins, 0)
+
+
+def _fire_count(history, threshold, B_bins):
+    """Laser onsets of each row: ceil(block / B_bins) summed over blocks of history >= threshold."""
+    mask = np.zeros((len(history), history.shape[1] + 2), dtype=bool)
+    np.greater_equal(history, threshold[:, None], out=mask[:, 1:-1])
+    # rows are zero-padded, so in the flattened mask edges alternate block start, block end
+    flat = mask.reshape(-1)
+    edges = np.flatnonzero(flat[1:] != flat[:-1])
+    start, end = edges[::2], edges[1::2]
+    return np.bincount(start // mask.shape[1], (end - start + B_bins - 1) // B_bins, minlength=len(history))
+
+
+def search_thresholds(history, n_fire, B_bins, is_up, chunk_size=256):
+    """
+    DynamicFrThreshold.set_nspike for every row of `history` at once.
+
+    Parameters
+    ----------
+    history : ndarray
+        (M, B2_bins) windowed spike counts, one monitoring window per row
+        (e.g. a sliding window view over a whole session).
+    n_fire : int
+        Laser onsets wanted per monitoring window.
+    B_bins : int
+        Bins between repeated triggers.
+    is_up : bool
+        Conditioning direction.
+    chunk_size : int
+        Rows searched together, bounding the temporary memory.
+
+    Returns
+    -------
+    ndarray
+        (M,) thresholds, equal to the sequential binary search.
+    """
+    sign = 1 if is_up else -1
+    min_fire = max(n_fire, 1)  # a threshold without any block never counts as reached
+    nspike = np.empty(len(history), dtype=np.int64)
+    for start in range(0, len(history), chunk_size):
+        h = np.asarray(history[start:start + chunk_size], dtype=np.int32)
+        left, right = h.min(axis=1).astype(np.int64), h.max(axis=1).astype(np.int64) + 1
+        h *= sign
+        rows = np.flatnonzero(left < right)
+        while len(rows):
+            threshold = (left[rows] + right[rows]) // 2
+            reached = _fire_count(h[rows], threshold * sign, B_bins) >= min_fire
+            go_up = reached == is_up
+            left[rows] = np.where(go_up, threshold + 1, left[rows])
+            right[rows] = np.where(go_up, right[rows], threshold)
+            rows = rows[left[rows] < right[rows]]
+        nspike[start:start + chunk_size] = left - 1 if is_up else left
+    return nspike
 
 class FrThreshold(Decoder):
+    state_attrs = ('is_active', 'active_count', 'nspike')  # see nctrl.snapshot
+
     def __init__(self, t_window=0.001, unit_id=0, nspike=1e6):
         super().__init__(t_window)
         self.unit_id = unit_id
         self.nspike = nspike
         self.is_active = False
         self.active_count = 0
+        self.B_bins_ = 10  # binner window, only used by predict_batch; predict takes it from X
 
-    def fit(self, unit_id=None, nspike=None):
+    def fit(self, unit_id=None, nspike=None, B_bins=None):
         if unit_id is not None:
             logger.info(f'Setting unit_id to {unit_id}')
             self.unit_id = unit_id
         if nspike is not None:
             logger.info(f'Setting nspike to {nspike}')
             self.nspike = nspike
+        if B_bins is not None:
+            self.B_bins_ = B_bins
 
     def predict(self, X):
         # X is output from Binner
@@ -47,7 +166,33 @@ class FrThreshold(Decoder):
         
         return 0
 
+    def predict_batch(self, counts, B_bins=None):
+        """
+        Decisions for a whole session, equal to calling predict bin by bin.
+
+        Parameters
+        ----------
+        counts : ndarray
+            (T,) spike counts per bin of the unit, or a (T, N) binned matrix
+            of all units (column unit_id is used).
+        B_bins : int, optional
+            Binner window in bins; defaults to the fitted B_bins.
+
+        Returns
+        -------
+        ndarray
+            (T,) int8 decisions. The decoder state and the binner windows
+            continue from the previous call, so a session can be fed in chunks.
+        """
+        B_bins = B_bins or self.B_bins_
+        met = _chunk_window_sum(self, counts, B_bins, self.unit_id) >= self.nspike
+        fired, self.is_active, self.active_count = _trigger_runs(met, B_bins, self.is_active, self.active_count)
+        self.is_active, self.active_count = bool(self.is_active), int(self.active_count)
+        return fired.astype(np.int8)
+
 class DynamicFrThreshold(FrThreshold):
+    state_attrs = ('is_active', 'active_count', 'nspike', 'buffer')  # see nctrl.snapshot
+
     def __init__(self, t_window=0.001, unit_id=0, nspike=1e6):
         super().__init__(t_window, unit_id, nspike)
         self.direction = 'up'
@@ -154,18 +299,448 @@ class DynamicFrThreshold(FrThreshold):
 
         return 0
 
+    def predict_batch(self, counts, B_bins=None):
+        """
+        Decisions for a whole session, equal to calling predict bin by bin.
+
+        The threshold search of every bin runs over all monitoring windows at
+        once (see `search_thresholds`) instead of one binary search per call.
+
+        Parameters
+        ----------
+        counts : ndarray
+            (T,) spike counts per bin of the unit, or a (T, N) binned matrix
+            of all units (column unit_id is used).
+        B_bins : int, optional
+            Binner window in bins; defaults to the fitted B_bins.
+
+        Returns
+        -------
+        ndarray
+            (T,) int8 decisions. The decoder state (history, threshold,
+            trigger state) and the binner windows continue from the previous
+            call, so a session can be fed in chunks.
+        """
+        sums = _chunk_window_sum(self, counts, B_bins or self.B_bins_, self.unit_id)
+        fired = np.zeros(len(sums), dtype=np.int8)
+        n_warmup, history = _monitor_history(self.buffer, sums)
+        if len(sums) > n_warmup:
+            nspike = search_thresholds(history, self.n_fire, self.B_bins_, self.direction == 'up')
+            count = sums[n_warmup:]
+            met = count >= nspike if self.direction == 'up' else count <= nspike
+            fired[n_warmup:], is_active, active_count = _trigger_runs(met, self.B_bins_, self.is_active,
+                                                                      self.active_count)
+            self.is_active, self.active_count, self.nspike = bool(is_active), int(active_count), int(nspike[-1])
+        return fired
+
+
+def _monitor_history(buffer, sums):
+    """
+    Monitoring windows a DynamicFrThreshold buffer would see for new window sums.
+
+    Advances `buffer` as the sequential calls would.
+
+    Returns
+    -------
+    n_warmup : int
+        Leading bins answered with 0 while the buffer fills up.
+    history : ndarray
+        Sliding (T - n_warmup, B2_bins) view, or (T - n_warmup, N, B2_bins)
+        for a multi-unit buffer: the window of each later bin.
+    """
+    length = buffer.length
+    if not len(sums):
+        return 0, np.zeros((0,) + buffer.buffer.shape[1:] + (length,), dtype=buffer.buffer.dtype)
+    n_warmup = 0 if buffer.ready else length - buffer.counter
+    # the buffer's oldest length - 1 entries plus the new sums, as the buffer stores them
+    values = np.concatenate((buffer()[:-1], sums.astype(buffer.buffer.dtype)))
+    history = np.lib.stride_tricks.sliding_window_view(values, length, axis=0)[n_warmup:len(sums)]
+    buffer.buffer[:-1] = values[len(values) - (length - 1):]
+    buffer.buffer[-1] = 0
+    buffer.index = length - 1
+    if not buffer.ready:
+        buffer.counter = min(buffer.counter + len(sums), length)
+        buffer.ready = buffer.counter >= length
+    return min(n_warmup, len(sums)), history
+
+
+class RateController(FrThreshold):
+    """
+    Threshold decoder that tracks target_fr with a PI controller.
+
+    Keeps exponentially weighted estimates (time constant tau) of the laser
+    rate and of the unit's windowed spike count, and adjusts the threshold each
+    bin by a PI law in velocity form. Each bin costs O(1), and the threshold
+    reacts within tau instead of the whole B2_bins monitoring window of
+    DynamicFrThreshold.
+
+    The threshold step is scaled by the standard deviation of the windowed
+    count, so the gains do not depend on the unit's firing rate. With
+    lookahead > 0 the threshold is tested on the count extrapolated by its
+    recent trend, so triggers fire up to lookahead bins earlier on rising
+    (or, for direction='down', falling) activity.
+    """
+    state_attrs = ('is_active', 'active_count', 'nspike', 'laser_rate', 'count_mean', 'count_var', 'slope',
+                   'last_count', 'error')  # see nctrl.snapshot
+
+    def __init__(self, t_window=0.001, unit_id=0, nspike=1e6):
+        super().__init__(t_window, unit_id, nspike)
+        self.direction = 'up'
+        self.target_fr = 100
+        self.bin_size = 0.1
+        self.B_bins_ = 10
+        self.tau = 20.0
+        self.kp = 0.5
+        self.ki = 2.0
+        self.lookahead = 0
+
+    def fit(self, unit_id=None, target_fr=None, bin_size=None, B_bins=None, tau=None, kp=None, ki=None,
+            lookahead=None, direction='up'):
+        if unit_id is not None:
+            self.unit_id = unit_id
+        if target_fr is not None:
+            self.target_fr = target_fr
+        if bin_size is not None:
+            self.bin_size = bin_size
+        if B_bins is not None: # duration for laser execution
+            self.B_bins_ = B_bins
+        if tau is not None: # time constant of the rate estimates (s)
+            self.tau = tau
+        if kp is not None:
+            self.kp = kp
+        if ki is not None:
+            self.ki = ki
+        if lookahead is not None:
+            self.lookahead = lookahead
+        if direction is not None:
+            if direction == 'up' or direction == 'down':
+                self.direction = direction
+            else:
+                raise ValueError(f"Invalid direction: {direction}. Must be 'up' or 'down'.")
+
+        self.sign = 1 if self.direction == 'up' else -1
+        self.alpha = 1 - np.exp(-self.bin_size / self.tau)
+        self.laser_rate = float(self.target_fr)
+        self.count_mean = None
+        self.count_var = 0.0
+        self.slope = 0.0
+        self.last_count = 0
+        self.error = 0.0
+        self.nspike = None
+        self.is_active = False
+        self.active_count = 0
+        logger.info(f'Rate controller: unit {self.unit_id}, target {self.target_fr} Hz, tau {self.tau} s')
+
+    def update_threshold(self, fired):
+        """One PI step on the relative laser rate error."""
+        self.laser_rate += self.alpha * (fired / self.bin_size - self.laser_rate)
+        error = (self.laser_rate - self.target_fr) / max(self.target_fr, 1e-6)
+        scale = max(np.sqrt(self.count_var), 1.0)
+        step = scale * (self.kp * (error - self.error) + self.ki * error * self.alpha)
+        self.error = error
+        self.nspike = max(self.nspike + self.sign * step, 0.0)
+
+    def predict(self, X):
+        unit_spike_count = X.sum()
+
+        # exponentially weighted mean, variance and trend of the windowed count
+        if self.count_mean is None:
+            self.count_mean = float(unit_spike_count)
+            self.last_count = unit_spike_count
+            self.nspike = self.count_mean + self.sign
+        diff = unit_spike_count - self.count_mean
+        self.count_mean += self.alpha * diff
+        self.count_var = (1 - self.alpha) * (self.count_var + self.alpha * diff * diff)
+        self.slope += self.alpha * ((unit_spike_count - self.last_count) - self.slope)
+        self.last_count = unit_spike_count
+
+        count = unit_spike_count + self.lookahead * self.slope
+        threshold_met = count >= self.nspike if self.direction == 'up' else count <= self.nspike
+
+        fired = 0
+        if threshold_met:
+            if not self.is_active:
+                self.is_active = True
+                self.active_count = 0
+                fired = 1
+            else:
+                self.active_count += 1
+                if self.active_count >= self.B_bins_:
+                    self.active_count = 0
+                    fired = 1
+        else:
+            self.is_active = False
+            self.active_count = 0
+
+        self.update_threshold(fired)
+        return fired
+
+    def predict_batch(self, counts, B_bins=None):
+        """
+        Decisions for a whole session, equal to calling predict bin by bin.
+
+        The PI recursion is inherently sequential, so this runs the same
+        arithmetic on Python floats over precomputed window sums, without
+        the per-bin array overhead of predict.
+
+        Parameters
+        ----------
+        counts : ndarray
+            (T,) spike counts per bin of the unit, or a (T, N) binned matrix
+            of all units (column unit_id is used).
+        B_bins : int, optional
+            Binner window in bins; defaults to the fitted B_bins.
+
+        Returns
+        -------
+        ndarray
+            (T,) int8 decisions. The decoder state and the binner windows
+            continue from the previous call, so a session can be fed in chunks.
+        """
+        sums = _chunk_window_sum(self, counts, B_bins or self.B_bins_, self.unit_id).tolist()
+        fired = np.zeros(len(sums), dtype=np.int8)
+        alpha, sign, lookahead, up = self.alpha, self.sign, self.lookahead, self.direction == 'up'
+        B, bin_size, target_fr = self.B_bins_, self.bin_size, self.target_fr
+        kp, ki, target_norm = self.kp, self.ki, max(self.target_fr, 1e-6)
+        count_mean, count_var, slope, last_count = self.count_mean, self.count_var, self.slope, self.last_count
+        laser_rate, error, nspike = self.laser_rate, self.error, self.nspike
+        is_active, active_count = self.is_active, self.active_count
+        for i, count in enumerate(sums):
+            if count_mean is None:
+                count_mean = float(count)
+                last_count = count
+                nspike = count_mean + sign
+            diff = count - count_mean
+            count_mean += alpha * diff
+            count_var = (1 - alpha) * (count_var + alpha * diff * diff)
+            slope += alpha * ((count - last_count) - slope)
+            last_count = count
+
+            value = count + lookahead * slope
+            y = 0
+            if (value >= nspike) if up else (value <= nspike):
+                if not is_active:
+                    is_active = True
+                    active_count = 0
+                    y = 1
+                else:
+                    active_count += 1
+                    if active_count >= B:
+                        active_count = 0
+                        y = 1
+            else:
+                is_active = False
+                active_count = 0
+            fired[i] = y
+
+            laser_rate += alpha * (y / bin_size - laser_rate)
+            e = (laser_rate - target_fr) / target_norm
+            step = max(math.sqrt(count_var), 1.0) * (kp * (e - error) + ki * e * alpha)
+            error = e
+            nspike = max(nspike + sign * step, 0.0)
+
+        self.count_mean, self.count_var, self.slope, self.last_count = count_mean, count_var, slope, last_count
+        self.laser_rate, self.error, self.nspike = laser_rate, error, nspike
+        self.is_active, self.active_count = is_active, active_count
+        return fired
+
+
+class MultiDynamicFrThreshold(Decoder):
+    """
+    Vectorized DynamicFrThreshold for several units at once.
+
+    Keeps one (B2_bins, N) history of windowed spike counts and re-solves all N
+    thresholds per bin with a single array-wide binary search, so conditioning
+    N units costs one Python call per bin instead of N.
+
+    Each unit has its own target laser rate and direction. predict returns the
+    TTL mask of the first 16 units (bit i for unit_ids[i]); the full per-unit
+    trigger vector is kept in `trigger`.
+    """
+    state_attrs = ('active', 'active_count', 'nspikes', 'trigger', 'buffer')  # see nctrl.snapshot
+
+    def __init__(self, t_window=0.001, unit_ids=None):
+        super().__init__(t_window)
+        self.unit_ids = np.asarray(unit_ids if unit_ids is not None else [], dtype=int)
+        self.target_fr = 100
+        self.direction = 'up'
+        self.bin_size = 0.1
+        self.B_bins_ = 10
+        self.B2_bins = 100
+
+    def fit(self, unit_ids=None, target_fr=None, bin_size=None, B_bins=None, B2_bins=None, direction='up'):
+        if unit_ids is not None:
+            self.unit_ids = np.asarray(unit_ids, dtype=int)
+        if target_fr is not None:
+            self.target_fr = target_fr
+        if bin_size is not None:
+            self.bin_size = bin_size
+        if B_bins is not None: # duration for laser execution
+            self.B_bins_ = B_bins
+        if B2_bins is not None: # duration for monitoring
+            self.B2_bins = B2_bins
+        if direction is not None:
+            self.direction = direction
+
+        n_unit = len(self.unit_ids)
+        directions = np.broadcast_to(np.asarray(self.direction), n_unit)
+        if not np.all(np.isin(directions, ['up', 'down'])):
+            raise ValueError(f"Invalid direction: {self.direction}. Must be 'up' or 'down'.")
+        self.is_up = directions == 'up'
+        self.sign = np.where(self.is_up, 1, -1).astype(np.int16)
+
+        target_fr = np.broadcast_to(np.asarray(self.target_fr, dtype=float), n_unit)
+        self.n_fire = (target_fr * self.bin_size * self.B2_bins).astype(int)
+        # a threshold is "reached" when it yields at least n_fire (and at least one) laser onsets
+        self._min_fire = np.maximum(self.n_fire, 1)
+
+        self.buffer = CircularBuffer((self.B2_bins, n_unit))
+        # signed history, one contiguous row per unit, so the row-wise reductions and comparisons are fast
+        self._history = np.empty((n_unit, self.B2_bins), dtype=self.buffer.buffer.dtype)
+        # zero-padded per-unit rows so threshold blocks never span two units
+        self._mask = np.zeros((n_unit, self.B2_bins + 2), dtype=bool)
+        self.nspikes = np.zeros(n_unit, dtype=int)
+        self.active = np.zeros(n_unit, dtype=bool)
+        self.active_count = np.zeros(n_unit, dtype=int)
+        self.trigger = np.zeros(n_unit, dtype=bool)
+        self.bits = (1 << np.arange(min(n_unit, 16))).astype(np.uint16)
+        logger.info(f'Setting unit_ids to {self.unit_ids.tolist()}, target_fr to {target_fr.tolist()}')
+
+    def fire_count(self, history, threshold):
+        """
+        Count laser onsets per unit for the given thresholds.
+
+        Each contiguous block of bins beyond threshold fires every B_bins bins,
+        i.e. ceil(block_length / B_bins) times, as in DynamicFrThreshold.
+        history and threshold are multiplied by the unit's sign, so "beyond
+        threshold" is always history >= threshold. history may hold only the
+        rows of the units still searching.
+        """
+        mask = self._mask[:len(history)]
+        np.greater_equal(history, threshold.astype(history.dtype)[:, None], out=mask[:, 1:-1])
+        flat = mask.reshape(-1)
+        edges = np.not_equal(flat[1:], flat[:-1]).nonzero()[0]
+        block_start, block_end = edges[::2], edges[1::2]
+        fire_count = (block_end - block_start + self.B_bins_ - 1) // self.B_bins_
+        # rows are zero-padded, so each block lies within the row of its unit
+        return np.bincount(block_start // mask.shape[1], fire_count, len(history))
+
+    def set_nspike(self):
+        """Binary search the thresholds of all units at once (see DynamicFrThreshold.set_nspike)."""
+        # 'down' units compare -count >= -threshold
+        history = np.multiply(self.buffer().T, self.sign[:, None], out=self._history)
+        low, high = history.min(axis=1).astype(int), history.max(axis=1).astype(int)
+        left = np.where(self.is_up, low, -high)
+        right = np.where(self.is_up, high, -low) + 1
+
+        # converged units drop out, so late iterations only scan the units with a wide count range
+        rows = np.flatnonzero(left < right)
+        while len(rows):
+            threshold = (left[rows] + right[rows]) // 2
+            reached = self.fire_count(history[rows], threshold * self.sign[rows]) >= self._min_fire[rows]
+            go_up = reached == self.is_up[rows]
+            left[rows] = np.where(go_up, threshold + 1, left[rows])
+            right[rows] = np.where(go_up, right[rows], threshold)
+            rows = rows[left[rows] < right[rows]]
+
+        self.nspikes = np.where(self.is_up, left - 1, left)
+
+    def predict(self, X):
+        unit_spike_count = X.sum(axis=0)[self.unit_ids]
+        self.buffer[-1] = unit_spike_count
+
+        if not self.buffer.ready:
+            self.buffer.step()
+            return np.uint16(0)
+
+        self.set_nspike()
+        self.buffer.step()
+
+        threshold_met = (unit_spike_count - self.nspikes) * self.sign >= 0
+        onset = threshold_met & ~self.active
+        self.active_count = np.where(threshold_met & self.active, self.active_count + 1, 0)
+        repeat = self.active_count >= self.B_bins_
+        self.active_count[repeat] = 0
+        self.active = threshold_met
+        self.trigger = onset | repeat
+
+        return np.uint16(self.bits[self.trigger[:16]].sum())
+
+    def predict_batch(self, counts, B_bins=None):
+        """
+        TTL masks for a whole session, equal to calling predict bin by bin.
+
+        Parameters
+        ----------
+        counts : ndarray
+            (T, N) binned spike counts of all units.
+        B_bins : int, optional
+            Binner window in bins; defaults to the fitted B_bins.
+
+        Returns
+        -------
+        ndarray
+            (T,) uint16 masks. The decoder state and the binner windows continue
+            from the previous call; `trigger` holds the per-unit triggers of the last bin.
+        """
+        sums = _chunk_window_sum(self, counts, B_bins or self.B_bins_, self.unit_ids)
+        masks = np.zeros(len(sums), dtype=np.uint16)
+        n_warmup, history = _monitor_history(self.buffer, sums)
+        if len(sums) > n_warmup:
+            nspikes = np.stack([search_thresholds(history[:, i], self.n_fire[i], self.B_bins_, self.is_up[i])
+                                for i in range(len(self.unit_ids))], axis=1)
+            met = (sums[n_warmup:] - nspikes) * self.sign >= 0
+            fired, self.active, self.active_count = _trigger_runs(met, self.B_bins_, self.active, self.active_count)
+            masks[n_warmup:] = (fired[:, :16] * self.bits).sum(axis=1)
+            self.nspikes, self.trigger = nspikes[-1], fired[-1]
+        return masks
+
 
 class Spikes(Decoder):
+    """
+    A multi-channel decoder that emits a 16-bit output mask per bin.
+
+    Bit i of the mask is set when unit_ids[i] fired in the latest bin, so up to
+    16 units drive 16 TTL lines. The mask is returned as np.uint16, which the
+    output device sends as a single port write.
+    """
     def __init__(self, t_window=0.001, unit_ids=None):
         super().__init__(t_window)
-        self.unit_ids = unit_ids if unit_ids is not None else []
+        self.fit(unit_ids if unit_ids is not None else [])
 
-    def fit(self, unit_ids):
+    def fit(self, unit_ids=None):
+        if unit_ids is None:
+            return
         # output up to 16 channels
-        self.unit_ids = unit_ids[:16] if len(unit_ids) > 16 else unit_ids
-    
+        if len(unit_ids) > 16:
+            logger.warning(f'Spikes decoder supports up to 16 channels, ignoring units {list(unit_ids[16:])}')
+        self.unit_ids = np.asarray(unit_ids[:16], dtype=int)
+        self.bits = (1 << np.arange(len(self.unit_ids))).astype(np.uint16)
+        logger.info(f'Setting unit_ids to {self.unit_ids.tolist()}')
+
     def predict(self, X):
-        return X[-1, self.unit_ids] > 0 if self.unit_ids else 0
+        if not len(self.unit_ids):
+            return np.uint16(0)
+        return np.uint16(self.bits[X[-1, self.unit_ids] > 0].sum())
+
+    def predict_batch(self, counts):
+        """
+        TTL masks for a whole session: bit i set where unit_ids[i] fired in the bin.
+
+        Parameters
+        ----------
+        counts : ndarray
+            (T, N) binned spike counts of all units.
+
+        Returns
+        -------
+        ndarray
+            (T,) uint16 masks, equal to calling predict bin by bin.
+        """
+        counts = np.asarray(counts)
+        if not len(self.unit_ids):
+            return np.zeros(len(counts), dtype=np.uint16)
+        return ((counts[:, self.unit_ids] > 0) * self.bits).sum(axis=1).astype(np.uint16)
 
 
 class SingleSpike(Decoder):
@@ -182,17 +757,35 @@ class SingleSpike(Decoder):
         if X.spk_id == self.unit_id:
             return 1
 
+    def predict_batch(self, spk_id):
+        """
+        Decisions for a spike train: 1 for every spike of unit_id.
+
+        Parameters
+        ----------
+        spk_id : ndarray
+            Unit ID of each spike, e.g. the spike_id column of a session.
+
+        Returns
+        -------
+        ndarray
+            int8 decisions per spike (predict returns None instead of 0).
+        """
+        return (np.asarray(spk_id) == self.unit_id).astype(np.int8)
+
 
 class Print(Decoder):
     """
-    A decoder that prints the input every 100 calls.
+    A decoder that logs the input every 100 calls, at most once per second.
 
     This decoder is primarily used for debugging and monitoring purposes.
-    It prints the input X every 100 calls to the predict method.
+    Sampling happens before the message is built, so suppressed calls cost
+    only a counter increment and a clock read.
     """
     def __init__(self, t_window=0.001):
         super().__init__(t_window)
         self.count = 0
+        self.sampler = LogSampler(interval=1.0, every=100)
 
     def fit(self):
         pass
@@ -200,6 +793,23 @@ class Print(Decoder):
     def predict(self, X):
         if X.spk_id:
             self.count += 1
-            if self.count % 100 == 0:
-                timestamp_ms = X.timestamp / 25000
-                logger.info(f"\033[1m\033[32m{timestamp_ms:.2f}ms:\033[0m \033[34mGroup {X.grp_id}\033[0m \033[35mSpike {X.spk_id}\033[0m", end='\r', flush=True)
+            if self.sampler.ready():
+                logger.info('spike', extra={'fields': {
+                    'timestamp_s': f'{X.timestamp / 25000:.3f}',
+                    'group': X.grp_id,
+                    'spike': X.spk_id,
+                    'count': self.count,
+                    'suppressed': self.sampler.reset(),
+                }})
+
+
+# decoder key -> (class, BMI mode)
+DECODERS = {
+    'fr': (FrThreshold, 'binner'),
+    'single': (SingleSpike, 'spike'),
+    'dynamic': (DynamicFrThreshold, 'binner'),
+    'multi': (MultiDynamicFrThreshold, 'binner'),
+    'rate': (RateController, 'binner'),
+    'spikes': (Spikes, 'binner'),
+    'print': (Print, 'spike'),
+}
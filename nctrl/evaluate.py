@@ -0,0 +1,171 @@
+import copy
+import time
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .decoder import DynamicFrThreshold, RateController
+
+
+def bin_spike_time(spike_time, bin_size, t_start=None, t_end=None):
+    """
+    Bin spike times (s) into counts per bin.
+
+    Parameters
+    ----------
+    spike_time : ndarray
+        Spike times in seconds.
+    bin_size : float
+        Bin size in seconds.
+    t_start, t_end : float, optional
+        Session range; defaults to the first and last spike.
+    """
+    t_start = spike_time[0] if t_start is None else t_start
+    t_end = spike_time[-1] if t_end is None else t_end
+    n_bin = int((t_end - t_start) / bin_size)
+    idx = ((spike_time - t_start) / bin_size).astype(int)
+    return np.bincount(idx[(idx >= 0) & (idx < n_bin)], minlength=n_bin)
+
+
+def run_decoder(decoder, counts, B_bins):
+    """
+    Feed a fitted decoder the same B_bins windows FastBinner would emit.
+
+    Returns
+    -------
+    trigger : ndarray
+        Decoder output per bin.
+    nspike : ndarray
+        Decoder threshold after each bin (nan while undefined).
+    cpu_ns : ndarray
+        Wall time of each predict call in ns.
+    """
+    windows = sliding_window_view(np.concatenate((np.zeros(B_bins - 1, dtype=counts.dtype), counts)), B_bins)
+    n_bin = len(counts)
+    trigger = np.zeros(n_bin, dtype=int)
+    nspike = np.full(n_bin, np.nan)
+    cpu_ns = np.zeros(n_bin, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i in range(n_bin):
+        start = clock()
+        y = decoder.predict(windows[i])
+        cpu_ns[i] = clock() - start
+        trigger[i] = y or 0
+        if decoder.nspike is not None:
+            nspike[i] = decoder.nspike
+    return trigger, nspike, cpu_ns
+
+
+def laser_rate(trigger, bin_size, window):
+    """Trigger rate (Hz) over the trailing window (s) at each bin."""
+    n = max(int(round(window / bin_size)), 1)
+    cumsum = np.concatenate(([0], np.cumsum(trigger)))
+    n_bin = len(trigger)
+    lag = np.minimum(np.arange(1, n_bin + 1), n)
+    return (cumsum[1:] - cumsum[np.arange(1, n_bin + 1) - lag]) / (lag * bin_size)
+
+
+def convergence(rate, target_fr, bin_size, tolerance=0.2, t_min=0.0):
+    """
+    Convergence time, overshoot and tracking error of a laser rate trace.
+
+    Convergence time is the first time the rate enters the band
+    target_fr * (1 +- tolerance) (inf if it never does). Overshoot is the
+    largest relative excess above the target after that, and error is the mean
+    relative deviation from the target after that. Bins before t_min (e.g. the
+    rate window warm-up) are ignored.
+    """
+    i_min = int(t_min / bin_size)
+    rate = rate[i_min:]
+    inside = np.flatnonzero(np.abs(rate - target_fr) <= tolerance * target_fr)
+    if not len(inside):
+        return np.inf, np.nan, np.nan
+    after = rate[inside[0]:]
+    t_converge = (i_min + inside[0]) * bin_size
+    overshoot = max(after.max() / target_fr - 1, 0.0)
+    error = np.mean(np.abs(after - target_fr)) / target_fr
+    return t_converge, overshoot, error
+
+
+def evaluate(decoders, counts, bin_size, B_bins, target_fr, window=60.0, tolerance=0.2, batch=True, timing=True):
+    """
+    Run fitted decoders over binned counts and compare their rate control.
+
+    Parameters
+    ----------
+    decoders : dict
+        Name -> fitted decoder (single-unit, FrThreshold-like).
+    counts : ndarray
+        Spike counts per bin of the conditioned unit.
+    bin_size : float
+        Bin size in seconds.
+    B_bins : int
+        Binner window in bins.
+    target_fr : float
+        Target laser rate in Hz.
+    window : float
+        Window (s) of the running laser rate used for convergence. The first
+        window is warm-up: convergence is only looked for after it.
+    tolerance : float
+        Relative band around target_fr counted as converged.
+    batch : bool
+        Take the decisions from the decoders' predict_batch (same decisions,
+        whole session at once).
+    timing : bool
+        Time every predict call, on a copy of the decoder when the decisions
+        come from predict_batch, so the CPU columns are the per-bin cost of
+        the live BMI. False leaves them NaN, for fast screening.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per decoder: laser rate, convergence time, overshoot, tracking
+        error and predict cost.
+    """
+    rows = []
+    for name, decoder in decoders.items():
+        batched = batch and hasattr(decoder, 'predict_batch')
+        cpu_ns = None
+        if timing:
+            trigger, _, cpu_ns = run_decoder(copy.deepcopy(decoder) if batched else decoder, counts, B_bins)
+        if batched:
+            trigger = decoder.predict_batch(counts, B_bins).astype(int)
+        elif cpu_ns is None:
+            trigger = run_decoder(decoder, counts, B_bins)[0]
+        rate = laser_rate(trigger, bin_size, window)
+        # until a full window has passed the rate is over a shorter span and swings through the band
+        t_converge, overshoot, error = convergence(rate, target_fr, bin_size, tolerance, t_min=window)
+        rows.append({
+            'decoder': name,
+            'laser_fr': trigger.sum() / (len(counts) * bin_size),
+            'converge_s': t_converge,
+            'overshoot': overshoot,
+            'error': error,
+            'cpu_mean_us': cpu_ns.mean() / 1e3 if cpu_ns is not None and len(cpu_ns) else np.nan,
+            'cpu_p99_us': np.percentile(cpu_ns, 99) / 1e3 if cpu_ns is not None and len(cpu_ns) else np.nan,
+            'cpu_total_ms': cpu_ns.sum() / 1e6 if cpu_ns is not None else np.nan,
+        })
+    return pd.DataFrame(rows).set_index('decoder')
+
+
+def evaluate_session(spike_file='./spktag/model.pd', unit_id=1, target_fr=0.2, bin_size=0.1, B_bins=10, B2_bins=600,
+                     direction='up', **controller_kwargs):
+    """
+    Compare DynamicFrThreshold and RateController on a recorded spktag session.
+
+    Extra keyword arguments are passed to RateController.fit (tau, kp, ki, lookahead).
+    """
+    from .unit import Unit
+
+    unit = Unit()
+    unit.load(spike_file)
+    counts = bin_spike_time(unit.spike_time[unit_id - 1], bin_size, unit.start_time, unit.end_time)
+
+    dynamic = DynamicFrThreshold()
+    dynamic.fit(unit_id=unit_id, target_fr=target_fr, bin_size=bin_size, B_bins=B_bins, B2_bins=B2_bins,
+                direction=direction)
+    controller = RateController()
+    controller.fit(unit_id=unit_id, target_fr=target_fr, bin_size=bin_size, B_bins=B_bins, direction=direction,
+                   **controller_kwargs)
+    return evaluate({'dynamic': dynamic, 'controller': controller}, counts, bin_size, B_bins, target_fr,
+                    window=B2_bins * bin_size)
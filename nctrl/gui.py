@@ -1,16 +1,14 @@
 import sys
+import time
 import numpy as np
 import logging
 
+from .metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
-log_format = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(log_format))
-logger.addHandler(console_handler)
 
 try:
-    # from spiketag.view import raster_view
-    from .view import FrView
+    from .view import FrView, LineView, RasterView
     from spiketag.utils import Timer
     SPIKETAG_AVAILABLE = True
 except ImportError:
@@ -46,6 +44,12 @@ class NCtrlGUI(QWidget):
         if self.view_timer:
             self.view_timer.timeout.connect(self.view_update)
             self.update_interval = 5000
+            self.raster_timer = QtCore.QTimer(self)
+            self.raster_timer.timeout.connect(self.raster_update)
+            self.raster_interval = 100
+        self.stats_timer = QtCore.QTimer(self)
+        self.stats_timer.timeout.connect(self.stats_update)
+        self.stats_prev = (time.monotonic(), REGISTRY.snapshot())
 
         # Parameters
         self.decoder = None
@@ -60,7 +64,8 @@ class NCtrlGUI(QWidget):
     def init_gui(self, t_window=10e-3, view_window=1):
         if SPIKETAG_AVAILABLE:
             self.fr_view = FrView()
-            # self.setup_raster_view(t_window, view_window)
+            self.threshold_view = LineView()
+            self.setup_raster_view(t_window, view_window)
         self.setup_ui()
 
     def setup_ui(self):
@@ -83,6 +88,12 @@ class NCtrlGUI(QWidget):
         self.stream_btn.toggled.connect(self.stream_toggle)
         self.stream_btn.setMinimumSize(100, 50)
 
+        # initialization progress; BMI controls unlock once NCtrl is ready
+        self.init_label = QLabel()
+        if self.nctrl:
+            self.bmi_btn.setEnabled(False)
+            self.stream_btn.setEnabled(False)
+
         self.layout_start = QHBoxLayout()
         self.layout_start.addWidget(self.bmi_btn)
         self.layout_start.addWidget(self.stream_btn)
@@ -91,17 +102,26 @@ class NCtrlGUI(QWidget):
         self.decoder_fr_btn = QRadioButton("FR")
         self.decoder_single_btn = QRadioButton("Single Spike")
         self.decoder_dynamic_btn = QRadioButton("Dynamic FR")
+        self.decoder_multi_btn = QRadioButton("Multi Dynamic FR")
+        self.decoder_rate_btn = QRadioButton("Rate PID")
+        self.decoder_spikes_btn = QRadioButton("Spikes")
         self.decoder_print_btn = QRadioButton("Print")
 
         self.decoder_fr_btn.toggled.connect(self.decoder_changed)
         self.decoder_single_btn.toggled.connect(self.decoder_changed)
         self.decoder_dynamic_btn.toggled.connect(self.decoder_changed)
+        self.decoder_multi_btn.toggled.connect(self.decoder_changed)
+        self.decoder_rate_btn.toggled.connect(self.decoder_changed)
+        self.decoder_spikes_btn.toggled.connect(self.decoder_changed)
         self.decoder_print_btn.toggled.connect(self.decoder_changed)
         
         self.layout_decoder = QHBoxLayout()
         self.layout_decoder.addWidget(self.decoder_fr_btn)
         self.layout_decoder.addWidget(self.decoder_single_btn)
         self.layout_decoder.addWidget(self.decoder_dynamic_btn)
+        self.layout_decoder.addWidget(self.decoder_multi_btn)
+        self.layout_decoder.addWidget(self.decoder_rate_btn)
+        self.layout_decoder.addWidget(self.decoder_spikes_btn)
         self.layout_decoder.addWidget(self.decoder_print_btn)
 
         # decoder settings
@@ -124,12 +144,24 @@ class NCtrlGUI(QWidget):
         self.layout_laser.addRow("Laser duration (ms)", self.laser_duration_btn)
         self.layout_laser.addRow("Laser latency (ms)", self.laser_latency_btn)
 
+        # stats panel, fed from the metrics registry
+        self.stats_label = QLabel()
+        self.stats_label.setToolTip("Live counters from the metrics registry")
+        self.stats_timer.start(1000)
+
+        # threshold recommendation, fed from the binner's spike count sketch
+        self.sketch_label = QLabel("Recommended spike count: -")
+        self.sketch_label.setToolTip("Expected trigger rate of each spike count threshold over recent bins")
+
         # main layout
         layout_btn = QGridLayout()
         layout_btn.addLayout(self.layout_start, 0, 0)
         layout_btn.addLayout(self.layout_decoder, 1, 0)
         layout_btn.addLayout(self.layout_setting, 2, 0)
         layout_btn.addLayout(self.layout_laser, 3, 0)
+        layout_btn.addWidget(self.stats_label, 4, 0)
+        layout_btn.addWidget(self.sketch_label, 5, 0)
+        layout_btn.addWidget(self.init_label, 6, 0)
         layout_btn.setVerticalSpacing(10)
 
         layout_left = QVBoxLayout()
@@ -139,8 +171,9 @@ class NCtrlGUI(QWidget):
         
         layout_right = QVBoxLayout()
         if SPIKETAG_AVAILABLE:
-            # layout_right.addWidget(self.raster_view.native)
+            layout_right.addWidget(self.raster_view.native)
             layout_right.addWidget(self.fr_view.native)
+            layout_right.addWidget(self.threshold_view.native)
         else:
             layout_right.addWidget(QLabel("View not available (spiketag module not found)"))
         rightside = QWidget()
@@ -154,52 +187,68 @@ class NCtrlGUI(QWidget):
         layout_main.addWidget(splitter)
         self.setLayout(layout_main)
 
-    # def setup_raster_view(self, t_window, view_window):
-    #     if SPIKETAG_AVAILABLE:
-    #         n_units = self.nctrl.bmi.fpga.n_units + 1 if self.nctrl else 10
-    #         self.raster_view = raster_view(n_units=n_units, t_window=t_window, view_window=view_window)
+        if self.nctrl:
+            self.init_timer = QtCore.QTimer(self)
+            self.init_timer.timeout.connect(self.init_update)
+            self.init_timer.start(100)
+            self.init_update()
+
+    def setup_raster_view(self, t_window, view_window):
+        # reads the BMI's in-memory spike ring, so it can refresh at 10 Hz without disk I/O
+        self.raster_window = view_window
+        self.raster_view = RasterView(n_units=self.n_units() + 1, t_window=view_window)
+
+    def n_units(self):
+        return getattr(self.nctrl, 'n_units', 10) if self.nctrl else 10
+
+    def init_update(self):
+        progress = self.nctrl.init.progress()
+        self.init_label.setText('Init: ' + '  '.join(f'{name} {state}' for name, state in progress.items()))
+        if not self.nctrl.init.finished:
+            return
+
+        self.init_timer.stop()
+        errors = self.nctrl.init.errors()
+        if errors:
+            name, error = next(iter(errors.items()))
+            logger.error(f'Initialization failed in {name}: {error}')
+            self.init_label.setText(f'Initialization failed in {name}: {error}')
+            self.init_label.setStyleSheet("color: red")
+            return
+
+        logger.info(self.nctrl.startup.report())
+        self.init_label.setText(f'Ready in {self.nctrl.startup.total:.2f} s')
+        self.laser_duration_toggle()
+        self.laser_latency_toggle()
+        self.decoder_changed()  # rebuild the unit lists with the FPGA's unit count
+        if SPIKETAG_AVAILABLE:
+            self.raster_view.view.camera.set_range(x=(-self.raster_window, 0), y=(0, self.n_units() + 1))
+        self.bmi_btn.setEnabled(True)
+        self.stream_btn.setEnabled(True)
 
     def bmi_toggle(self, checked):
         if checked:
             if self.nctrl:
-                self.nctrl.output.on()
-
-                # Decoder settings
+                selected = sorted(int(item.text()) for item in self.unit_selector.selectedItems()) \
+                    if self.decoder != 'print' else []
+                params = dict(decoder=self.decoder, bin_size=self.bin_size, B_bins=self.B_bins, B2_bins=self.B2_bins)
+                if self.decoder in ('multi', 'spikes'):
+                    params['unit_ids'] = selected
+                elif selected:
+                    params['unit_id'] = selected[0]
                 if self.decoder == 'fr':
-                    unit_id = int(self.unit_selector.selectedItems()[0].text())
-                    self.nctrl.bmi.set_fr_binner(bin_size=5, B_bins=360, id=unit_id)
-                    self.nctrl.bmi.set_binner(bin_size=self.bin_size, B_bins=self.B_bins, id=unit_id)
-                    self.nctrl.set_decoder(decoder=self.decoder, unit_id=unit_id, nspike=self.nspike)
-                    logger.info(f"Fr BMI: bin size {self.bin_size} s, Bin number {self.B_bins}")
-                    logger.info(f"Unit ID: {unit_id}, threshold {self.nspike_btn.value()}")
-                    logger.info(f"Laser duration: {self.laser_duration} ms")
-
-                elif self.decoder == 'dynamic':
-                    unit_id = int(self.unit_selector.selectedItems()[0].text())
-                    target_fr = float(self.target_btn.currentText())
-                    direction = self.direction_btn.currentText()
-                    self.nctrl.bmi.set_fr_binner(bin_size=5, B_bins=360, id=unit_id)
-                    self.nctrl.bmi.set_binner(bin_size=self.bin_size, B_bins=self.B_bins, id=unit_id)
-                    self.nctrl.set_decoder(decoder=self.decoder, unit_id=unit_id, target_fr=target_fr, bin_size=self.bin_size, B_bins=self.B_bins, B2_bins=self.B2_bins, direction=direction)
-
-                    logger.info(f"Fr BMI: bin size {self.bin_size} s, Bin number (threshold) {self.B_bins}, monitor {self.B2_bins}")
-                    logger.info(f"Unit ID: {unit_id}, target FR {target_fr} Hz")
-                    logger.info(f"Laser latency: {self.laser_latency} ms")
-                    logger.info(f"Laser duration: {self.laser_duration} ms")
-
-                elif self.decoder == 'single':
-                    unit_id = int(self.unit_selector.selectedItems()[0].text())
-                    self.nctrl.set_decoder(decoder=self.decoder, unit_id=unit_id)
-                    logger.info(f"Single spike BMI: Unit ID {unit_id}")
-                    logger.info(f"Laser latency: {self.laser_latency} ms")
-                    logger.info(f"Laser duration: {self.laser_duration} ms")
-
-                elif self.decoder == 'print':
-                    self.nctrl.set_decoder(decoder=self.decoder)
-                    logger.info('Printing BMI messages')
-                
-                logger.info('Starting BMI')
-                self.nctrl.bmi.start(gui_queue=False)
+                    params['nspike'] = self.nspike_btn.value()
+                if self.decoder in ('dynamic', 'multi', 'rate'):
+                    params['target_fr'] = float(self.target_btn.currentText())
+                    params['direction'] = self.direction_btn.currentText()
+                try:
+                    self.nctrl.start_bmi(**params)
+                except ValueError as e:
+                    logger.error(f'BMI not started: {e}')
+                    self.bmi_btn.blockSignals(True)  # nothing to stop
+                    self.bmi_btn.setChecked(False)
+                    self.bmi_btn.blockSignals(False)
+                    return
             self.update_button_state(self.bmi_btn, 'BMI On', "green")
 
             for i in range(self.layout_setting.count()):
@@ -209,11 +258,9 @@ class NCtrlGUI(QWidget):
 
         else:
             if self.nctrl:
-                self.nctrl.output.off()
-                self.nctrl.bmi.stop()
+                self.nctrl.stop_bmi()
             if self.stream_btn.isChecked():
                 self.stream_btn.setChecked(False)
-            logger.info('Stopping BMI')
             self.update_button_state(self.bmi_btn, 'BMI Off', "white")
 
             for i in range(self.layout_setting.count()):
@@ -227,10 +274,12 @@ class NCtrlGUI(QWidget):
                 self.bmi_btn.setChecked(True)
             if self.view_timer:
                 self.view_timer.start(self.update_interval)
+                self.raster_timer.start(self.raster_interval)
             self.update_button_state(self.stream_btn, 'Stream On', "green")
         else:
             if self.view_timer:
                 self.view_timer.stop()
+                self.raster_timer.stop()
             self.update_button_state(self.stream_btn, 'Stream Off', "white")
     
     def update_button_state(self, button, text, color):
@@ -239,9 +288,60 @@ class NCtrlGUI(QWidget):
 
     def view_update(self):
         if self.nctrl and SPIKETAG_AVAILABLE:
-            # self.raster_view.update_fromfile(filename=self.nctrl.bmi.fetfile, n_items=8, last_N=20000)
-            self.fr_view.set_data(self.nctrl.bmi.fr_binner.output)
+            params = self.nctrl.bmi_params or {}
+            units = params.get('unit_id') if params.get('unit_id') is not None else params.get('unit_ids')
+            if units is None:
+                units = list(range(1, self.nctrl.bmi.rate_pyramid.n_units))  # all but the noise unit
+            self.fr_view.set_data(self.nctrl.bmi.rate_pyramid, units)
+
+    def raster_update(self):
+        if self.nctrl and SPIKETAG_AVAILABLE:
+            self.raster_view.set_data(self.nctrl.bmi.spike_ring.latest(t_window=self.raster_window))
     
+    def stats_update(self):
+        now, snapshot = time.monotonic(), REGISTRY.snapshot()
+        prev_time, prev = self.stats_prev
+        self.stats_prev = (now, snapshot)
+        dt = now - prev_time
+
+        def rate(name, **labels):
+            key = (name, tuple(sorted(labels.items())))
+            return (snapshot.get(key, 0) - prev.get(key, 0)) / dt if dt > 0 else 0
+
+        lag = REGISTRY.metrics.get(('nctrl_bmi_loop_lag_seconds', ()))
+        lag_ms = lag.sum / lag.value * 1e3 if lag is not None and lag.value else 0
+        errors = snapshot.get(('nctrl_output_errors_total', (('output', 'laser'),)), 0)
+        self.stats_label.setText(
+            f"Spikes {rate('nctrl_bmi_spikes_total'):.0f}/s  "
+            f"Bins {rate('nctrl_binner_bins_total', binner='binner'):.0f}/s  "
+            f"Decodes {rate('nctrl_bmi_decoder_calls_total'):.0f}/s\n"
+            f"Triggers {rate('nctrl_output_triggers_total', output='laser'):.1f}/s  "
+            f"Serial errors {errors:.0f}  Lag {lag_ms:.2f} ms"
+        )
+        self.sketch_update()
+
+    def sketch_update(self):
+        binner = getattr(getattr(self.nctrl, 'bmi', None), 'binner', None)
+        sketch = getattr(binner, 'sketch', None)
+        if sketch is None or not self.bmi_btn.isChecked() or not hasattr(self, 'target_btn') \
+                or self.decoder not in ('fr', 'dynamic', 'rate'):
+            return
+
+        selected = self.unit_selector.selectedItems()
+        i = 0 if binner.id is not None or not selected else int(selected[0].text())
+        target_fr = float(self.target_btn.currentText())
+        direction = self.direction_btn.currentText() if self.decoder != 'fr' else 'up'
+        threshold, rate = sketch.expected_rate(binner.bin_size, i, direction)
+        nspike = sketch.recommend(target_fr, binner.bin_size, i, direction)
+
+        text = f"Recommended spike count for {target_fr} Hz: " + (
+            f"{nspike} ({rate[nspike]:.2f} Hz)" if nspike is not None else "-")
+        if self.decoder == 'fr':
+            text += f"\nSpike count {self.nspike}: {rate[min(self.nspike, sketch.max_count)]:.2f} Hz expected"
+        self.sketch_label.setText(text)
+        if SPIKETAG_AVAILABLE:
+            self.threshold_view.set_data(np.column_stack((threshold, rate)))
+
     def decoder_changed(self):
         if hasattr(self, 'layout_setting'):
             while self.layout_setting.rowCount() > 0:
@@ -261,6 +361,18 @@ class NCtrlGUI(QWidget):
             self.decoder = 'dynamic'
             self.set_dynamic_layout()
             logger.info('Dynamic FR decoder selected')
+        elif self.decoder_multi_btn.isChecked():
+            self.decoder = 'multi'
+            self.set_dynamic_layout(multi=True)
+            logger.info('Multi dynamic FR decoder selected')
+        elif self.decoder_rate_btn.isChecked():
+            self.decoder = 'rate'
+            self.set_dynamic_layout()
+            logger.info('Rate PID decoder selected')
+        elif self.decoder_spikes_btn.isChecked():
+            self.decoder = 'spikes'
+            self.set_spikes_layout()
+            logger.info('Spikes decoder selected')
         elif self.decoder_print_btn.isChecked():
             self.decoder = 'print'
             self.set_print_layout()
@@ -271,7 +383,7 @@ class NCtrlGUI(QWidget):
     
     # FR decoder setting
     def set_fr_layout(self):
-        n_unit = self.nctrl.n_units if self.nctrl else 10
+        n_unit = self.n_units()
 
         self.unit_selector = QListWidget()
         self.unit_selector.setSelectionMode(QListWidget.SingleSelection)
@@ -285,6 +397,9 @@ class NCtrlGUI(QWidget):
 
         self.B_btn = QSpinBox(minimum=1, maximum=100, value=10)
         self.nspike_btn = QSpinBox(minimum=1, maximum=100, value=1)
+        self.target_btn = QComboBox()
+        self.target_btn.addItems(["0.2", "0.4", "0.6", "0.8", "1.0"])
+        self.target_btn.setToolTip("Target laser rate for the recommended spike count")
 
         self.fr_btn = QLabel("1.0 Hz")
 
@@ -301,6 +416,7 @@ class NCtrlGUI(QWidget):
         self.layout_setting.addRow("Bin count", self.B_btn)
         self.layout_setting.addRow("Spike count", self.nspike_btn)
         self.layout_setting.addRow("Fr", self.fr_btn)
+        self.layout_setting.addRow("Target laser rate (Hz)", self.target_btn)
 
     def bin_toggle(self):
         self.bin_size = float(self.bin_menu.currentText())
@@ -318,7 +434,7 @@ class NCtrlGUI(QWidget):
 
     # Single spike decoder setting
     def set_single_layout(self):
-        n_unit = self.nctrl.n_units if self.nctrl else 10
+        n_unit = self.n_units()
         self.unit_selector = QListWidget()
         self.unit_selector.setSelectionMode(QListWidget.SingleSelection)
         for i in range(1, n_unit + 1):  # Up to 16 units
@@ -327,11 +443,11 @@ class NCtrlGUI(QWidget):
         self.layout_setting.addRow("Unit ID", self.unit_selector)
 
     # Dynamic FR decoder setting
-    def set_dynamic_layout(self):
-        n_unit = self.nctrl.n_units if self.nctrl else 10
+    def set_dynamic_layout(self, multi=False):
+        n_unit = self.n_units()
 
         self.unit_selector = QListWidget()
-        self.unit_selector.setSelectionMode(QListWidget.SingleSelection)
+        self.unit_selector.setSelectionMode(QListWidget.MultiSelection if multi else QListWidget.SingleSelection)
         for i in range(1, n_unit + 1):
             self.unit_selector.addItem(f"{i}")
         self.unit_selector.setToolTip("Select a unit to generate spikes.")
@@ -372,6 +488,27 @@ class NCtrlGUI(QWidget):
         self.layout_setting.addRow("Spike count", self.nspike_btn)
         self.layout_setting.addRow("Fr", self.fr_btn)
 
+    # Spikes decoder setting
+    def set_spikes_layout(self):
+        n_unit = self.n_units()
+        self.unit_selector = QListWidget()
+        self.unit_selector.setSelectionMode(QListWidget.MultiSelection)
+        for i in range(1, n_unit + 1):
+            self.unit_selector.addItem(f"{i}")
+        self.unit_selector.setToolTip("Select up to 16 units, one per TTL channel.")
+
+        self.bin_menu = QComboBox()
+        self.bin_menu.addItems(["0.00004", "0.0004", "0.001", "0.010"])
+        self.bin_menu.currentIndexChanged.connect(self.spikes_bin_toggle)
+        self.bin_menu.setCurrentIndex(0)
+        self.spikes_bin_toggle()
+
+        self.layout_setting.addRow("Unit IDs", self.unit_selector)
+        self.layout_setting.addRow("Bin size (s)", self.bin_menu)
+
+    def spikes_bin_toggle(self):
+        self.bin_size = float(self.bin_menu.currentText())
+
     # Print decoder setting
     def set_print_layout(self):
         info_label = QLabel("Print decoder doesn't require any settings.")
@@ -381,24 +518,30 @@ class NCtrlGUI(QWidget):
     def laser_duration_toggle(self):
         self.laser_duration = int(self.laser_duration_btn.currentText())
         logger.info(f"Laser duration: {self.laser_duration} ms")
-        if self.nctrl:
+        if self.nctrl and self.nctrl.ready('output'):
             self.nctrl.output.set_duration(self.laser_duration)
 
     def laser_latency_toggle(self):
         self.laser_latency = int(self.laser_latency_btn.currentText())
         logger.info(f"Laser latency: {self.laser_latency} ms")
-        if self.nctrl:
+        if self.nctrl and self.nctrl.ready('output'):
             self.nctrl.output.set_latency(self.laser_latency)
     
     def closeEvent(self, event):
         if self.nctrl:
             self.stream_btn.setChecked(False)
             self.bmi_btn.setChecked(False)
-            self.nctrl.output.close()
-            self.nctrl.bmi.close()
+            if self.nctrl.ready('output'):
+                self.nctrl.output.close()
+            if self.nctrl.ready('bmi'):
+                self.nctrl.bmi.close()
+            if getattr(self.nctrl, 'recorder', None) is not None:
+                self.nctrl.recorder.close()
         event.accept()
 
 if __name__ == "__main__":
+    from .log import setup_logging
+    setup_logging()
     logger.info('Starting GUI')
     app = QApplication(sys.argv)
     gui = NCtrlGUI()
@@ -0,0 +1,130 @@
+import sys
+import copy
+import time
+import atexit
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatter that appends structured fields as ``key=value`` pairs.
+
+    Fields are passed with ``logger.info(msg, extra={'fields': {...}})``.
+    """
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return message
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting (timestamps, fields) to the listener thread."""
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(filename='bmi.log', level=logging.INFO, console=True):
+    """
+    Route all logging through a queue so callers never format or write synchronously.
+
+    The root logger gets a single QueueHandler; a QueueListener thread formats
+    records and writes them to `filename` (overwritten) and the console. A
+    multiprocessing queue is used because the BMI loop may run in a forked
+    process. Calling this again replaces the previous configuration.
+
+    Args:
+        filename (str, optional): Log file. Defaults to 'bmi.log'.
+        level (int, optional): Root log level. Defaults to logging.INFO.
+        console (bool, optional): Also log to stderr. Defaults to True.
+
+    Returns:
+        QueueListener: The running listener.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = StructuredFormatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(filename, mode='w')]
+    if console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = multiprocessing.Queue(-1)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class LogSampler:
+    """
+    Rate limiter for log calls on the hot path.
+
+    Checking the sampler costs one clock read, so the message is only built
+    when it will actually be logged::
+
+        if sampler.ready():
+            logger.info(...)
+
+    Args:
+        interval (float, optional): Minimum seconds between messages. Defaults to 1.0.
+        every (int, optional): Only consider every n-th call. Defaults to 1.
+
+    Attributes:
+        suppressed (int): Calls suppressed since the last message.
+    """
+    def __init__(self, interval=1.0, every=1):
+        self.interval = interval
+        self.every = every
+        self.suppressed = 0
+        self._count = 0
+        self._last = 0.0
+
+    def ready(self):
+        self._count += 1
+        if self._count % self.every == 0:
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                return True
+        self.suppressed += 1
+        return False
+
+    def reset(self):
+        """Return the number of suppressed calls and reset the counter."""
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
@@ -0,0 +1,211 @@
+import os
+import mmap
+import bisect
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRegistry:
+    """
+    Registry of counters and histograms backed by a shared memory slab.
+
+    All values live in one anonymous shared mmap of doubles, so they are
+    visible to a forked BMI process and can be read by the scraper without
+    locks. Each metric must have a single writer; 8-byte aligned loads and
+    stores are atomic, so readers always see a consistent value per slot.
+
+    Parameters
+    ----------
+    size : int
+        Number of double slots in the slab.
+    """
+    def __init__(self, size=4096):
+        self._mm = mmap.mmap(-1, size * 8)
+        self._slab = memoryview(self._mm).cast('d')
+        self._next = 0
+        self._lock = threading.Lock()  # only guards metric creation
+        self.metrics = {}
+
+    def _alloc(self, n):
+        if self._next + n > len(self._slab):
+            raise MemoryError('MetricsRegistry: slab is full')
+        start = self._next
+        self._next += n
+        return start
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            if key not in self.metrics:
+                self.metrics[key] = cls(self, name, help, dict(key[1]), **kwargs)
+            return self.metrics[key]
+
+    def counter(self, name, help='', labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help='', labels=None, buckets=None):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self):
+        """Return {(name, labels): value} for counters and gauges, and histogram counts."""
+        return {key: metric.value for key, metric in list(self.metrics.items())}
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for (name, _), metric in sorted(list(self.metrics.items()), key=lambda item: item[0]):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {metric.help}')
+                lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+class Counter:
+    """Monotonic counter stored in one registry slot."""
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._slab = registry._slab
+        self._i = registry._alloc(1)
+
+    def inc(self, n=1):
+        self._slab[self._i] += n
+
+    @property
+    def value(self):
+        return self._slab[self._i]
+
+    def render(self):
+        return [f'{self.name}{_format_labels(self.labels)} {self.value:g}']
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+    type = 'gauge'
+
+    def set(self, value):
+        self._slab[self._i] = value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram stored in registry slots.
+
+    Slots hold one count per bucket (plus +Inf), then the sum and the count.
+    """
+    type = 'histogram'
+    DEFAULT_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0)
+
+    def __init__(self, registry, name, help, labels, buckets=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = list(buckets or self.DEFAULT_BUCKETS)
+        self._slab = registry._slab
+        self._i = registry._alloc(len(self.buckets) + 3)
+        self._i_sum = self._i + len(self.buckets) + 1
+        self._i_count = self._i_sum + 1
+
+    def observe(self, value):
+        self._slab[self._i + bisect.bisect_left(self.buckets, value)] += 1
+        self._slab[self._i_sum] += value
+        self._slab[self._i_count] += 1
+
+    @property
+    def value(self):
+        return self._slab[self._i_count]
+
+    @property
+    def sum(self):
+        return self._slab[self._i_sum]
+
+    def render(self):
+        lines = []
+        cumulative = 0
+        for i, le in enumerate(self.buckets + ['+Inf']):
+            cumulative += self._slab[self._i + i]
+            labels = dict(self.labels, le=le if isinstance(le, str) else f'{le:g}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels)} {cumulative:g}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels)} {self.sum:g}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels)} {self.value:g}')
+        return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """
+    Serve a registry in the Prometheus text format from a daemon thread.
+
+    Args:
+        registry (MetricsRegistry, optional): Registry to serve. Defaults to REGISTRY.
+        port (int, optional): TCP port on `host`. Defaults to 9100.
+        host (str, optional): Bind address. Defaults to '127.0.0.1'.
+        unix_path (str, optional): Serve on this Unix socket instead of TCP.
+    """
+    def __init__(self, registry=REGISTRY, port=9100, host='127.0.0.1', unix_path=None):
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+        if unix_path is not None:
+            self.server = _UnixHTTPServer(unix_path, handler)
+            self.address = unix_path
+        else:
+            self.server = ThreadingHTTPServer((host, port), handler)
+            self.server.daemon_threads = True
+            self.address = f'http://{host}:{self.server.server_address[1]}/metrics'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f'Serving metrics on {self.address}')
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.server, _UnixHTTPServer):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
@@ -1,16 +1,287 @@
+import os
 import glob
+import mmap
 import time
+import struct
+import select
 import serial
+import socket
 import logging
+import threading
+import collections
 import numpy as np
 
+from .metrics import REGISTRY
+from .clock import ClockSync
+
 logger = logging.getLogger(__name__)
-log_format = '%(asctime)s %(name)-15s %(levelname)-8s %(message)s'
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(log_format))
-logger.addHandler(console_handler)
 
-class Laser:
+# one output event, as recorded by MemoryOutput and sent by DatagramOutput
+OUTPUT_DTYPE = np.dtype([('timestamp', '<i8'),   # FPGA timestamp of the decision, -1 if unknown
+                         ('host_time', '<f8'),   # time.monotonic() when the output was called
+                         ('kind', 'S1'),         # b't' trigger, b's' TTL mask, b'e'/b'E' on/off, b'd'/b'l' duration/latency
+                         ('value', '<i4')])      # 1 for a trigger, the mask, or the new duration/latency (ms)
+
+
+class Output:
+    """
+    Base class of the output backends, see `OUTPUTS`.
+
+    Outputs are called by the decoder with `output(y, timestamp)` on the BMI
+    loop, so `__call__` must never block: a y of 1 is a trigger, a np.uint16
+    is a TTL mask (sent only when it changes) and anything else is ignored.
+    The settings methods may block briefly and are called from the GUI or
+    the control API.
+
+    Attributes:
+        duration (int): Duration of the pulse in milliseconds.
+        latency (int): Latency of the pulse in milliseconds.
+        mask (int): Last TTL mask.
+        enabled (bool): True between `on` and `off`.
+        clock (ClockSync): FPGA -> device clock mapping, or None if the output has no clock.
+
+    Args:
+        port (str, optional): Device address, its meaning depends on the backend.
+    """
+    name = None
+
+    def __init__(self, port=None):
+        self.port = port
+        self.duration = 500
+        self.latency = 0
+        self.mask = 0
+        self.enabled = False
+        self.clock = None
+        self.triggers_total = REGISTRY.counter('nctrl_output_triggers_total', 'Triggers sent to the output', {'output': self.name})
+
+    def __call__(self, y, timestamp=None):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'{type(self).__name__}(port={self.port}, duration={self.duration})'
+
+    def on(self):
+        """Enable the output."""
+        self.enabled = True
+        logger.info(f'{type(self).__name__} on')
+
+    def off(self):
+        """Disable the output and clear the TTL mask."""
+        self.enabled = False
+        self.mask = 0
+        logger.info(f'{type(self).__name__} off')
+
+    def set_duration(self, duration):
+        """
+        Set the duration of the pulse.
+
+        Args:
+            duration (int): Duration of the pulse in milliseconds.
+
+        Raises:
+            ValueError: If duration is not a non-negative integer.
+        """
+        if not isinstance(duration, int) or duration < 0:
+            raise ValueError("Duration (ms) must be a non-negative integer")
+        self.duration = duration
+        logger.info(f'Setting duration to {duration} ms')
+
+    def set_latency(self, latency):
+        """
+        Set the latency of the pulse.
+
+        Args:
+            latency (int): Latency of the pulse in milliseconds.
+        """
+        self.latency = latency
+        logger.info(f'Setting latency to {latency} ms')
+
+    def send_settings(self, duration=None, latency=None):
+        """
+        Set the duration and/or latency without waiting for the device, for the BMI loop.
+
+        Args:
+            duration (int, optional): Duration of the pulse in milliseconds.
+            latency (int, optional): Latency of the pulse in milliseconds.
+        """
+        if duration is not None:
+            self.duration = duration
+        if latency is not None:
+            self.latency = latency
+
+    def close(self):
+        """Release the output."""
+
+
+class NullOutput(Output):
+    """
+    Output that discards everything, to run decoders without hardware.
+
+    Calls cost a single method call and are not counted, so benchmarks
+    measure the decoder alone.
+    """
+    name = 'null'
+
+    def __call__(self, y, timestamp=None):
+        pass
+
+
+class MemoryOutput(Output):
+    """
+    Output that records triggers and TTL masks in a preallocated array.
+
+    Records (OUTPUT_DTYPE) live in an anonymous shared mmap like the spike
+    ring, so the parent process can read what a forked BMI process fired.
+    Once `capacity` records are written, further ones are dropped and
+    counted rather than reallocating on the BMI loop.
+
+    Args:
+        port (str, optional): Unused.
+        capacity (int, optional): Records kept. Defaults to 1000000.
+    """
+    name = 'memory'
+
+    def __init__(self, port=None, capacity=1000000):
+        super().__init__(port)
+        self.capacity = capacity
+        self._mm = mmap.mmap(-1, 8 + capacity * OUTPUT_DTYPE.itemsize)
+        self._count = np.frombuffer(self._mm, dtype=np.int64, count=1)
+        self.buffer = np.frombuffer(self._mm, dtype=OUTPUT_DTYPE, count=capacity, offset=8)
+        self._timestamp = self.buffer['timestamp']
+        self._host_time = self.buffer['host_time']
+        self._kind = self.buffer['kind']
+        self._value = self.buffer['value']
+        self.dropped_total = REGISTRY.counter('nctrl_output_dropped_triggers_total', 'Triggers the output could not send', {'output': self.name})
+
+    def __call__(self, y, timestamp=None):
+        if isinstance(y, np.uint16):
+            if y != self.mask:
+                self.mask = y
+                self._record(b's', y, timestamp)
+        elif isinstance(y, int) and y == 1:
+            if self._record(b't', 1, timestamp):
+                self.triggers_total.inc()
+
+    def _record(self, kind, value, timestamp):
+        i = int(self._count[0])  # shared, so a restarted (forked) BMI process appends
+        if i == self.capacity:
+            self.dropped_total.inc()
+            return False
+        self._timestamp[i] = -1 if timestamp is None else timestamp
+        self._host_time[i] = time.monotonic()
+        self._kind[i] = kind
+        self._value[i] = value
+        self._count[0] = i + 1  # publish after the record is written
+        return True
+
+    def __len__(self):
+        return int(self._count[0])
+
+    @property
+    def records(self):
+        """Copy of the records written so far."""
+        return self.buffer[:len(self)].copy()
+
+    @property
+    def trigger_times(self):
+        """FPGA timestamps of the triggers written so far."""
+        records = self.records
+        return records['timestamp'][records['kind'] == b't']
+
+    def clear(self):
+        """Forget the records; call only while the BMI is stopped."""
+        self._count[0] = 0
+
+
+class DatagramOutput(Output):
+    """
+    Output that sends every event as one datagram to a downstream system.
+
+    Each datagram is a single packed OUTPUT_DTYPE record (21 bytes), which a
+    receiver can parse with `np.frombuffer(data, OUTPUT_DTYPE)`. Triggers,
+    mask changes and settings changes are all sent. The socket is
+    non-blocking: a datagram that cannot be sent right away (full socket
+    buffer, receiver not bound) is dropped and counted.
+
+    Args:
+        port (str, optional): 'host:port' for UDP or the path of a Unix
+            datagram socket. Defaults to '127.0.0.1:7071'.
+    """
+    name = 'datagram'
+
+    def __init__(self, port=None):
+        super().__init__(port or '127.0.0.1:7071')
+        host, sep, udp_port = self.port.rpartition(':')
+        if sep and not self.port.startswith('/'):
+            family, self.address = socket.AF_INET, (host, int(udp_port))
+        else:
+            family, self.address = socket.AF_UNIX, self.port
+        logger.info(f'Setting output to datagrams to {self.address}')
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self._packet = bytearray(OUTPUT_DTYPE.itemsize)  # reused for every datagram
+        self._failing = False
+        self.dropped_total = REGISTRY.counter('nctrl_output_dropped_triggers_total', 'Triggers the output could not send', {'output': self.name})
+        self.errors_total = REGISTRY.counter('nctrl_output_errors_total', 'Output write errors', {'output': self.name})
+
+    def __call__(self, y, timestamp=None):
+        if isinstance(y, np.uint16):
+            if y != self.mask:
+                self.mask = y
+                self._send(b's', y, timestamp)
+        elif isinstance(y, int) and y == 1:
+            if self._send(b't', 1, timestamp):
+                self.triggers_total.inc()
+            else:
+                self.dropped_total.inc()
+
+    def _send(self, kind, value, timestamp=None):
+        """Send one record without blocking; returns False if it was dropped."""
+        struct.pack_into('<qdci', self._packet, 0, -1 if timestamp is None else timestamp,
+                         time.monotonic(), kind, value)
+        try:
+            self.sock.sendto(self._packet, self.address)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            self.errors_total.inc()
+            if not self._failing:
+                self._failing = True
+                logger.warning(f'Datagram output to {self.address} failing: {e}')
+            return False
+        self._failing = False
+        return True
+
+    def on(self):
+        super().on()
+        self._send(b'e', 1)
+
+    def off(self):
+        super().off()
+        self._send(b'E', 0)
+
+    def set_duration(self, duration):
+        super().set_duration(duration)
+        self._send(b'd', duration)
+
+    def set_latency(self, latency):
+        super().set_latency(latency)
+        self._send(b'l', latency)
+
+    def send_settings(self, duration=None, latency=None):
+        super().send_settings(duration, latency)
+        if duration is not None:
+            self._send(b'd', duration)
+        if latency is not None:
+            self._send(b'l', latency)
+
+    def close(self):
+        """Close the socket."""
+        self.sock.close()
+        logger.info('Datagram output closed')
+
+
+class Laser(Output):
     """
     A class to control a laser device via serial communication.
 
@@ -20,13 +291,32 @@ class Laser:
     Attributes:
         ser (serial.Serial): Serial connection to the laser device.
         duration (int): Duration of the laser pulse in milliseconds.
+        clock (ClockSync): FPGA -> Teensy clock mapping. Once it is synced,
+            triggers with a timestamp carry the absolute Teensy time at which
+            to fire (spike time + latency) instead of a relative latency.
+        connected (bool): False while the serial link is down.
+
+    When the USB link drops, the first failing write marks the laser as
+    disconnected and wakes a supervisor thread of the process that wrote
+    (the forked BMI process has its own). The supervisor re-enumerates
+    `port_pattern` and reopens the port, which may come back under a new
+    name. It then re-sends the duration, latency, enable state and TTL
+    mask, and resyncs the clock, since the Teensy may have rebooted.
+    Meanwhile, calls from the decoder never block. Triggers are dropped or,
+    with policy='buffer', kept (at most `max_pending`, sent on reconnect as
+    immediate triggers if at most `max_age` seconds old).
 
     Args:
         port (str, optional): The serial port to connect to. If None, it will
             attempt to find an available port automatically.
+        policy (str, optional): 'drop' or 'buffer' triggers while disconnected. Defaults to 'drop'.
+        max_pending (int, optional): Triggers kept with policy='buffer'. Defaults to 16.
+        max_age (float, optional): Oldest buffered trigger still sent (s). Defaults to 1.0.
+        port_pattern (str, optional): Ports to search on reconnect. Defaults to '/dev/ttyACM*'.
     """
+    name = 'laser'
 
-    def __init__(self, port=None):
+    def __init__(self, port=None, policy='drop', max_pending=16, max_age=1.0, port_pattern='/dev/ttyACM*'):
         """
         Initialize the Laser object.
 
@@ -37,38 +327,75 @@ class Laser:
             port (str, optional): The serial port to connect to.
 
         Raises:
-            ValueError: If no suitable port is found when port is None.
+            ValueError: If no suitable port is found when port is None, or the policy is unknown.
         """
+        if policy not in ('drop', 'buffer'):
+            raise ValueError(f"Unknown trigger policy while disconnected: {policy}")
         if port is None:
-            available_ports = glob.glob('/dev/ttyACM*')
+            available_ports = glob.glob(port_pattern)
             if not available_ports:
-                raise ValueError("No suitable port found in /dev/ttyACM*")
+                raise ValueError(f"No suitable port found in {port_pattern}")
             port = available_ports[0]
 
         logger.info(f'Setting output to Laser on port {port}')
-        self.ser = serial.Serial(port=port, baudrate=2000000, timeout=0, write_timeout=0, inter_byte_timeout=0)
-        self.ser.flushInput()
-        self.ser.flushOutput()
-        self.duration = 500
-        self.latency = 0
+        super().__init__(port)
+        self.port_pattern = port_pattern
+        self.ser = self._open_serial(port)
+        self.connected = True
+        self.policy = policy
+        self.max_age = max_age
+        self._pending = collections.deque(maxlen=max_pending)  # (perf_counter, command) held while disconnected
+        self._mask_cmd = bytearray(b's\x00\x00')  # reused for every mask update
+        self._trigger_cmd = bytearray(b'T\x00\x00\x00\x001')  # absolute trigger: target micros (uint32) + command
+        self._lock = threading.Lock()  # one request/reply exchange at a time
+        self.clock = ClockSync()
+        self._sync_thread = None
+        self.masks_total = REGISTRY.counter('nctrl_output_mask_updates_total', 'TTL mask updates sent to the output', {'output': 'laser'})
+        self.errors_total = REGISTRY.counter('nctrl_output_errors_total', 'Output write errors', {'output': 'laser'})
+        self.absolute_total = REGISTRY.counter('nctrl_output_absolute_triggers_total', 'Triggers sent with an absolute firing time', {'output': 'laser'})
+        self.dropped_total = REGISTRY.counter('nctrl_output_dropped_triggers_total', 'Triggers the output could not send', {'output': 'laser'})
+        self.disconnects_total = REGISTRY.counter('nctrl_output_disconnects_total', 'Serial link losses', {'output': 'laser'})
+        self.connected_gauge = REGISTRY.gauge('nctrl_output_connected', '1 while the serial link is up', {'output': 'laser'})
+        self.connected_gauge.set(1)
+        self._closed = False
+        self._supervisor_pid = None
+        self._start_supervisor()
 
-    def __call__(self, y):
+    def __call__(self, y, timestamp=None):
         """
         Callable method to control the laser based on input.
 
         Args:
-            y (int or array-like): Control signal for the laser.
+            y (int or np.uint16): Control signal for the laser.
                 If y is 1, it triggers the laser.
-                If y is an array-like object, it sends a more complex command.
+                If y is a np.uint16 mask (e.g. from the Spikes decoder), it sets
+                the 16 TTL output lines; the mask is only sent when it changes.
+            timestamp (int, optional): FPGA timestamp of the decision. With a
+                synced clock the laser fires at timestamp + latency on the
+                Teensy clock, independent of host delays.
         """
-        if isinstance(y, int) and y == 1:
-            if self.duration < 25:
-                self._write_serial(b'1')
+        if isinstance(y, np.uint16):
+            if y != self.mask:
+                self.mask = y
+                struct.pack_into('<H', self._mask_cmd, 1, y)
+                self._write_serial(self._mask_cmd)
+                self.masks_total.inc()
+        elif isinstance(y, int) and y == 1:
+            cmd = b'1' if self.duration < 25 else b'a'
+            if not self.connected:
+                self._hold(cmd)
+            elif timestamp is not None and self.clock.ready:
+                target = self.clock.fpga_to_device(timestamp) + self.latency * 1000
+                struct.pack_into('<IB', self._trigger_cmd, 1, target % 0x100000000, cmd[0])
+                if self._write_serial(self._trigger_cmd):
+                    self.absolute_total.inc()
+                    self.triggers_total.inc()
+                else:
+                    self._hold(cmd)
+            elif self._write_serial(cmd):
+                self.triggers_total.inc()
             else:
-                self._write_serial(b'a')
-        elif isinstance(y, (list, np.ndarray)) and len(y) > 1:
-            y_uint16 = np.packbits(y[0].astype(np.uint8)).view(np.uint16)
-            self._write_serial(b's' + y_uint16.tobytes())
+                self._hold(cmd)
 
     def __repr__(self):
         """
@@ -77,19 +404,24 @@ class Laser:
         Returns:
             str: A string representation of the Laser object.
         """
-        return f'Laser(port={self.ser.port}, duration={self.duration})'
+        return f'Laser(port={self.port}, duration={self.duration}, connected={self.connected})'
     
     def on(self):
         """Turn the laser on."""
-        self._write_serial(b'e')
-        logger.info('Laser on')
-        self._print_serial()
+        self.enabled = True
+        with self._lock:
+            self._write_serial(b'e')
+            logger.info('Laser on')
+            self._print_serial()
     
     def off(self):
         """Turn the laser off."""
-        self._write_serial(b'E')
-        logger.info('Laser off')
-        self._print_serial()
+        self.enabled = False
+        with self._lock:
+            self._write_serial(b'E')
+            self.mask = 0  # the firmware clears the TTL lines on disable
+            logger.info('Laser off')
+            self._print_serial()
     
     def set_duration(self, duration):
         """
@@ -104,9 +436,10 @@ class Laser:
         if not isinstance(duration, int) or duration < 0:
             raise ValueError("Duration (ms) must be a non-negative integer")
         self.duration = duration
-        self._write_serial(f'd{duration}'.encode())
-        logger.info(f'Setting duration to {duration} ms')
-        self._print_serial()
+        with self._lock:
+            self._write_serial(f'd{duration}\n'.encode())
+            logger.info(f'Setting duration to {duration} ms')
+            self._print_serial()
     
     def set_latency(self, latency):
         """
@@ -116,36 +449,255 @@ class Laser:
             latency (int): Latency of the laser pulse in milliseconds.
         """
         self.latency = latency
-        self._write_serial(f'l{latency}'.encode())
-        logger.info(f'Setting latency to {latency} ms')
-        self._print_serial()
+        with self._lock:
+            self._write_serial(f'l{latency}\n'.encode())
+            logger.info(f'Setting latency to {latency} ms')
+            self._print_serial()
+
+    def send_settings(self, duration=None, latency=None):
+        """
+        Send the duration and/or latency without waiting for the reply, for the BMI loop.
+
+        The reply is left unread (`ping` skips it) and a lost link is handled
+        by the supervisor, which restores these settings on reconnect.
+
+        Args:
+            duration (int, optional): Duration of the laser pulse in milliseconds.
+            latency (int, optional): Latency of the laser pulse in milliseconds.
+        """
+        super().send_settings(duration, latency)
+        cmd = (f'd{duration}\n' if duration is not None else '') + (f'l{latency}\n' if latency is not None else '')
+        if cmd:
+            self._write_serial(cmd.encode())
+
+    def ping(self, timeout=0.1):
+        """
+        Read the Teensy clock and feed it to `clock`.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the reply. Defaults to 0.1.
+
+        Returns:
+            float: Round trip in seconds.
+
+        Raises:
+            TimeoutError: If the firmware does not answer (e.g. it predates clock sync).
+        """
+        if not self.connected:
+            raise ConnectionError('Laser disconnected')
+        with self._lock:
+            try:
+                self.ser.reset_input_buffer()
+                send = time.perf_counter()
+                self.ser.write(b't')
+                line = b''
+                while not (line.startswith(b't ') and line.endswith(b'\n')):
+                    if line.endswith(b'\n'):
+                        line = b''  # skip other output
+                    # block in select rather than spinning, so other threads (and the GIL) stay free
+                    remaining = timeout - (time.perf_counter() - send)
+                    if remaining <= 0 or not select.select([self.ser], [], [], remaining)[0]:
+                        raise TimeoutError(f'No clock reply within {timeout} s')
+                    line += self.ser.readline()
+            except (serial.SerialException, OSError) as e:
+                if isinstance(e, serial.SerialTimeoutException):
+                    raise
+                self._disconnected(e)
+                raise ConnectionError(f'Laser disconnected: {e}')
+            recv = time.perf_counter()
+        self.clock.observe_ping(send, recv, int(line.split()[1]))
+        return recv - send
+
+    def sync(self, n_pings=16):
+        """
+        Ping the Teensy `n_pings` times to estimate its clock.
+
+        Returns:
+            bool: False if the firmware does not support clock sync.
+        """
+        try:
+            rtt = min(self.ping() for _ in range(n_pings))
+        except (TimeoutError, ConnectionError, ValueError, IndexError) as e:
+            logger.warning(f'Clock sync unavailable, triggers use relative latency: {e}')
+            return False
+        logger.info(f'Clock sync: best round trip {rtt * 1e6:.0f} us')
+        return True
+
+    def start_sync(self, interval=5.0):
+        """Keep pinging every `interval` seconds in the background to track clock drift."""
+        def run():
+            while True:
+                time.sleep(interval)
+                if self._sync_thread is None:
+                    break
+                if not self.connected:
+                    continue  # resynced by the supervisor on reconnect
+                try:
+                    self.ping()
+                except Exception as e:
+                    if self._sync_thread is not None:
+                        logger.warning(f'Clock sync ping failed: {e}')
+
+        if self._sync_thread is None and self.sync():
+            self._sync_thread = threading.Thread(target=run, daemon=True, name='laser-clock-sync')
+            self._sync_thread.start()
     
-    def _print_serial(self):
+    def _print_serial(self, timeout=0.5):
         """
         Print the serial output from the laser device.
 
-        This method reads from the serial port and prints any output received.
+        This method reads from the serial port and logs the first line received,
+        giving up after `timeout` seconds or when the device is gone.
         """
-        while True:
-            output = self.ser.readline().decode().strip()
+        deadline = time.monotonic() + timeout
+        while self.connected:
+            try:
+                output = self.ser.readline().decode(errors='replace').strip()
+            except (serial.SerialException, OSError) as e:
+                self._disconnected(e)
+                return
             if output:
                 logger.info(output)
-                break
-            time.sleep(0.1)  # Wait a bit before trying again
+                return
+            if time.monotonic() > deadline:
+                logger.warning(f'No reply from the laser within {timeout} s')
+                return
+            time.sleep(0.01)  # Wait a bit before trying again
 
     def _write_serial(self, data):
         """
-        Write data to the serial port.
+        Write data to the serial port without blocking.
 
         Args:
             data (bytes): The data to be written to the serial port.
+
+        Returns:
+            bool: False if the data was not written (disconnected or output buffer full).
         """
+        if not self.connected:
+            return False
         try:
             self.ser.write(data)
-        except Exception as e:
+            return True
+        except serial.SerialTimeoutException as e:
+            self.errors_total.inc()
             logger.error(f"Error writing to serial port: {e}")
+        except (serial.SerialException, OSError) as e:
+            self.errors_total.inc()
+            self._disconnected(e)
+        return False
+
+    def _hold(self, cmd):
+        """Keep or drop a trigger that could not be sent, as set by the policy."""
+        if self.policy == 'buffer':
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped_total.inc()  # the oldest one falls out
+            self._pending.append((time.perf_counter(), cmd))
+        else:
+            self.dropped_total.inc()
+
+    def _disconnected(self, error):
+        if self.connected and not self._closed:
+            self.connected = False
+            self.connected_gauge.set(0)
+            self.disconnects_total.inc()
+            logger.error(f'Laser disconnected from {self.port}: {error}')
+            self._start_supervisor()
+            self._lost.set()
+
+    def _start_supervisor(self):
+        """
+        Start the reconnecting thread in the calling process.
+
+        Threads do not survive a fork, and the laser is triggered from the
+        forked BMI process, so a link loss seen there is handled by a
+        supervisor of its own, reopening the port for that process.
+        """
+        pid = os.getpid()
+        if self._supervisor_pid == pid:
+            return
+        if self._supervisor_pid is not None:
+            # a lock held by one of the parent's threads at the fork stays held in the child
+            self._lock = threading.Lock()
+        self._supervisor_pid = pid
+        self._lost = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True, name='laser-supervisor')
+        self._supervisor.start()
+
+    @staticmethod
+    def _open_serial(port):
+        ser = serial.Serial(port=port, baudrate=2000000, timeout=0, write_timeout=0, inter_byte_timeout=0)
+        ser.reset_input_buffer()
+        ser.reset_output_buffer()
+        return ser
+
+    def _supervise(self):
+        """Reconnect after each link loss; runs on its own thread."""
+        while True:
+            self._lost.wait()
+            self._lost.clear()
+            delay = 0.05
+            while not self._closed and not self._reconnect():
+                time.sleep(delay)
+                delay = min(2 * delay, 2.0)
+            if self._closed:
+                return
+
+    def _reconnect(self):
+        """Reopen the first available port and restore the laser settings; returns True on success."""
+        ports = [self.port] + [port for port in sorted(glob.glob(self.port_pattern)) if port != self.port]
+        for port in filter(os.path.exists, ports):
+            try:
+                with self._lock:
+                    try:
+                        self.ser.close()
+                    except Exception:
+                        pass
+                    self.ser = self._open_serial(port)
+                    # a re-enumerated Teensy may have rebooted with default settings
+                    self.ser.write(f'd{self.duration}\nl{self.latency}\n'.encode() + (b'e' if self.enabled else b'E'))
+                    if self.enabled and self.mask:
+                        self.ser.write(b's' + struct.pack('<H', self.mask))
+                    time.sleep(0.05)
+                    self.ser.reset_input_buffer()  # drop the replies
+                    self.clock.reset_device()
+                    self.port = port
+            except (serial.SerialException, OSError) as e:
+                logger.debug(f'Reconnecting the laser on {port} failed: {e}')
+                continue
+            self.connected = True
+            self.connected_gauge.set(1)
+            logger.info(f'Laser reconnected on {port}')
+            self._flush_pending()
+            if self._sync_thread is not None:
+                self.sync()
+            return True
+        return False
+
+    def _flush_pending(self):
+        """Send the triggers held while disconnected that are still recent enough."""
+        now = time.perf_counter()
+        while self._pending:
+            held, cmd = self._pending.popleft()
+            if now - held > self.max_age:
+                self.dropped_total.inc()
+            elif self._write_serial(cmd):
+                self.triggers_total.inc()
 
     def close(self):
         """Close the serial connection to the laser device."""
-        self.ser.close()
-        logger.info('Laser closed')
\ No newline at end of file
+        self._sync_thread = None
+        self._closed = True
+        self._lost.set()  # let the supervisor exit
+        with self._lock:
+            self.ser.close()
+        logger.info('Laser closed')
+
+
+# output key -> backend, see NCtrl.set_output
+OUTPUTS = {
+    'laser': Laser,
+    'null': NullOutput,
+    'memory': MemoryOutput,
+    'datagram': DatagramOutput,
+}
@@ -0,0 +1,110 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# parameters accepted by NCtrl.configure besides the decoder key
+EPOCH_PARAMS = ('unit_id', 'unit_ids', 'nspike', 'target_fr', 'bin_size', 'B_bins', 'B2_bins', 'direction')
+LASER_PARAMS = ('duration', 'latency')
+
+
+class Protocol:
+    """
+    A declarative experiment schedule: consecutive epochs of fixed duration.
+
+    Each epoch names a decoder (or null for a recording-only epoch such as
+    baseline or extinction), its parameters as accepted by
+    `NCtrl.configure`, optional laser settings and a duration in seconds::
+
+        {
+          "name": "conditioning-unit3",
+          "laser": {"duration": 20},
+          "epochs": [
+            {"name": "baseline", "decoder": null, "duration": 600},
+            {"name": "conditioning", "decoder": "dynamic", "duration": 1200,
+             "unit_id": 3, "target_fr": 0.2, "B_bins": 10, "B2_bins": 600},
+            {"name": "extinction", "decoder": null, "duration": 600}
+          ]
+        }
+
+    Protocol-level ``laser`` settings are defaults for every epoch.
+
+    Args:
+        epochs (list of dict): Epoch definitions.
+        name (str, optional): Protocol name. Defaults to 'protocol'.
+        laser (dict, optional): Default laser settings ('duration', 'latency' in ms).
+
+    Raises:
+        ValueError: If an epoch is malformed.
+    """
+    def __init__(self, epochs, name='protocol', laser=None):
+        self.name = name
+        self.epochs = [self._normalize(i, epoch, laser or {}) for i, epoch in enumerate(epochs)]
+        if not self.epochs:
+            raise ValueError('Protocol has no epochs')
+
+    @staticmethod
+    def _normalize(i, epoch, laser):
+        epoch = dict(epoch)
+        name = epoch.pop('name', f'epoch{i}')
+        decoder = epoch.pop('decoder', None)
+        try:
+            duration = float(epoch.pop('duration'))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Epoch '{name}': duration (s) is required")
+        if duration <= 0:
+            raise ValueError(f"Epoch '{name}': duration must be positive")
+        epoch_laser = dict(laser, **epoch.pop('laser', {}))
+        unknown = set(epoch) - set(EPOCH_PARAMS) | set(epoch_laser) - set(LASER_PARAMS)
+        if unknown:
+            raise ValueError(f"Epoch '{name}': unknown parameters {sorted(unknown)}")
+        return {'name': name, 'decoder': decoder, 'duration': duration,
+                'laser': {key: int(value) for key, value in epoch_laser.items()}, 'params': epoch}
+
+    @property
+    def duration(self):
+        """Total duration in seconds."""
+        return sum(epoch['duration'] for epoch in self.epochs)
+
+    @property
+    def boundaries(self):
+        """Epoch start times in seconds from the protocol start, plus its end."""
+        times = [0.0]
+        for epoch in self.epochs:
+            times.append(times[-1] + epoch['duration'])
+        return times
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a protocol from a JSON or YAML file (YAML needs PyYAML).
+
+        The protocol name defaults to the file name.
+        """
+        with open(filename) as f:
+            if filename.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError('Reading YAML protocols requires PyYAML (pip install pyyaml)')
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        if isinstance(spec, list):
+            spec = {'epochs': spec}
+        name = spec.get('name', os.path.splitext(os.path.basename(filename))[0])
+        return cls(spec['epochs'], name=name, laser=spec.get('laser'))
+
+    def to_dict(self):
+        epochs = [dict(epoch['params'], name=epoch['name'], decoder=epoch['decoder'], duration=epoch['duration'],
+                       laser=epoch['laser']) for epoch in self.epochs]
+        return {'name': self.name, 'epochs': epochs}
+
+    def save(self, filename):
+        """Write the normalized protocol as JSON (e.g. next to the session record)."""
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __repr__(self):
+        return f'Protocol({self.name!r}, {len(self.epochs)} epochs, {self.duration:g} s)'
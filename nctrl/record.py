@@ -0,0 +1,177 @@
+import os
+import mmap
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One fixed-width record per decoder decision (per bin in binner mode, per spike in spike mode).
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),  # FPGA clock, 25 kHz
+    ('unit', '<i2'),       # decoded unit, -1 for multi-unit decoders
+    ('count', '<i4'),      # spike count seen by the decoder
+    ('nspike', '<f4'),     # decoder threshold at decision time
+    ('decision', '<i4'),   # decoder output (0/1 or a TTL mask)
+    ('trigger', 'i1'),     # 1 if a trigger was sent to the output
+    ('kind', 'u1'),        # record type, see KIND_*
+])
+KIND_DECISION = 0
+KIND_EPOCH = 1     # protocol epoch boundary; `count` is the epoch index (== number of epochs when finished)
+
+INDEX_DTYPE = np.dtype([
+    ('first', '<i8'),  # first timestamp in the chunk
+    ('last', '<i8'),   # last timestamp in the chunk
+    ('n', '<i8'),      # number of records in the chunk
+])
+
+
+class SessionRecorder:
+    """
+    Low-overhead columnar recorder for BMI decisions.
+
+    Records are written on the hot path into a ring of preallocated records
+    in an anonymous shared mmap, like the spike ring, so a forked BMI
+    process records and the parent writes: a background thread in the
+    process that created the recorder drains the ring into
+    ``chunk_XXXXXX.npy`` files and keeps ``index.npy`` (first/last
+    timestamp per chunk) up to date, so `SessionLog` can memory-map and
+    slice a session by time. Records are published one by one, so stopping
+    the BMI process loses none that were recorded; `flush` writes them all.
+
+    Parameters
+    ----------
+    path : str
+        Root directory; each recorder writes into a new timestamped subdirectory.
+    chunk_size : int
+        Number of records per chunk file.
+    n_buffers : int
+        Ring size in chunks; the writer must drain the ring before the BMI laps it.
+    interval : float
+        Seconds between writer polls of the ring.
+    """
+    def __init__(self, path='./session', chunk_size=16384, n_buffers=16, interval=0.1):
+        self.path = os.path.join(path, time.strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(self.path, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.size = chunk_size * n_buffers
+        self.interval = interval
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+        self._mm = mmap.mmap(-1, 8 + self.size * RECORD_DTYPE.itemsize)
+        self._count = np.frombuffer(self._mm, dtype=np.int64, count=1)
+        self.buffer = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=self.size, offset=8)
+        self._written = 0  # records drained to disk, writer side
+        self._lock = threading.Lock()  # one drain at a time (writer thread or flush)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._writer, daemon=True, name='nctrl-recorder')
+        self._thread.start()
+        logger.info(f'Recording session to {self.path}')
+
+    def record(self, timestamp, unit, count, nspike, decision, trigger, kind=KIND_DECISION):
+        """Append one record. Never blocks on disk I/O."""
+        # the count is shared: the BMI may record from a new process after every restart
+        n = int(self._count[0])
+        self.buffer[n % self.size] = (timestamp, unit, count, nspike, decision, trigger, kind)
+        self._count[0] = n + 1  # publish after the record is written
+
+    def flush(self):
+        """Write all records published so far, including a partial chunk."""
+        self._drain(partial=True)
+
+    def close(self):
+        """Flush pending records and stop the writer."""
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        logger.info(f'Session recorder closed ({self.index["n"].sum()} records)')
+
+    def _writer(self):
+        while not self._closed.wait(self.interval):
+            try:
+                self._drain()
+            except Exception as e:
+                logger.error(f'SessionRecorder: error writing chunk: {e}')
+
+    def _drain(self, partial=False):
+        """Write the published records in whole chunks, and the remainder if `partial`."""
+        with self._lock:
+            count = int(self._count[0])
+            if count - self._written > self.size:
+                logger.warning(f'SessionRecorder: writer is behind, {count - self._written - self.size} records lost')
+                self._written = count - self.size
+            while count - self._written >= self.chunk_size or (partial and count > self._written):
+                n = min(self.chunk_size, count - self._written)
+                i = self._written % self.size
+                records = np.concatenate((self.buffer[i:i + n], self.buffer[:max(0, i + n - self.size)]))
+                self._write_chunk(records)
+                self._written += n
+
+    def _write_chunk(self, records):
+        i_chunk = len(self.index)
+        _save(os.path.join(self.path, f'chunk_{i_chunk:06d}.npy'), records)
+        entry = np.array([(records['timestamp'][0], records['timestamp'][-1], len(records))], dtype=INDEX_DTYPE)
+        self.index = np.concatenate((self.index, entry))
+        _save(os.path.join(self.path, 'index.npy'), self.index)
+
+
+def _save(filename, array):
+    """Save atomically so readers never see a partially written file."""
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, filename)
+
+
+class SessionLog:
+    """
+    Reader for a session written by `SessionRecorder`.
+
+    Chunks are memory-mapped lazily and sliced by FPGA timestamp through the
+    chunk index, so no text parsing or full loads are needed.
+
+    Parameters
+    ----------
+    path : str
+        Session directory containing ``index.npy`` and chunk files.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index = np.load(os.path.join(path, 'index.npy'))
+        self._chunks = {}
+
+    def __len__(self):
+        return int(self.index['n'].sum())
+
+    def chunk(self, i_chunk):
+        if i_chunk not in self._chunks:
+            self._chunks[i_chunk] = np.load(os.path.join(self.path, f'chunk_{i_chunk:06d}.npy'), mmap_mode='r')
+        return self._chunks[i_chunk]
+
+    def slice(self, t_start=None, t_end=None, kind=None):
+        """
+        Return records with t_start <= timestamp < t_end.
+
+        Parameters
+        ----------
+        t_start, t_end : int, optional
+            FPGA timestamps; None means open-ended.
+        kind : int, optional
+            Only return records of this kind.
+        """
+        t_start = np.iinfo(np.int64).min if t_start is None else t_start
+        t_end = np.iinfo(np.int64).max if t_end is None else t_end
+        in_range = np.where((self.index['last'] >= t_start) & (self.index['first'] < t_end))[0]
+
+        parts = []
+        for i_chunk in in_range:
+            chunk = self.chunk(i_chunk)
+            ts = chunk['timestamp']
+            parts.append(chunk[np.searchsorted(ts, t_start):np.searchsorted(ts, t_end)])
+        records = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+        return records if kind is None else records[records['kind'] == kind]
+
+    @property
+    def records(self):
+        return self.slice()
@@ -0,0 +1,150 @@
+import os
+import html
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+def unit_stats(unit, bin_size=0.1, B=10):
+    """
+    Summary statistics of the B-bin spike count of every unit, computed in one pass.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by unit id with group, firing rate and the mean, median, 80th
+        and 90th percentile of the B-bin spike count (the values Unit.plot prints).
+    """
+    spike_conv = unit.spike_conv(bin_size, B)
+    percentile = np.percentile(spike_conv, [50, 80, 90], axis=1)
+    return pd.DataFrame({
+        'group': unit.spike_group,
+        'fr': unit.spike_fr,
+        'mean': spike_conv.mean(axis=1),
+        'median': percentile[0],
+        'p80': percentile[1],
+        'p90': percentile[2],
+    }, index=pd.Index(np.arange(1, unit.n_unit + 1), name='unit'))
+
+
+def _render_page(args):
+    """Render one page of unit panels with the Agg canvas and return it as an RGBA array."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    unit_ids, spike_conv, acg, time_bin, stats, dpi = args
+    f = Figure(figsize=(10, 3 * len(unit_ids)), dpi=dpi)
+    FigureCanvasAgg(f)
+    gs = f.add_gridspec(len(unit_ids), 1, wspace=0.3, hspace=0.3)
+    t = (time_bin[:-1] + time_bin[1:]) / 2
+    half = acg.shape[1] // 2
+
+    for row, unit_id in enumerate(unit_ids):
+        gs_unit = gs[row].subgridspec(2, 2, wspace=0.1, hspace=0.1)
+        ax1 = f.add_subplot(gs_unit[0, 0])
+        ax2 = f.add_subplot(gs_unit[0, 1])
+        ax3 = f.add_subplot(gs_unit[1, :])
+        conv = spike_conv[row]
+        s = stats[row]
+
+        # firing rate plot
+        ax1.hist(conv, bins=np.arange(conv.max() + 1), color='black')
+        ax1.set_xlim(0, max(conv.max(), 1))
+        ax1.axvline(s['median'], color='g', linestyle='dashed', linewidth=1, label='Median')
+        ax1.axvline(s['p80'], color='b', linestyle='dashed', linewidth=1, label='80th Percentile')
+        ax1.axvline(s['p90'], color='y', linestyle='dashed', linewidth=1, label='90th Percentile')
+        ax1.set_title(f"Unit {unit_id} ({s['fr']:.2f} Hz)")
+
+        # autocorrelogram
+        ax2.bar(np.arange(-half, acg.shape[1] - half), acg[row], color='black', width=1)
+        ax2.set_xlim(-half, acg.shape[1] - half)
+        if row == 0:
+            ax2.set_title('autocorrelogram')
+
+        # temporal pattern
+        ax3.plot(t, conv, color='black', linewidth=0.5)
+        ax3.set_xlim(time_bin[0], time_bin[-1])
+
+    f.canvas.draw()
+    return np.asarray(f.canvas.buffer_rgba()).copy()
+
+
+def write_report(unit, filename='unit_report.pdf', bin_size=0.1, B=10, units_per_page=4, n_jobs=None, dpi=100):
+    """
+    Write a paged summary of all units without an interactive backend.
+
+    Statistics are computed vectorized over all units; pages are rendered in
+    parallel worker processes with the Agg canvas and assembled into a PDF
+    (one image per page) or, for a .html filename, an HTML page with the
+    statistics table followed by the page images (written to `<name>_pages/`).
+
+    Args:
+        unit (Unit): Loaded Unit.
+        filename (str, optional): Output .pdf or .html file. Defaults to 'unit_report.pdf'.
+        bin_size (float, optional): Bin size in seconds. Defaults to 0.1.
+        B (int, optional): Number of bins summed. Defaults to 10.
+        units_per_page (int, optional): Units per page. Defaults to 4.
+        n_jobs (int, optional): Worker processes. Defaults to os.cpu_count().
+        dpi (int, optional): Page resolution. Defaults to 100.
+
+    Returns:
+        pd.DataFrame: The unit_stats table.
+    """
+    stats = unit_stats(unit, bin_size, B)
+    spike_conv = unit.spike_conv(bin_size, B)
+    time_bin = np.arange(unit.start_time, unit.end_time, bin_size)
+    records = stats.to_dict('records')
+
+    jobs = []
+    for start in range(0, unit.n_unit, units_per_page):
+        rows = slice(start, min(start + units_per_page, unit.n_unit))
+        jobs.append((stats.index[rows].to_numpy(), np.asarray(spike_conv[rows]), np.asarray(unit.acg[rows]),
+                     time_bin, records[rows], dpi))
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+    if n_jobs <= 1:
+        pages = map(_render_page, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_jobs)
+        pages = pool.map(_render_page, jobs)
+
+    try:
+        if filename.endswith('.html'):
+            _write_html(filename, stats, pages, title=f'Unit report: {unit.spike_file}')
+        else:
+            _write_pdf(filename, pages, dpi)
+    finally:
+        if n_jobs > 1:
+            pool.shutdown()
+    return stats
+
+
+def _write_pdf(filename, pages, dpi):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(filename) as pdf:
+        for page in pages:
+            height, width = page.shape[:2]
+            f = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+            f.figimage(page, origin='upper')
+            pdf.savefig(f, dpi=dpi)
+
+
+def _write_html(filename, stats, pages, title):
+    import matplotlib.image
+
+    page_dir = os.path.splitext(filename)[0] + '_pages'
+    os.makedirs(page_dir, exist_ok=True)
+    images = []
+    for i, page in enumerate(pages):
+        page_file = os.path.join(page_dir, f'page_{i:03d}.png')
+        matplotlib.image.imsave(page_file, page)
+        images.append(os.path.relpath(page_file, os.path.dirname(os.path.abspath(filename))))
+
+    with open(filename, 'w') as f:
+        f.write(f'<html><head><title>{html.escape(title)}</title></head><body>\n<h1>{html.escape(title)}</h1>\n')
+        f.write(stats.to_html(float_format='{:.2f}'.format))
+        for image in images:
+            f.write(f'\n<p><img src="{html.escape(image)}"></p>')
+        f.write('\n</body></html>\n')
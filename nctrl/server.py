@@ -0,0 +1,245 @@
+import json
+import time
+import socket
+import asyncio
+import logging
+import collections
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import REGISTRY
+from .protocol import Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class ControlServer:
+    """
+    Headless remote control of an NCtrl over newline-delimited JSON.
+
+    Each request is one JSON object per line, ``{"id": 1, "cmd": "start",
+    "decoder": "fr", "unit_id": 3, ...}``, answered with ``{"id": 1, "ok":
+    true, "result": ...}`` or ``{"id": 1, "ok": false, "error": "..."}``.
+    Commands:
+
+    - ``status``: running state, BMI parameters, laser settings, unit count
+    - ``start``: NCtrl.start_bmi with the remaining fields as arguments
+    - ``protocol``: NCtrl.start_protocol with ``epochs`` (and optional
+      ``name`` and ``laser``) as in a protocol file
+    - ``stop``: NCtrl.stop_bmi
+    - ``set_duration`` / ``set_latency``: laser pulse settings (``value`` in ms)
+    - ``subscribe`` / ``unsubscribe``: stream ``{"event": "rates", ...}``
+      messages with per-unit firing rates and the trigger rate, decimated
+      to one message per ``interval`` seconds
+    - ``metrics``: the metrics registry in the Prometheus text format
+
+    NCtrl calls block (serial replies, FPGA start), so they run one at a
+    time on a worker thread while the event loop keeps serving clients.
+
+    Args:
+        nctrl (NCtrl): Initialized NCtrl.
+        host (str, optional): Bind address. Defaults to '127.0.0.1'.
+        port (int, optional): TCP port. Defaults to 7070.
+        unix_path (str, optional): Serve on this Unix socket instead of TCP.
+        interval (float, optional): Seconds between rate messages. Defaults to 1.0.
+    """
+    def __init__(self, nctrl, host='127.0.0.1', port=7070, unix_path=None, interval=1.0):
+        self.nctrl = nctrl
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.interval = interval
+        self.subscribers = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='nctrl-control')
+        self.commands = {
+            'status': self.status,
+            'start': self.start,
+            'protocol': self.protocol,
+            'stop': self.stop,
+            'set_duration': self.set_duration,
+            'set_latency': self.set_latency,
+            'metrics': lambda: REGISTRY.render(),
+        }
+
+    async def serve(self):
+        if self.unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=self.unix_path)
+            address = self.unix_path
+        else:
+            server = await asyncio.start_server(self.handle, self.host, self.port)
+            address = f'{self.host}:{server.sockets[0].getsockname()[1]}'
+        logger.info(f'Control API listening on {address}')
+        broadcast = asyncio.create_task(self.broadcast_rates())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            broadcast.cancel()
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername') or 'unix'
+        logger.info(f'Control client connected: {peer}')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.dispatch(line, writer)
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+            logger.info(f'Control client disconnected: {peer}')
+
+    async def dispatch(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.pop('id', None)
+            cmd = request.pop('cmd')
+            if cmd == 'subscribe':
+                self.subscribers.add(writer)
+                result = True
+            elif cmd == 'unsubscribe':
+                self.subscribers.discard(writer)
+                result = True
+            elif cmd in self.commands:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, lambda: self.commands[cmd](**request))
+            else:
+                raise ValueError(f'Unknown command: {cmd}')
+            return {'id': request_id, 'ok': True, 'result': result}
+        except Exception as e:
+            logger.error(f'Control command failed: {e}')
+            return {'id': request_id, 'ok': False, 'error': str(e)}
+
+    def status(self):
+        output = getattr(self.nctrl, 'output', None)
+        return {
+            'running': self.nctrl.running,
+            'params': self.nctrl.bmi_params,
+            'duration': getattr(output, 'duration', None),
+            'latency': getattr(output, 'latency', None),
+            'n_units': int(self.nctrl.n_units) if hasattr(self.nctrl, 'n_units') else None,
+            'startup': self.nctrl.startup.phases,
+            'epoch': self.nctrl.protocol_epoch() if getattr(self.nctrl, 'protocol', None) else None,
+        }
+
+    def start(self, **params):
+        if self.nctrl.running:
+            self.nctrl.stop_bmi()
+        self.nctrl.start_bmi(**params)
+        return self.status()
+
+    def protocol(self, epochs, name='remote', laser=None):
+        protocol = Protocol(epochs, name=name, laser=laser)
+        if self.nctrl.running:
+            self.nctrl.stop_bmi()
+        self.nctrl.start_protocol(protocol)
+        return self.status()
+
+    def stop(self):
+        if self.nctrl.running:
+            self.nctrl.stop_bmi()
+        return self.status()
+
+    def set_duration(self, value):
+        self.nctrl.output.set_duration(int(value))
+        return self.status()
+
+    def set_latency(self, value):
+        self.nctrl.output.set_latency(int(value))
+        return self.status()
+
+    def rates(self, interval):
+        """Per-unit firing rates (Hz) over the last `interval` seconds of FPGA time, from the spike ring."""
+        spikes = self.nctrl.bmi.spike_ring.latest(t_window=interval)
+        n_units = getattr(self.nctrl, 'n_units', 0) + 1
+        counts = np.bincount(spikes['spk_id'], minlength=n_units) if len(spikes) else np.zeros(n_units, dtype=int)
+        t = int(spikes['timestamp'][-1]) / 25000 if len(spikes) else None
+        return t, (counts / interval).round(3).tolist()
+
+    @staticmethod
+    def triggers():
+        """Triggers sent so far, summed over the output backends."""
+        return sum(value for (name, _), value in REGISTRY.snapshot().items() if name == 'nctrl_output_triggers_total')
+
+    async def broadcast_rates(self):
+        last_triggers, last_time = self.triggers(), time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            now, triggers = time.monotonic(), self.triggers()
+            trigger_rate = float(triggers - last_triggers) / (now - last_time)
+            last_triggers, last_time = triggers, now
+            if not self.subscribers or not self.nctrl.running:
+                continue
+            t, rates = self.rates(self.interval)
+            message = json.dumps({'event': 'rates', 't': t, 'rates': rates, 'trigger_rate': trigger_rate}).encode() + b'\n'
+            for writer in list(self.subscribers):
+                if writer.is_closing():
+                    self.subscribers.discard(writer)
+                else:
+                    writer.write(message)
+
+
+class ControlClient:
+    """
+    Blocking client of a ControlServer.
+
+    Example::
+
+        client = ControlClient('bmi-host', 7070)
+        client.call('start', decoder='dynamic', unit_id=3, target_fr=0.2)
+        client.call('subscribe')
+        for event in client.events():
+            print(event['rates'])
+
+    Args:
+        host (str, optional): Server address. Defaults to '127.0.0.1'.
+        port (int, optional): TCP port. Defaults to 7070.
+        unix_path (str, optional): Connect to this Unix socket instead.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 30.
+    """
+    def __init__(self, host='127.0.0.1', port=7070, unix_path=None, timeout=30.0):
+        if unix_path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix_path)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self.sock.settimeout(timeout)
+        self.file = self.sock.makefile('rwb')
+        self.pending_events = collections.deque()
+        self._next_id = 0
+
+    def _read(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Control server closed the connection')
+        return json.loads(line)
+
+    def call(self, cmd, **params):
+        """Send a command and return its result; raises RuntimeError if it failed."""
+        self._next_id += 1
+        self.file.write(json.dumps(dict(params, id=self._next_id, cmd=cmd)).encode() + b'\n')
+        self.file.flush()
+        while True:
+            message = self._read()
+            if 'event' in message:
+                self.pending_events.append(message)
+            elif message.get('id') == self._next_id:
+                if not message['ok']:
+                    raise RuntimeError(message['error'])
+                return message['result']
+
+    def events(self):
+        """Yield streamed events (after `call('subscribe')`)."""
+        while True:
+            yield self.pending_events.popleft() if self.pending_events else self._read()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
@@ -0,0 +1,205 @@
+import io
+import os
+import mmap
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NCTRLSNP'
+# magic, sequence number, FPGA timestamp, wall time, payload length, payload crc32
+SLOT_HEADER = struct.Struct('<8sQqdQI4x')
+
+
+def get_state(obj, prefix=''):
+    """
+    Copy the live state of a binner, decoder or buffer into a flat dict of arrays.
+
+    Objects list their state in a ``state_attrs`` class attribute; attributes
+    that have state_attrs themselves (e.g. a CircularBuffer) are nested with
+    dotted names. None values are left out.
+    """
+    state = {}
+    for attr in getattr(obj, 'state_attrs', ()):
+        value = getattr(obj, attr, None)
+        if value is None:
+            continue
+        if hasattr(value, 'state_attrs'):
+            state.update(get_state(value, f'{prefix}{attr}.'))
+        else:
+            state[f'{prefix}{attr}'] = np.array(value)
+    return state
+
+
+def set_state(obj, state, prefix=''):
+    """
+    Restore a state from `get_state` into an object built with the same configuration.
+
+    Raises
+    ------
+    ValueError
+        If an array's shape differs, i.e. the object was configured differently.
+    """
+    for attr in getattr(obj, 'state_attrs', ()):
+        current = getattr(obj, attr, None)
+        if hasattr(current, 'state_attrs'):
+            set_state(current, state, f'{prefix}{attr}.')
+            continue
+        key = f'{prefix}{attr}'
+        if key not in state:
+            setattr(obj, attr, None)
+        elif isinstance(current, np.ndarray):
+            if current.shape != state[key].shape:
+                raise ValueError(f'Snapshot {key} has shape {state[key].shape}, expected {current.shape}')
+            current[...] = state[key]
+        else:
+            setattr(obj, attr, state[key].item() if state[key].ndim == 0 else state[key].copy())
+
+
+class SnapshotStore:
+    """
+    Two alternating snapshot slots in a memory-mapped file.
+
+    A snapshot is written into the slot not holding the latest one, payload
+    first and header last, so a crash mid-write leaves the previous snapshot
+    intact; `read` returns the newest slot whose checksum matches. Payloads
+    are uncompressed .npz archives (no pickle) plus a JSON `meta` entry.
+
+    Parameters
+    ----------
+    filename : str
+        Snapshot file, created on the first write.
+    slot_size : int
+        Initial bytes per slot; the file is recreated larger if a snapshot
+        does not fit.
+    """
+    def __init__(self, filename, slot_size=1 << 20):
+        self.filename = filename
+        self.slot_size = slot_size
+        self._mmap = None
+        self._seq = 0
+
+    def _open(self, size):
+        if self._mmap is not None:
+            self._mmap.close()
+        self.slot_size = max(self.slot_size, size)
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        with open(self.filename, 'a+b') as f:
+            if os.fstat(f.fileno()).st_size < 2 * self.slot_size:
+                f.truncate(2 * self.slot_size)
+            self._mmap = mmap.mmap(f.fileno(), 2 * self.slot_size)
+
+    def write(self, state, timestamp, meta=None):
+        """Store `state` (dict of arrays) taken at FPGA time `timestamp`."""
+        buf = io.BytesIO()
+        np.savez(buf, meta=np.array(json.dumps(meta or {})), **state)
+        payload = buf.getvalue()
+        needed = SLOT_HEADER.size + len(payload)
+        if self._mmap is None or needed > self.slot_size:
+            if self._mmap is None and os.path.exists(self.filename):
+                self._seq = max((header[1] for header in self._headers()), default=0)
+            self._open(needed if self._mmap is None else 2 * needed)
+
+        self._seq += 1
+        offset = (self._seq % 2) * self.slot_size
+        self._mmap[offset + SLOT_HEADER.size:offset + needed] = payload
+        self._mmap[offset:offset + SLOT_HEADER.size] = SLOT_HEADER.pack(
+            MAGIC, self._seq, timestamp, time.time(), len(payload), zlib.crc32(payload))
+
+    def _headers(self):
+        """(offset, seq, timestamp, wall time, length, crc) of each slot with a valid magic."""
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return []
+        slot_size = len(data) // 2
+        headers = []
+        for offset in (0, slot_size):
+            if offset + SLOT_HEADER.size <= len(data):
+                magic, *fields = SLOT_HEADER.unpack_from(data, offset)
+                if magic == MAGIC:
+                    headers.append((offset, *fields))
+        return headers
+
+    def read(self):
+        """
+        Load the newest intact snapshot.
+
+        Returns
+        -------
+        tuple or None
+            (state, meta) where meta has the JSON metadata plus 'timestamp'
+            and 'wall_time'; None if there is no intact snapshot.
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        for offset, seq, timestamp, wall_time, length, crc in sorted(self._headers(), key=lambda h: -h[1]):
+            payload = data[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                continue
+            with np.load(io.BytesIO(payload), allow_pickle=False) as archive:
+                state = {name: archive[name] for name in archive.files}
+            meta = json.loads(str(state.pop('meta')))
+            meta.update(timestamp=timestamp, wall_time=wall_time)
+            return state, meta
+        return None
+
+    def clear(self):
+        """Remove the snapshot file."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class SnapshotWriter:
+    """
+    Writes snapshots handed over by the BMI loop from a background thread.
+
+    The loop only copies the state arrays (`get_state`) and calls `submit`;
+    serialization and the file write happen here. If the writer is still
+    busy, a newer snapshot replaces the pending one.
+
+    Parameters
+    ----------
+    store : SnapshotStore
+        Destination.
+    meta : dict
+        JSON metadata written with every snapshot (e.g. the BMI configuration).
+    """
+    def __init__(self, store, meta=None):
+        self.store = store
+        self.meta = meta or {}
+        self._pending = None
+        self._event = threading.Event()
+        self._thread = None
+
+    def submit(self, state, timestamp):
+        self._pending = (state, timestamp)
+        if self._thread is None:
+            # started lazily, in the process that runs the BMI loop
+            self._thread = threading.Thread(target=self._run, daemon=True, name='nctrl-snapshot')
+            self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            try:
+                self.store.write(*pending, meta=self.meta)
+            except Exception as e:
+                logger.error(f'Snapshot write failed: {e}')
@@ -0,0 +1,180 @@
+import os
+import glob
+import time
+import pickle
+import hashlib
+import logging
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_DIR = os.path.expanduser('~/.cache/nctrl/probe')
+PROBE_DIRS = ('.', os.path.expanduser('~/Work/probe-files'))
+DEVICE_PATTERNS = {
+    'fpga': '/dev/xillybus_*',
+    'laser': '/dev/ttyACM*',
+}
+
+
+class StartupTimer:
+    """
+    Wall-clock timing of named startup phases.
+
+    Each phase is logged when it ends and exported as the
+    ``nctrl_startup_seconds{phase=...}`` gauge; `report` gives the breakdown.
+    Phases may run concurrently from several threads.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = elapsed
+            REGISTRY.gauge('nctrl_startup_seconds', 'Duration of startup phases', {'phase': name}).set(elapsed)
+            logger.info(f'Startup: {name} took {elapsed * 1e3:.1f} ms')
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def report(self):
+        phases = '  '.join(f'{name} {elapsed * 1e3:.1f} ms' for name, elapsed in self.phases.items())
+        return f'Startup {self.total * 1e3:.1f} ms: {phases}'
+
+
+def discover_devices(patterns=DEVICE_PATTERNS):
+    """Glob all device patterns concurrently; returns {name: sorted paths}."""
+    with ThreadPoolExecutor(max_workers=len(patterns)) as pool:
+        futures = {name: pool.submit(glob.glob, pattern) for name, pattern in patterns.items()}
+        return {name: sorted(future.result()) for name, future in futures.items()}
+
+
+def find_probe_file(prbfile=None, directories=PROBE_DIRS):
+    """
+    Return `prbfile` if it exists, else the first .prb file in `directories` (searched concurrently).
+    """
+    if prbfile and os.path.isfile(prbfile):
+        return prbfile
+
+    def list_probes(directory):
+        try:
+            return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.prb'))
+        except OSError:
+            return []
+
+    with ThreadPoolExecutor(max_workers=len(directories)) as pool:
+        for probes in pool.map(list_probes, directories):
+            if probes:
+                return probes[0]
+    return None
+
+
+def load_probe(prbfile, cache_dir=PROBE_CACHE_DIR):
+    """
+    Load a spiketag probe, reusing a pickled copy keyed by path and mtime.
+
+    Parsing a .prb file executes it and builds the probe layout, which is
+    much slower than unpickling the result. If the probe cannot be pickled
+    the cache is skipped.
+    """
+    from spiketag.base import probe
+
+    stat = os.stat(prbfile)
+    key = hashlib.sha1(f'{os.path.abspath(prbfile)}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()
+    filename = os.path.join(cache_dir, f'{key}.pkl')
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+
+    prb = probe()
+    prb.load(prbfile)
+    tmp = f'{filename}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, 'wb') as f:
+            pickle.dump(prb, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+    except Exception as e:
+        logger.warning(f'Probe cache disabled for {prbfile}: {e}')
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+    return prb
+
+
+class Initializer:
+    """
+    Run startup steps on background threads, respecting dependencies.
+
+    Each step runs as a StartupTimer phase once the steps it depends on have
+    finished; if a dependency failed, the step fails without running. The
+    caller can poll `progress` (e.g. from a GUI timer) or block in `wait`,
+    which re-raises the first failure.
+
+    Args:
+        timer (StartupTimer): Timer that records each step as a phase.
+        max_workers (int, optional): Worker threads. Defaults to 4.
+    """
+    def __init__(self, timer, max_workers=4):
+        self.timer = timer
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nctrl-init')
+        self.futures = {}
+        self.running = set()
+
+    def submit(self, name, func, *args, after=()):
+        deps = [self.futures[dep] for dep in after]
+
+        def run():
+            for dep, future in zip(after, deps):
+                if future.exception() is not None:
+                    raise RuntimeError(f'{name} not started: {dep} failed') from future.exception()
+            self.running.add(name)
+            try:
+                with self.timer.phase(name):
+                    return func(*args)
+            finally:
+                self.running.discard(name)
+
+        self.futures[name] = self.pool.submit(run)
+        return self.futures[name]
+
+    def done(self, name=None):
+        """True if step `name` (or every step) finished without error."""
+        futures = [self.futures[name]] if name is not None else self.futures.values()
+        return all(f.done() and f.exception() is None for f in futures)
+
+    @property
+    def finished(self):
+        return all(f.done() for f in self.futures.values())
+
+    def errors(self):
+        return {name: f.exception() for name, f in self.futures.items() if f.done() and f.exception() is not None}
+
+    def progress(self):
+        """{name: 'pending' | 'running' | 'done' | 'failed'}"""
+        state = {}
+        for name, future in self.futures.items():
+            if future.done():
+                state[name] = 'failed' if future.exception() is not None else 'done'
+            else:
+                state[name] = 'running' if name in self.running else 'pending'
+        return state
+
+    def wait(self, timeout=None):
+        """Block until every step finished; re-raise the first failure in submission order."""
+        done, not_done = wait(self.futures.values(), timeout)
+        if not_done:
+            raise TimeoutError(f'Initialization not finished after {timeout} s: {self.progress()}')
+        self.pool.shutdown(wait=False)
+        for future in self.futures.values():
+            future.result()
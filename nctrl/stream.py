@@ -0,0 +1,164 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# one spiketag BMI record in fet.bin and on the FPGA's FET stream: 7 x int32
+FET_DTYPE = np.dtype([
+    ('frame_id', '<i4'),
+    ('group_id', '<i4'),
+    ('fet', '<i4', (4,)),
+    ('spike_id', '<i4'),
+])
+FET_DEVICE = '/dev/xillybus_fet_clf_32'
+
+COLUMNS = {'frame_id': np.int64, 'spike_id': np.int32, 'group_id': np.int32}
+
+
+class FetReader:
+    """
+    Reads FET records from the FPGA device or a fet.bin file without per-spike objects.
+
+    Each `read` fills a preallocated bytearray with ``readinto`` and returns
+    a FET_DTYPE view of the complete records in it, so a batch costs one
+    system call and no allocation. A partial record at the end of a read is
+    kept and completed by the next one. The view is only valid until the
+    next `read`; copy what must outlive it.
+
+    The live BMI loop reads the device and a replay reads a recorded
+    fet.bin through the same reader. Live, the bytes read are also written
+    to `tee` (spiketag's fet.bin), as spiketag's read_bmi does.
+
+    Args:
+        source (str or file): Device or file path, or an open binary file. A
+            buffered file is read with ``readinto1``, so a read never waits
+            for more than the records already available.
+        max_records (int, optional): Records per read. Defaults to 4096.
+        tee (int, optional): File descriptor receiving a copy of the raw stream.
+    """
+    def __init__(self, source=FET_DEVICE, max_records=4096, tee=None):
+        self.file = open(source, 'rb', buffering=0) if isinstance(source, str) else source
+        self.name = getattr(self.file, 'name', source)
+        self._readinto = getattr(self.file, 'readinto1', self.file.readinto)
+        self.tee = tee
+        self._buf = bytearray(max_records * FET_DTYPE.itemsize)
+        self._view = memoryview(self._buf)
+        self.records = np.frombuffer(self._buf, dtype=FET_DTYPE)
+        self._tail = (0, 0)  # byte range of a partial record left by the last read
+
+    def read(self):
+        """
+        Block until at least one complete record is available and return the records read.
+
+        Returns:
+            ndarray: FET_DTYPE view into the reader's buffer; empty at the end of a file.
+        """
+        start, stop = self._tail
+        n_bytes = stop - start
+        if n_bytes:
+            self._buf[:n_bytes] = self._buf[start:stop]
+        while True:
+            n = self._readinto(self._view[n_bytes:])
+            if not n:
+                if n_bytes:
+                    logger.warning(f'{self.name}: {n_bytes} trailing bytes of a partial FET record')
+                self._tail = (0, 0)
+                return self.records[:0]
+            if self.tee is not None:
+                os.write(self.tee, self._view[n_bytes:n_bytes + n])
+            n_bytes += n
+            n_records = n_bytes // FET_DTYPE.itemsize
+            if n_records:
+                self._tail = (n_records * FET_DTYPE.itemsize, n_bytes)
+                return self.records[:n_records]
+
+    def __iter__(self):
+        """Yield batches until the end of the file (forever on the device)."""
+        while True:
+            records = self.read()
+            if not len(records):
+                return
+            yield records
+
+    def close(self):
+        self.file.close()
+
+
+class SpikeRecord:
+    """
+    Per-spike view with the attributes of spiketag's BMI output, for spike-mode decoders.
+
+    The BMI loop reuses a single instance, updating it from each FET record.
+    """
+    __slots__ = ('timestamp', 'grp_id', 'spk_id')
+
+    def __init__(self, timestamp=0, grp_id=0, spk_id=0):
+        self.timestamp = timestamp
+        self.grp_id = grp_id
+        self.spk_id = spk_id
+
+
+class SpikeStream:
+    """
+    Chunked reader over the (frame_id, spike_id, group_id) columns of a session.
+
+    Columns are usually memory maps, so iterating touches one chunk of pages
+    at a time and peak memory is proportional to `chunk_size`.
+
+    Args:
+        columns (dict): Column name -> array-like of equal length.
+        chunk_size (int, optional): Rows per chunk. Defaults to 1 << 20.
+    """
+    def __init__(self, columns, chunk_size=1 << 20):
+        self.columns = columns
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.columns['frame_id'])
+
+    def chunks(self, chunk_size=None):
+        """Yield (start, {name: contiguous array}) for consecutive row ranges."""
+        chunk_size = chunk_size or self.chunk_size
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            yield start, {name: np.ascontiguousarray(self.columns[name][start:stop], dtype=dtype)
+                          for name, dtype in COLUMNS.items()}
+
+    @classmethod
+    def from_fet(cls, fetfile='./fet.bin', chunk_size=1 << 20):
+        """Stream a raw spiketag fet.bin file directly through a memory map."""
+        fet = np.memmap(fetfile, dtype=FET_DTYPE, mode='r')
+        return cls({name: fet[name] for name in COLUMNS}, chunk_size)
+
+    @classmethod
+    def from_model(cls, spike_file='./spktag/model.pd', cache=None, chunk_size=1 << 20):
+        """
+        Stream a spktag model.pd through its columnar copy in `cache`.
+
+        A pickle cannot be read in parts, so the first call deserializes it
+        once, writes each column to the cache and drops the DataFrame; later
+        calls only memory-map the columns. Without a cache the columns are
+        kept in memory.
+        """
+        if cache is not None and all(name in cache for name in COLUMNS):
+            return cls({name: cache.get(name) for name in COLUMNS}, chunk_size)
+        return cls(convert_model(spike_file, cache), chunk_size)
+
+
+def convert_model(spike_file, cache=None):
+    """
+    Convert a spktag model.pd pickle to per-column arrays.
+
+    Returns:
+        dict: Column name -> array (memory-mapped from `cache` if given).
+    """
+    import pandas as pd
+
+    df = pd.read_pickle(spike_file)
+    columns = {name: df[name].to_numpy(dtype=dtype) for name, dtype in COLUMNS.items()}
+    del df
+    if cache is not None:
+        for name in list(columns):
+            columns[name] = cache.put(name, columns.pop(name))
+    return columns
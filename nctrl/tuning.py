@@ -0,0 +1,115 @@
+import os
+import gc
+import time
+import logging
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ISOLATED_CPUS = '/sys/devices/system/cpu/isolated'
+
+
+def parse_cpus(spec):
+    """
+    Parse a Linux CPU list such as '2,3' or '2-5,8' into a set of CPU indices.
+
+    'isolated' reads the kernel's isolated CPUs (isolcpus= boot parameter).
+    """
+    if isinstance(spec, (set, list, tuple)):
+        return {int(cpu) for cpu in spec}
+    spec = str(spec).strip()
+    if spec == 'isolated':
+        try:
+            with open(ISOLATED_CPUS) as f:
+                spec = f.read().strip()
+        except OSError:
+            spec = ''
+        if not spec:
+            raise ValueError('No isolated CPUs; boot with isolcpus= or give a CPU list')
+    cpus = set()
+    for part in spec.split(','):
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+class RuntimeTuning:
+    """
+    Scheduling and garbage-collection settings for the BMI loop.
+
+    `apply` is called by the thread that runs the loop, at its start:
+
+    - CPU affinity: pins the calling thread (on Linux, affinity and scheduling
+      policy are per thread) to `cpus`, e.g. cores kept free of the GUI with
+      isolcpus=.
+    - SCHED_FIFO: with `fifo_priority`, the loop preempts normal threads. This
+      needs CAP_SYS_NICE or an rtprio limit; without it a warning is logged
+      and the loop runs with the normal policy.
+    - GC: everything allocated so far is collected and frozen, and automatic
+      collection is disabled, so cyclic garbage from other threads (e.g. Qt
+      and vispy objects of the GUI) cannot trigger a collection in the middle
+      of a decode. The loop instead calls `collect` every `gc_interval`
+      seconds at a safe point, halfway between two decodes. Those collect up
+      to `gc_generation`; every `gc_full_every`-th one is a full collection,
+      so cycles promoted to the oldest generation are still reclaimed over a
+      long session.
+
+    Args:
+        cpus (str or set of int, optional): CPUs for the loop, see `parse_cpus`. None keeps the affinity.
+        fifo_priority (int, optional): SCHED_FIFO priority (1-99). None keeps the normal policy.
+        gc_freeze (bool, optional): Freeze and disable the GC. Defaults to True.
+        gc_interval (float, optional): Seconds of FPGA time between scheduled collections. Defaults to 1.0.
+        gc_generation (int, optional): Oldest generation of scheduled collections. Defaults to 1.
+        gc_full_every (int, optional): Make every n-th scheduled collection a full one. Defaults to 60.
+    """
+    def __init__(self, cpus=None, fifo_priority=None, gc_freeze=True, gc_interval=1.0, gc_generation=1,
+                 gc_full_every=60):
+        self.cpus = parse_cpus(cpus) if cpus is not None else None
+        self.fifo_priority = fifo_priority
+        self.gc_freeze = gc_freeze
+        self.gc_interval = gc_interval
+        self.gc_generation = gc_generation
+        self.gc_full_every = gc_full_every
+        self._n_collections = 0
+        self.gc_pause = REGISTRY.histogram('nctrl_gc_pause_seconds', 'Scheduled GC collections in the BMI loop',
+                                           buckets=(1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2))
+
+    def apply(self):
+        """Apply the settings to the calling thread and the interpreter's GC."""
+        if self.cpus is not None:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+                logger.info(f'BMI loop pinned to CPUs {sorted(self.cpus)}')
+            except (AttributeError, OSError) as e:
+                logger.warning(f'CPU affinity not set: {e}')
+        if self.fifo_priority is not None:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.fifo_priority))
+                logger.info(f'BMI loop running SCHED_FIFO priority {self.fifo_priority}')
+            except (AttributeError, OSError) as e:
+                logger.warning(f'SCHED_FIFO not set (needs CAP_SYS_NICE or an rtprio limit): {e}')
+        if self.gc_freeze:
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+            logger.info(f'GC frozen ({gc.get_freeze_count()} objects), collecting every {self.gc_interval} s')
+        return self
+
+    def collect(self):
+        """Scheduled collection (full every `gc_full_every` calls); call at a safe point of the loop."""
+        self._n_collections += 1
+        generation = 2 if self._n_collections % self.gc_full_every == 0 else self.gc_generation
+        start = time.perf_counter()
+        gc.collect(generation)
+        self.gc_pause.observe(time.perf_counter() - start)
+
+    def restore(self):
+        """Re-enable automatic GC (affinity and scheduling policy are left as they are)."""
+        if self.gc_freeze:
+            gc.unfreeze()
+            gc.enable()
+
+    def __repr__(self):
+        cpus = sorted(self.cpus) if self.cpus is not None else None
+        return f'RuntimeTuning(cpus={cpus}, fifo_priority={self.fifo_priority}, gc_freeze={self.gc_freeze})'
@@ -1,45 +1,196 @@
+import contextlib
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from ipywidgets import interact, SelectionSlider, IntSlider, FloatSlider
 
-try:
-    from spiketag.core import CCG
-except ImportError:
-    print("spiketag module not found. Some features will be disabled.")
+from .ccg import autocorrelograms, crosscorrelograms
+from .cache import SessionCache
+from .stream import SpikeStream
+
+SMALL_ARRAYS = ('meta', 'unit_offset', 'spike_group', 'spike_fr')
+SESSION_ARRAYS = SMALL_ARRAYS + ('spk_time', 'spk_id', 'spike_frame', 'spike_time')
+MAX_CACHED_BINS = 1 << 26
 
 class Unit():
     def __init__(self):
         self.bin_size = 0.1
         self.B = 10
 
-    def load(self, spike_file='./spktag/model.pd'):
+    def load(self, spike_file='./spktag/model.pd', n_jobs=None, cache=True, chunk_size=1 << 20):
+        """
+        Load a spktag model file (model.pd) or a raw fet.bin.
+
+        The session is read in streaming passes of `chunk_size` spikes, so
+        peak memory is proportional to the chunk size (plus one unpickling of
+        model.pd the first time it is seen). Derived arrays are stored in a
+        SessionCache keyed by the file's content; repeat loads memory-map them.
+        `cache` is True for the shared cache in ~/.cache/nctrl/sessions, a
+        cache directory of its own, or False to keep everything in memory.
+        """
         self.spike_file = spike_file
-        df = pd.read_pickle(self.spike_file)
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.cache = None
+        if cache:
+            try:
+                self.cache = SessionCache(spike_file) if cache is True else SessionCache(spike_file, cache)
+            except OSError as e:
+                print(f"Session cache disabled: {e}")
+
+        if self.cache is not None and all(name in self.cache for name in SESSION_ARRAYS):
+            session = {name: self.cache.get(name) for name in SESSION_ARRAYS}
+        else:
+            if spike_file.endswith('.bin'):
+                stream = SpikeStream.from_fet(spike_file, chunk_size)
+            else:
+                stream = SpikeStream.from_model(spike_file, self.cache, chunk_size)
+            session = self._build_session(stream)
 
-        self.start_time = df['frame_id'].iloc[0] / 25000
-        self.end_time = df['frame_id'].iloc[-1] / 25000
+        self.start_time, self.end_time, n_unit = session['meta']
         self.duration = self.end_time - self.start_time
+        self.n_unit = n_unit = int(n_unit)
 
-        n_unit = int(df['spike_id'].max())
-        self.n_unit = n_unit
+        self.spk_time = session['spk_time']
+        self.spk_id = session['spk_id']
+        self.spike_group = session['spike_group']
+        self.spike_fr = session['spike_fr']
 
-        in_unit = df['spike_id'] > 0
-        self.spk_time = df['frame_id'][in_unit].to_numpy().astype(int)
-        self.spk_id = df['spike_id'][in_unit].to_numpy().astype(int) - 1
-        self.ccg = CCG(self.spk_time, self.spk_id)
+        # per-unit views into arrays sorted by (unit, time)
+        self.unit_offset = offset = session['unit_offset']
+        self.spike_frame = [session['spike_frame'][offset[i]:offset[i + 1]] for i in range(n_unit)]
+        self.spike_time = np.empty(n_unit, dtype=object)
+        for i_unit in range(n_unit):
+            self.spike_time[i_unit] = session['spike_time'][offset[i_unit]:offset[i_unit + 1]]
 
-        self.spike_time = np.zeros(n_unit, dtype=object)
-        self.spike_fr = np.zeros(n_unit)
-        self.spike_group = np.zeros(n_unit, dtype=int)
+        # autocorrelograms (1 ms bins, +-25 ms) are computed once per session; pairwise CCGs on demand
+        self.acg = self._cached('acg_25_50', lambda: autocorrelograms(self.spike_frame, n_jobs=n_jobs))
 
-        for i_unit in range(n_unit):
-            in_unit = df['spike_id'] == (i_unit + 1)
-            if np.any(in_unit):
-                self.spike_group[i_unit] = df['group_id'][np.argwhere(in_unit.to_numpy())[0, 0]]
-                self.spike_time[i_unit] = df['frame_id'][in_unit].to_numpy() / 25000
-                self.spike_fr[i_unit] = np.sum(in_unit) / self.duration
+    def _build_session(self, stream):
+        # pass 1: session range, spikes and first group per unit, sort order
+        n_spike = np.zeros(0, dtype=np.int64)
+        spike_group = np.zeros(0, dtype=np.int64)
+        start_frame = end_frame = None
+        is_sorted = True
+        for _, chunk in stream.chunks():
+            frame_id, spike_id = chunk['frame_id'], chunk['spike_id']
+            if start_frame is None:
+                start_frame = frame_id[0]
+            is_sorted &= bool(end_frame is None or end_frame <= frame_id[0]) and bool(np.all(np.diff(frame_id) >= 0))
+            end_frame = frame_id[-1]
+
+            n = np.bincount(spike_id[spike_id > 0] - 1)
+            if len(n) > len(n_spike):
+                n_spike = np.pad(n_spike, (0, len(n) - len(n_spike)))
+                spike_group = np.pad(spike_group, (0, len(n) - len(spike_group)))
+            new = np.flatnonzero((n > 0) & (n_spike[:len(n)] == 0))
+            if len(new):
+                unit_id, first = np.unique(spike_id, return_index=True)
+                spike_group[new] = chunk['group_id'][first[np.searchsorted(unit_id, new + 1)]]
+            n_spike[:len(n)] += n
+
+        n_unit = len(n_spike)
+        n_total = int(n_spike.sum())
+        offset = np.concatenate(([0], np.cumsum(n_spike)))
+        start_time, end_time = start_frame / 25000, end_frame / 25000
+
+        # pass 2: scatter in-unit spikes into (unit, time) order
+        with contextlib.ExitStack() as stack:
+            def create(name, dtype):
+                if self.cache is None:
+                    return np.empty(n_total, dtype=dtype)
+                return stack.enter_context(self.cache.open(name, (n_total,), dtype))
+
+            spk_time = create('spk_time', np.int64)
+            spk_id = create('spk_id', np.int64)
+            spike_frame = create('spike_frame', np.int64)
+            spike_time = create('spike_time', np.float64)
+
+            write = offset[:-1].copy()
+            i_spk = 0
+            for _, chunk in stream.chunks():
+                in_unit = chunk['spike_id'] > 0
+                frame_id = chunk['frame_id'][in_unit]
+                unit = chunk['spike_id'][in_unit].astype(np.int64) - 1
+                spk_time[i_spk:i_spk + len(unit)] = frame_id
+                spk_id[i_spk:i_spk + len(unit)] = unit
+                i_spk += len(unit)
+
+                order = np.argsort(unit, kind='stable')
+                n = np.bincount(unit, minlength=n_unit)
+                rank = np.arange(len(unit)) - np.repeat(np.cumsum(n) - n, n)
+                spike_frame[write[unit[order]] + rank] = frame_id[order]
+                write += n
+
+            if not is_sorted:
+                for i_unit in range(n_unit):
+                    spike_frame[offset[i_unit]:offset[i_unit + 1]].sort()
+            for start in range(0, n_total, stream.chunk_size):
+                stop = min(start + stream.chunk_size, n_total)
+                spike_time[start:stop] = spike_frame[start:stop] / 25000
+
+            session = {'spk_time': spk_time, 'spk_id': spk_id, 'spike_frame': spike_frame, 'spike_time': spike_time}
+
+        session.update({
+            'meta': np.array([start_time, end_time, n_unit], dtype=np.float64),
+            'unit_offset': offset,
+            'spike_group': spike_group,
+            'spike_fr': n_spike / (end_time - start_time),
+        })
+        if self.cache is not None:
+            for name in SESSION_ARRAYS:
+                session[name] = self.cache.put(name, session[name]) if name in SMALL_ARRAYS else self.cache.get(name)
+        return session
+
+    def _cached(self, name, func):
+        if self.cache is None:
+            return func()
+        return self.cache.get_or_compute(name, func)
+
+    def spike_count(self, bin_size):
+        """
+        Spike counts of all units on the session grid np.arange(start_time, end_time, bin_size).
+
+        Returns an (n_unit, n_bin) array; it is cached when it has at most MAX_CACHED_BINS elements.
+        """
+        time_bin = np.arange(self.start_time, self.end_time, bin_size)
+        n_bin = len(time_bin) - 1
+
+        def count():
+            counts = np.zeros((self.n_unit, n_bin), dtype=np.int32)
+            for i_unit, spike_time in enumerate(self.spike_time):
+                for start in range(0, len(spike_time), self.chunk_size):
+                    t = spike_time[start:start + self.chunk_size]
+                    # same edges and right-closed last bin as np.histogram
+                    idx = np.searchsorted(time_bin, t, side='right') - 1
+                    idx[t == time_bin[-1]] = n_bin - 1
+                    counts[i_unit] += np.bincount(idx[(idx >= 0) & (idx < n_bin)], minlength=n_bin).astype(np.int32)
+            return counts
+
+        if self.n_unit * n_bin > MAX_CACHED_BINS:
+            return count()
+        return self._cached(f'count_{bin_size:g}', count)
+
+    def spike_conv(self, bin_size, B):
+        """Moving sum of B bins over spike_count(bin_size), as np.convolve(..., np.ones(B), 'same') per unit."""
+        counts = self.spike_count(bin_size)
+        n_bin = counts.shape[1]
+        cumsum = np.zeros((self.n_unit, n_bin + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=cumsum[:, 1:])
+        i = np.arange(n_bin)
+        return cumsum[:, np.minimum(i + (B - 1) // 2 + 1, n_bin)] - cumsum[:, np.maximum(i - B // 2, 0)]
+
+    def crosscorrelogram(self, pairs=None, bin_size=25, window_bins=50):
+        """
+        Cross-correlograms of unit pairs (1-based unit ids), computed on demand.
+
+        Returns a dict (unit_i, unit_j) -> counts per lag bin; positive lags mean unit_j fires after unit_i.
+        """
+        if pairs is None:
+            pairs = [(i + 1, j + 1) for i in range(self.n_unit) for j in range(i + 1, self.n_unit)]
+        ccg = crosscorrelograms(self.spike_frame, [(i - 1, j - 1) for i, j in pairs], n_jobs=self.n_jobs,
+                                bin_size=bin_size, window_bins=window_bins)
+        return {pair: ccg[(pair[0] - 1, pair[1] - 1)] for pair in pairs}
     
     def load_spkwav(self, spkwav_file='./spk_wav.bin'):
         self.spkwav_file = spkwav_file
@@ -55,6 +206,7 @@ class Unit():
         # col1: fr, col2: autocorrelogram, col3: temporal pattern
 
         self.time_bin = np.arange(self.start_time, self.end_time, self.bin_size)
+        all_spike_conv = self.spike_conv(self.bin_size, self.B)
 
         for i_unit in range(self.n_unit):
             gs_unit = gridspec.GridSpecFromSubplotSpec(2, 2, subplot_spec=gs[i_unit], wspace=0.1, hspace=0.1, height_ratios=[1, 1])
@@ -63,8 +215,7 @@ class Unit():
             ax3 = f.add_subplot(gs_unit[1, :])
 
             # firing rate plot
-            spike_hist = np.histogram(self.spike_time[i_unit], self.time_bin)[0]
-            spike_conv = np.convolve(spike_hist, np.ones(self.B), 'same')
+            spike_conv = all_spike_conv[i_unit]
             ax1.hist(spike_conv, bins=np.arange(max(spike_conv)+1), color='black')
             ax1.set_xlim(0, max(spike_conv))
 
@@ -78,7 +229,7 @@ class Unit():
             ax1.set_title(f'Unit {i_unit + 1} ({self.spike_fr[i_unit]:.2f} Hz)')
 
             # autocorrelogram
-            ax2.bar(np.arange(-25, 25), self.ccg[i_unit, i_unit], color='black', width=1)
+            ax2.bar(np.arange(-25, 25), self.acg[i_unit], color='black', width=1)
             ax2.set_xlim(-25, 25)
             if i_unit == 0:
                 ax2.set_title('autocorrelogram')
@@ -98,8 +249,15 @@ class Unit():
 
         def update(bin_size, B, spike_count, window_size, start_time):
             end_time = start_time + window_size
-            time_bin = np.arange(start_time, end_time, bin_size)
-            spike_hist = np.histogram(self.spike_time[i_unit], time_bin)[0]
+            n_session_bin = int((self.end_time - self.start_time) / bin_size)
+            if self.n_unit * n_session_bin <= MAX_CACHED_BINS:
+                # slice the cached session counts, snapping the window to the session grid
+                i_start = int(round((start_time - self.start_time) / bin_size))
+                spike_hist = self.spike_count(bin_size)[i_unit, i_start:i_start + int(round(window_size / bin_size)) - 1]
+                time_bin = self.start_time + np.arange(i_start, i_start + len(spike_hist) + 1) * bin_size
+            else:
+                time_bin = np.arange(start_time, end_time, bin_size)
+                spike_hist = np.histogram(self.spike_time[i_unit], time_bin)[0]
             spike_conv = np.convolve(spike_hist, np.ones(B), 'same')
 
             t = (time_bin[1:] + time_bin[:-1]) / 2
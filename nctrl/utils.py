@@ -1,9 +1,13 @@
+import os
+import mmap
 import logging
 import numpy as np
 import subprocess
 
 from spiketag.utils.utils import EventEmitter
 
+from .metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
 def kill_existing_processes():
@@ -42,8 +46,8 @@ class CircularBuffer:
 
     Methods
     -------
-    __call__()
-        Returns the buffer contents in chronological order
+    __call__(out=None)
+        Returns the buffer contents in chronological order, into `out` if given
     __getitem__(index)
         Access buffer elements relative to current position
     __setitem__(index, value) 
@@ -53,6 +57,8 @@ class CircularBuffer:
     step(shift=-1)
         Rotate buffer and zero the new positions
     """
+    state_attrs = ('buffer', 'index', 'counter', 'ready')  # see nctrl.snapshot
+
     def __init__(self, size):
         self.buffer = np.zeros(size, dtype=np.int16)
         self.length = size[0] if isinstance(size, tuple) else size
@@ -61,10 +67,10 @@ class CircularBuffer:
         self.counter = 0
         self.ready = False
         
-    def __call__(self):
+    def __call__(self, out=None):
         if self.index == self.length - 1:
             return self.buffer
-        result = np.empty_like(self.buffer)
+        result = np.empty_like(self.buffer) if out is None else out
         np.concatenate((self.buffer[self.index+1:], self.buffer[:self.index+1]), out=result)
         return result
 
@@ -115,6 +121,15 @@ class CircularBuffer:
             Number of positions to rotate buffer. Positive steps move forward,
             negative steps move backward.
         """
+        if steps == 1:
+            # common case: one new bin, skip building the index array
+            self.index = (self.index + 1) % self.length
+            self.buffer[self.index] = 0
+            if not self.ready:
+                self.counter += 1
+                self.ready = self.counter >= self.length
+            return
+
         start_idx = self.index + (1 if steps > 0 else -1)
         end_idx = self.index + steps + (1 if steps > 0 else -1)
         step = 1 if steps > 0 else -1
@@ -130,6 +145,359 @@ class CircularBuffer:
                 self.ready = True
 
 
+SPIKE_DTYPE = np.dtype([('timestamp', '<i8'), ('grp_id', '<i4'), ('spk_id', '<i4')])
+
+
+class SpikeRing:
+    """
+    Ring of the most recent spikes in a preallocated structured array.
+
+    The BMI loop appends every spike; views read the latest spikes without
+    touching the feature file on disk. The ring and its write counter live
+    in an anonymous shared mmap, so the GUI can read it while a forked BMI
+    process writes it. There is a single writer and no lock: readers copy
+    the requested range and drop entries that may have been overwritten
+    during the copy.
+
+    Parameters
+    ----------
+    size : int
+        Number of spikes kept.
+
+    Attributes
+    ----------
+    buffer : ndarray
+        Structured array of SPIKE_DTYPE, indexed by write count modulo size.
+    """
+    def __init__(self, size=20000):
+        self.size = size
+        self._mm = mmap.mmap(-1, 8 + size * SPIKE_DTYPE.itemsize)
+        self._count = np.frombuffer(self._mm, dtype=np.int64, count=1)
+        self.buffer = np.frombuffer(self._mm, dtype=SPIKE_DTYPE, count=size, offset=8)
+        self._timestamp = self.buffer['timestamp']
+        self._grp_id = self.buffer['grp_id']
+        self._spk_id = self.buffer['spk_id']
+
+    def append(self, timestamp, grp_id, spk_id):
+        # the count is read back from the shared map, so a restarted (forked) BMI process continues it
+        count = int(self._count[0])
+        i = count % self.size
+        self._timestamp[i] = timestamp
+        self._grp_id[i] = grp_id
+        self._spk_id[i] = spk_id
+        self._count[0] = count + 1  # publish after the entry is written
+
+    def extend(self, timestamp, grp_id, spk_id):
+        """Append a batch of spikes given as equal-length arrays."""
+        count = int(self._count[0])
+        n = len(timestamp)
+        if n > self.size:
+            timestamp, grp_id, spk_id = timestamp[-self.size:], grp_id[-self.size:], spk_id[-self.size:]
+            count += n - self.size
+            n = self.size
+        i = count % self.size
+        first = min(n, self.size - i)
+        for column, values in ((self._timestamp, timestamp), (self._grp_id, grp_id), (self._spk_id, spk_id)):
+            column[i:i + first] = values[:first]
+            column[:n - first] = values[first:]
+        self._count[0] = count + n
+
+    @property
+    def count(self):
+        """Total number of spikes appended."""
+        return int(self._count[0])
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def latest(self, n=None, t_window=None, sampling_rate=25000):
+        """
+        Copy of the most recent spikes in chronological order.
+
+        Parameters
+        ----------
+        n : int, optional
+            Maximum number of spikes; defaults to the ring size.
+        t_window : float, optional
+            Only spikes within this many seconds of the newest one.
+
+        Returns
+        -------
+        ndarray
+            Structured array of SPIKE_DTYPE.
+        """
+        end = self.count
+        n = min(n or self.size, end, self.size)
+        seq = np.arange(end - n, end)
+        spikes = self.buffer[seq % self.size]
+        # the writer may have lapped the copied range meanwhile
+        spikes = spikes[seq > self.count - self.size]
+        if t_window is not None and len(spikes):
+            spikes = spikes[spikes['timestamp'] >= spikes['timestamp'][-1] - t_window * sampling_rate]
+        return spikes
+
+
+class RatePyramid:
+    """
+    Multi-resolution spike count history of all units, for zoomable firing-rate views.
+
+    Level 0 holds counts in `bin_size` bins; each level above holds the sums
+    of pairs of bins of the level below, so level k has bins of
+    bin_size * 2**k. Every level is a ring of `n_bins` bins, so memory is
+    bounded while the coarse levels reach back over the whole session:
+    0.1 s bins, 1024 bins and 16 levels cover 0.1 s to 38 days. A completed
+    bin cascades up at most once per level and every other bin stops at the
+    first level, so updates are O(1) amortized.
+
+    Like SpikeRing, the rings, their write counters, the open bin and its
+    counts live in an anonymous shared mmap: the BMI loop writes, the GUI
+    queries, and a restarted (forked) BMI process continues where the
+    previous one stopped.
+
+    Parameters
+    ----------
+    n_units : int
+        Number of unit IDs, including the noise unit 0.
+    bin_size : float
+        Finest bin size in seconds.
+    n_levels : int
+        Number of levels.
+    n_bins : int
+        Bins kept per level.
+    sampling_rate : int
+        Timestamp rate in Hz.
+    """
+    def __init__(self, n_units, bin_size=0.1, n_levels=16, n_bins=1024, sampling_rate=25000):
+        self.n_units = n_units
+        self.bin_size = bin_size
+        self.n_levels = n_levels
+        self.n_bins = n_bins
+        self.time_to_bin = 1.0 / (bin_size * sampling_rate)
+        n_header = n_levels + 2
+        self._mm = mmap.mmap(-1, 8 * n_header + 4 * (n_levels * n_bins + 1) * n_units)
+        # bins written per level, the absolute index of the first level 0 bin, then of the open bin (-1: none yet)
+        self._header = np.frombuffer(self._mm, dtype=np.int64, count=n_header)
+        self._written = self._header[:n_levels]
+        self._header[-1] = -1
+        # counts of the bin being filled, then the levels
+        self._open = np.frombuffer(self._mm, dtype=np.int32, count=n_units, offset=8 * n_header)
+        self.counts = np.frombuffer(self._mm, dtype=np.int32,
+                                    offset=8 * n_header + 4 * n_units).reshape(n_levels, n_bins, n_units)
+        self._bin = None  # writer-side copy of the open bin, valid in the process `_pid`
+        self._pid = os.getpid()
+
+    def input(self, timestamp, spk_id):
+        """Count one spike."""
+        current_bin = int(timestamp * self.time_to_bin)
+        if current_bin != self._bin:
+            self._advance(current_bin)
+        self._open[spk_id] += 1
+
+    def input_batch(self, timestamps, spk_ids):
+        """Count a batch of spikes with non-decreasing timestamps."""
+        if not len(timestamps):
+            return
+        bins = (timestamps * self.time_to_bin).astype(np.int64)
+        starts = np.flatnonzero(bins[1:] != bins[:-1]) + 1
+        for start, stop in zip(np.r_[0, starts], np.r_[starts, len(bins)]):
+            if bins[start] != self._bin:
+                self._advance(int(bins[start]))
+            self._open += np.bincount(spk_ids[start:stop], minlength=self.n_units).astype(np.int32)
+
+    def _advance(self, current_bin):
+        if self._pid != os.getpid():
+            # a new BMI process: continue the open bin the previous one left in the shared header
+            self._pid = os.getpid()
+            self._bin = None if self._header[-1] < 0 else int(self._header[-1])
+            if current_bin == self._bin:
+                return
+        if self._bin is None:
+            self._header[-2] = current_bin
+        else:
+            # close the open bin and any empty bins since; after a clock reset just the open one
+            self._push(0, self._open)
+            self._open[:] = 0
+            self._push_empty(0, current_bin - self._bin - 1)
+        self._bin = current_bin
+        self._header[-1] = current_bin
+
+    def _push(self, level, row):
+        i = int(self._written[level])
+        self.counts[level, i % self.n_bins] = row
+        self._written[level] = i + 1  # publish after the bin is written
+        if i % 2 == 1 and level + 1 < self.n_levels:
+            self._push(level + 1, self.counts[level, (i - 1) % self.n_bins] + row)
+
+    def _push_empty(self, level, n):
+        """Push `n` empty bins at once, so a pause in the spike stream costs O(levels * n_bins)."""
+        if n > 0 and self._written[level] % 2 == 1:
+            self._push(level, np.zeros(self.n_units, dtype=np.int32))  # completes the pending pair
+            n -= 1
+        if n <= 0:
+            return
+        i = int(self._written[level])
+        self.counts[level, np.arange(i + n - min(n, self.n_bins), i + n) % self.n_bins] = 0
+        self._written[level] = i + n
+        if level + 1 < self.n_levels:
+            self._push_empty(level + 1, n // 2)
+
+    def level_bin_size(self, level):
+        return self.bin_size * 2 ** level
+
+    def select_level(self, t_start, t_end, max_points=1000):
+        """Finest level with at most `max_points` bins in [t_start, t_end) that still holds t_start."""
+        t0 = self._header[-2] * self.bin_size
+        for level in range(self.n_levels):
+            size = self.level_bin_size(level)
+            first = max(int(self._written[level]) - self.n_bins, 0)
+            if (t_end - t_start) / size <= max_points and t0 + first * size <= t_start:
+                return level
+        return self.n_levels - 1
+
+    def query(self, t_start=None, t_end=None, units=None, max_points=1000):
+        """
+        Firing rates over a time range at the finest level that fits.
+
+        Parameters
+        ----------
+        t_start, t_end : float, optional
+            Range in seconds of FPGA time; defaults to the whole session.
+        units : int or list of int, optional
+            Units to return; all by default.
+        max_points : int
+            Maximum number of bins returned.
+
+        Returns
+        -------
+        t : ndarray
+            Bin start times in seconds.
+        rates : ndarray
+            Rates in Hz, shape (len(t), n_units) or (len(t),) for a single unit.
+        """
+        t0 = self._header[-2] * self.bin_size
+        written = self._written.copy()
+        t_last = t0 + written[0] * self.bin_size
+        t_start = t0 if t_start is None else max(t_start, t0)
+        t_end = t_last if t_end is None else min(t_end, t_last)
+        units = slice(None) if units is None else units
+        if t_end <= t_start:
+            return np.zeros(0), np.zeros((0, self.n_units))[:, units]
+        level = self.select_level(t_start, t_end, max_points)
+        size = self.level_bin_size(level)
+        end = int(written[level])
+        first = max(end - self.n_bins, int((t_start - t0) // size))
+        last = min(end, int(np.ceil((t_end - t0) / size)))
+        seq = np.arange(first, max(last, first))
+        rates = self.counts[level, seq % self.n_bins][:, units] / size
+        keep = seq >= int(self._written[level]) - self.n_bins  # drop bins overwritten during the copy
+        return t0 + seq[keep] * size, rates[keep]
+
+
+class SpikeCountSketch:
+    """
+    Constant-memory estimate of the trigger rate at every spike count threshold.
+
+    Fed with the B-bin spike count of every unit once per bin, the sketch
+    replays the FrThreshold trigger rule (trigger on entering the threshold
+    region, then once every B bins while staying in it) for all thresholds
+    0..max_count at once, in both directions, and keeps exponentially
+    weighted trigger counts. Older bins are down-weighted with time constant
+    `tau_bins`; instead of decaying every entry each bin, new entries get a
+    growing weight that is renormalized occasionally.
+
+    The state lives in an anonymous shared mmap, so a GUI can read it while
+    a forked BMI process writes it. Reads are not synchronized; a reader may
+    see a partially applied update, which is harmless for display.
+
+    Parameters
+    ----------
+    n_id : int
+        Number of units (rows).
+    B_bins : int
+        Decoder window in bins, i.e. the re-trigger period.
+    max_count : int
+        Highest threshold tracked; counts above it are clipped.
+    tau_bins : float
+        Forgetting time constant in bins.
+    """
+    def __init__(self, n_id, B_bins, max_count=127, tau_bins=6000):
+        self.n_id = n_id
+        self.B = B_bins
+        self.max_count = max_count
+        self.growth = np.exp(1.0 / tau_bins)
+        self.threshold = np.arange(max_count + 1)
+        # [0]: direction 'up' (count >= threshold), [1]: 'down' (count <= threshold)
+        shape = (2, n_id, max_count + 1)
+        self._mm = mmap.mmap(-1, (np.prod(shape) + 2) * 8)
+        data = np.frombuffer(self._mm, dtype=np.float64)
+        self.fires = data[:-2].reshape(shape)
+        self._state = data[-2:]  # total weight, weight of the next entry
+        self._state[1] = 1.0
+        self._inside = np.zeros(shape, dtype=bool)
+        self._fire = np.zeros(shape, dtype=bool)
+        self._cycle = np.zeros(shape, dtype=np.int16)  # 1..B within the trigger cycle, 0 when outside
+
+    def update(self, count):
+        """Add one bin of windowed spike counts, shape (n_id,) or scalar."""
+        count = np.asarray(count).reshape(-1, 1)
+        np.greater_equal(count, self.threshold, out=self._inside[0])
+        np.less_equal(count, self.threshold, out=self._inside[1])
+        cycle = self._cycle
+        cycle += 1
+        cycle *= self._inside
+        np.greater(cycle, self.B, out=self._fire)
+        cycle[self._fire] = 1  # wrap B + 1 -> 1
+        np.equal(cycle, 1, out=self._fire)
+        np.add(self.fires, self._state[1], out=self.fires, where=self._fire)
+
+        self._state[0] += self._state[1]
+        self._state[1] *= self.growth
+        if self._state[1] > 1e100:
+            self.fires *= 1.0 / self._state[1]
+            self._state *= 1.0 / self._state[1]
+
+    @property
+    def n_bins(self):
+        """Effective number of bins in the sketch."""
+        return self._state[0] / self._state[1] * self.growth
+
+    def expected_rate(self, bin_size, i=0, direction='up'):
+        """
+        Expected trigger rate (Hz) at every threshold 0..max_count.
+
+        Parameters
+        ----------
+        bin_size : float
+            Bin size in seconds.
+        i : int
+            Row (unit) index.
+        direction : str
+            'up' triggers on count >= threshold, 'down' on count <= threshold.
+
+        Returns
+        -------
+        threshold : ndarray
+        rate : ndarray
+        """
+        total = self._state[0]
+        fires = self.fires[0 if direction == 'up' else 1, i]
+        rate = fires / (total * bin_size) if total > 0 else np.zeros(len(self.threshold))
+        return self.threshold, rate
+
+    def recommend(self, target_fr, bin_size, i=0, direction='up'):
+        """
+        Threshold whose expected trigger rate still reaches `target_fr`.
+
+        Mirrors DynamicFrThreshold: the highest such threshold for 'up', the
+        lowest one for 'down'. Returns None while no threshold reaches the target.
+        """
+        threshold, rate = self.expected_rate(bin_size, i, direction)
+        reached = threshold[(rate >= target_fr) & (rate > 0)]
+        if not len(reached):
+            return None
+        return int(reached.max() if direction == 'up' else reached.min())
+
+
 class FastBinner(EventEmitter):
     """
     A fast binning implementation for neural spike data using circular buffers.
@@ -150,6 +518,10 @@ class FastBinner(EventEmitter):
         If specified, only track spikes from this unit ID
     sampling_rate : int, optional
         Recording sampling rate in Hz, defaults to 25000
+    name : str, optional
+        Label of this binner in the metrics registry, defaults to 'binner'
+    sketch : SpikeCountSketch, optional
+        Fed with the windowed spike count of every unit once per bin
 
     Attributes
     ----------
@@ -160,7 +532,10 @@ class FastBinner(EventEmitter):
     last_bin : int
         Index of the last updated time bin
     """
-    def __init__(self, bin_size, n_id, n_bin, id=None, sampling_rate=25000, exclude_first_unit=False):
+    state_attrs = ('count_vec', 'last_bin')  # see nctrl.snapshot
+
+    def __init__(self, bin_size, n_id, n_bin, id=None, sampling_rate=25000, exclude_first_unit=False, name='binner',
+                 sketch=None):
         super().__init__()
         self.bin_size = bin_size
         self.N = n_id
@@ -168,9 +543,12 @@ class FastBinner(EventEmitter):
         self.id = int(id) if id is not None else None
         buffer_size = (self.B, self.N) if self.id is None else self.B
         self.count_vec = CircularBuffer(size=buffer_size)
+        self._X = np.empty_like(self.count_vec.buffer)  # reused by the decode event, no allocation per bin
         self.time_to_bin = 1.0 / (self.bin_size * sampling_rate)
         self.last_bin = 0
         self.exclude_first_unit = exclude_first_unit
+        self.sketch = sketch
+        self.bins_total = REGISTRY.counter('nctrl_binner_bins_total', 'Bins completed by the binner', {'binner': name})
     
     def input(self, bmi_output, type='individual_spike'):
         """
@@ -185,15 +563,58 @@ class FastBinner(EventEmitter):
         spk_id = int(bmi_output.spk_id)
         
         if current_bin != self.last_bin:
-            self.emit('decode', X=self.output)
-            self.count_vec.step(steps=current_bin - self.last_bin)
-            self.last_bin = current_bin
+            self._next_bin(current_bin)
 
         if self.id is None:
             self.count_vec[-1, spk_id] += 1
         elif self.id == spk_id:
             self.count_vec[-1] += 1
-    
+
+    def _next_bin(self, current_bin):
+        """Emit the finished window for decoding and advance to `current_bin`."""
+        X = self.count_vec(out=self._X)
+        if self.exclude_first_unit:
+            X = X[:, 1:]
+        self.emit('decode', X=X)
+        if self.sketch is not None:
+            self.sketch.update(X.sum(axis=0))
+        self.count_vec.step(steps=current_bin - self.last_bin)
+        self.bins_total.inc(current_bin - self.last_bin)
+        self.last_bin = current_bin
+
+    def input_batch(self, timestamps, spk_ids):
+        """
+        Process a batch of spikes, e.g. FET records from a `FetReader`.
+
+        Equivalent to calling `input` for each spike in order: a 'decode'
+        event is emitted whenever a spike starts a new bin, but the counts
+        of each bin are added at once.
+
+        Parameters
+        ----------
+        timestamps : ndarray
+            FPGA timestamps, non-decreasing.
+        spk_ids : ndarray
+            Unit IDs.
+        """
+        if not len(timestamps):
+            return
+        bins = (timestamps * self.time_to_bin).astype(np.int64)
+        starts = np.flatnonzero(bins[1:] != bins[:-1]) + 1
+        for start, stop in zip(np.r_[0, starts], np.r_[starts, len(bins)]):
+            current_bin = int(bins[start])
+            if current_bin != self.last_bin:
+                self._next_bin(current_bin)
+
+            row = self.count_vec.index  # count_vec[-1]
+            if self.id is None:
+                counts = np.bincount(spk_ids[start:stop], minlength=self.N)
+                if len(counts) > self.N:
+                    raise IndexError(f'Unit ID {len(counts) - 1} out of range for {self.N} units')
+                self.count_vec.buffer[row] += counts.astype(self.count_vec.buffer.dtype)
+            else:
+                self.count_vec.buffer[row] += np.count_nonzero(spk_ids[start:stop] == self.id)
+
     @property
     def output(self):
         """
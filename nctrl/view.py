@@ -70,11 +70,45 @@ class LineView(scene.SceneCanvas):
         self.lines.clear()
 
 
+class RasterView(LineView):
+    """Raster of recent spikes (time vs unit) drawn as markers."""
+    def __init__(self, n_units=10, t_window=1.0, sampling_rate=25000):
+        super().__init__()
+        self.unfreeze()
+        self.n_units = n_units
+        self.t_window = t_window
+        self.sampling_rate = sampling_rate
+        self.markers = scene.visuals.Markers(parent=self.view.scene)
+        self.view.camera.set_range(x=(-t_window, 0), y=(0, n_units))
+        self.freeze()
+
+    def set_data(self, spikes):
+        """
+        Parameters
+        ----------
+        spikes : ndarray
+            Structured array with 'timestamp' and 'spk_id' fields (e.g. SpikeRing.latest()).
+        """
+        if not len(spikes):
+            return
+        t = (spikes['timestamp'] - spikes['timestamp'][-1]) / self.sampling_rate
+        pos = np.column_stack((t, spikes['spk_id'])).astype(np.float32)
+        colors = self.colors(spikes['spk_id'] % 12)
+        self.markers.set_data(pos, face_color=colors, edge_width=0, size=3, symbol='vbar')
+
+
 class FrView(LineView):
-    def __init__(self, bin_size=5.0, sigma=3.0):
+    """
+    Firing rates over the session, read from a RatePyramid (x in minutes, y in Hz).
+
+    The whole session is shown until the view is zoomed or panned; from then
+    on the visible range is kept and re-read at the pyramid level that fits
+    it, so zooming from hours down to the finest bins only touches the bins
+    on screen. Double-click to show the whole session again.
+    """
+    def __init__(self, sigma=3.0, max_points=1000):
         super().__init__()
         self.unfreeze()
-        self.bin_size = bin_size
         if sigma is None:
             self.window = None
         else:
@@ -83,17 +117,69 @@ class FrView(LineView):
             else:
                 self.window = signal.gaussian(sigma*6, sigma)
             self.window /= self.window.sum()
+        self.max_points = max_points
+        self.pyramid = None
+        self.units = None
+        self.follow = True
+        self._updating = False
+        # one visual for all units, updated in place
+        self.line = scene.visuals.Line(parent=self.view.scene, width=2)
+        self.view.scene.events.transform_change.connect(self._on_view_change)
+        self.events.mouse_double_click.connect(self._on_double_click)
         self.freeze()
-    
-    def set_data(self, data):
-        n_data = len(data)
-        x = np.arange(n_data) * (self.bin_size / 60)
-        y = (np.convolve(
-            np.pad(data, len(self.window)//2, mode='reflect'),
-            self.window,
-            mode='valid'
-        )[:n_data] if self.window is not None else data)
-        super().set_data(np.column_stack((x, y)))
+
+    def set_data(self, pyramid, units=None):
+        """
+        Parameters
+        ----------
+        pyramid : RatePyramid
+            Rate history to show (e.g. NCtrlBMI.rate_pyramid).
+        units : int or list of int, optional
+            Units to plot; all by default.
+        """
+        self.pyramid = pyramid
+        self.units = units
+        self.refresh()
+
+    def refresh(self):
+        if self.pyramid is None:
+            return
+        if self.follow:
+            t, rates = self.pyramid.query(units=self.units, max_points=self.max_points)
+        else:
+            rect = self.view.camera.rect
+            t, rates = self.pyramid.query(rect.left * 60, rect.right * 60, self.units, self.max_points)
+        if not len(t):
+            return
+        rates = rates.reshape(len(t), -1)
+        n_data, n_lines = rates.shape
+        if self.window is not None and n_data > len(self.window):
+            pad = len(self.window) // 2
+            rates = np.column_stack([np.convolve(np.pad(rate, pad, mode='reflect'), self.window, mode='valid')[:n_data]
+                                     for rate in rates.T])
+        pos = np.empty((n_data * n_lines, 2), dtype=np.float32)
+        pos[:, 0] = np.tile(t / 60, n_lines)
+        pos[:, 1] = rates.T.ravel()
+        connect = np.ones(len(pos), dtype=bool)
+        connect[n_data - 1::n_data] = False  # no segment from one unit's line to the next
+        color = np.repeat(self.colors(np.arange(n_lines) % 12), n_data, axis=0) if n_lines > 1 else (1, 1, 1, 1)
+
+        self._updating = True
+        try:
+            self.line.set_data(pos=pos, color=color, connect=connect)
+            if self.follow:
+                self.view.camera.set_range()
+        finally:
+            self._updating = False
+
+    def _on_view_change(self, event):
+        if not self._updating:
+            self.follow = False
+            self.refresh()
+
+    def _on_double_click(self, event):
+        self.follow = True
+        self.refresh()
 
 
 class FrGUI(QWidget):
@@ -105,6 +191,7 @@ class FrGUI(QWidget):
         self.timer = QTimer()
         self.timer.timeout.connect(self.set_data)
         self.plot = FrView()
+        self.pyramid = None
         
         self.start_btn = QPushButton('Start')
         self.start_btn.setCheckable(True)
@@ -119,7 +206,15 @@ class FrGUI(QWidget):
         self.timer.start(1000) if checked else self.timer.stop()
     
     def set_data(self):
-        self.plot.set_data(np.random.randint(2, 10, 360))
+        from .utils import RatePyramid
+        if self.pyramid is None:
+            self.pyramid = RatePyramid(4)
+            self.t = 0
+        # a minute of random spikes per tick
+        timestamps = self.t + np.sort(np.random.randint(0, 60 * 25000, 2000))
+        self.pyramid.input_batch(timestamps, np.random.randint(0, 4, len(timestamps)))
+        self.t += 60 * 25000
+        self.plot.set_data(self.pyramid, units=[1, 2, 3])
 
     def closeEvent(self, event):
         self.timer.stop()
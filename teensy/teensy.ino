@@ -5,6 +5,11 @@
 #define LASER_PIN 3
 #define START_PIN 4
 
+// multi-channel TTL output: mask bit i drives GPIO6 bit (16 + i), so the
+// whole mask is applied with a single port register write.
+// Teensy 4.1 pins; on Teensy 4.0 bits 4, 5, 12 and 13 have no pin.
+const uint8_t MASK_PINS[16] = {19, 18, 14, 15, 40, 41, 17, 16, 22, 23, 20, 21, 38, 39, 26, 27};
+
 // laser timer
 const unsigned long LASER_PULSE_DURATION = 5000; // 5 ms
 const unsigned long LASER_INTERVAL_DURATION = 20000; // 20 ms
@@ -14,6 +19,8 @@ unsigned long laserLatency = 0;
 unsigned long now = 0;
 unsigned long laserStartTime = 0;
 unsigned long laserIntervalTime = 0;
+unsigned long laserTargetTime = 0; // absolute trigger time (micros)
+char scheduledCmd = '1';
 
 // start state
 bool startState = false; 
@@ -24,7 +31,8 @@ enum LaserState {
     LASERON,
     LASEROFF,
     DONE,
-    PULSE
+    PULSE,
+    SCHEDULED
 };
 
 LaserState state = STANDBY;
@@ -37,6 +45,7 @@ bool enable = false;
 #define laserOff()  {digitalWriteFast(LASER_PIN, LOW); digitalWriteFast(LED_BUILTIN, LOW);}
 #define startOn()   digitalWriteFast(START_PIN, HIGH)
 #define startOff()  digitalWriteFast(START_PIN, LOW)
+#define maskWrite(mask) (GPIO6_DR = (GPIO6_DR & 0x0000FFFF) | ((uint32_t)(mask) << 16))
 
 void setup() { 
     Serial.begin(115200);
@@ -44,6 +53,9 @@ void setup() {
     pinMode(LASER_PIN, OUTPUT);
     pinMode(START_PIN, OUTPUT);
     pinMode(LED_BUILTIN, OUTPUT);
+    for (uint8_t i = 0; i < 16; i++) {
+        pinMode(MASK_PINS[i], OUTPUT);
+    }
     reset();
     printHelp();
 }
@@ -67,6 +79,7 @@ void reset() {
     laserOff();
     enableOff();
     startOff();
+    maskWrite(0);
 }
 
 void handleCommand(char cmd) {
@@ -82,6 +95,16 @@ void handleCommand(char cmd) {
                 startLaser();
             }
             break;
+        case 's': // set TTL mask, followed by 2 bytes (uint16, little endian)
+            setMask();
+            break;
+        case 't': // clock sync ping: reply with micros()
+            Serial.print("t ");
+            Serial.println(micros());
+            break;
+        case 'T': // absolute trigger: target micros (uint32, little endian) + '1' or 'a'
+            scheduleTrigger();
+            break;
         case 'A': // abort laser
             abortLaser();
             break;
@@ -123,6 +146,9 @@ void printHelp() {
     Serial.println("========== Commands ==========");
     Serial.println("1: single pulse");
     Serial.println("a: start laser");
+    Serial.println("s: set TTL mask (2 bytes)");
+    Serial.println("t: clock sync ping");
+    Serial.println("T: trigger at absolute time (4 + 1 bytes)");
     Serial.println("A: abort laser");
     Serial.println("e: enable laser");
     Serial.println("E: disable laser");
@@ -165,20 +191,41 @@ void startLaser() {
     laserStartTime = now;
 }
 
+void setMask() {
+    uint16_t mask = 0;
+    if (Serial.readBytes((char *)&mask, 2) == 2 && enable) {
+        maskWrite(mask);
+    }
+}
+
+void scheduleTrigger() {
+    uint32_t target = 0;
+    char cmd = 0;
+    // a trigger arriving while one is pending is ignored, so a faster trigger
+    // stream than the latency cannot keep postponing the laser
+    if (Serial.readBytes((char *)&target, 4) == 4 && Serial.readBytes(&cmd, 1) == 1 && enable && state != SCHEDULED) {
+        laserOff(); // a running pulse or train ends here, not at the target
+        // a target already in the past fires on the next loop
+        laserTargetTime = target;
+        scheduledCmd = cmd;
+        state = SCHEDULED;
+    }
+}
+
 void abortLaser() {
     state = STANDBY;
     laserOff();
 }
 
 void setLaserDuration() {
-    int duration = Serial.parseInt(); // read in ms ## this can be very slow (~1s)!!!
+    int duration = Serial.parseInt(); // read in ms; the host ends the number with a newline, else parseInt waits for its timeout (~1s)
     laserFinishDuration = duration * 1000UL; // write in us
     Serial.print("Laser duration is set to " + String(duration));
     Serial.println(" ms");
 }
 
 void setLaserLatency() {
-    int latency = Serial.parseInt(); // read in ms ## this can be very slow (~1s)!!!
+    int latency = Serial.parseInt(); // read in ms; the host ends the number with a newline, else parseInt waits for its timeout (~1s)
     laserLatency = latency * 1000UL; // write in us
     Serial.print("Laser latency is set to " + String(latency));
     Serial.println(" ms");
@@ -211,6 +258,19 @@ void checkLaser() {
                 laserOn();
             }
             break;
+        case SCHEDULED:
+            if ((long)(now - laserTargetTime) >= 0) {
+                if (scheduledCmd == 'a') {
+                    toggleStart();
+                    state = LASERON;
+                    laserStartTime = now;
+                    laserIntervalTime = now;
+                    laserOn();
+                } else {
+                    laserPulse();
+                }
+            }
+            break;
         case PULSE:
             if (now - laserStartTime >= laserFinishDuration) {
                 state = DONE;
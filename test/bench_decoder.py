@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from nctrl.decoder import FrThreshold, DynamicFrThreshold, RateController, MultiDynamicFrThreshold, Spikes, SingleSpike
+from nctrl.evaluate import run_decoder
+from nctrl.stream import SpikeRecord
+
+
+def bench_multi_dynamic(n_unit=32, n_bin=3000, B_bins=10, B2_bins=600, seed=0):
+    """Compare N DynamicFrThreshold decoders with one MultiDynamicFrThreshold per bin."""
+    rng = np.random.default_rng(seed)
+    unit_ids = np.arange(1, n_unit + 1)
+    counts = np.zeros((n_bin + B_bins, n_unit + 1), dtype=int)
+    counts[B_bins:, 1:] = rng.poisson(rng.uniform(0.05, 1.0, n_unit), size=(n_bin, n_unit))
+    direction = ['up' if i % 3 else 'down' for i in range(n_unit)]
+    params = dict(target_fr=0.2, bin_size=0.1, B_bins=B_bins, B2_bins=B2_bins)
+
+    singles = []
+    for unit_id, d in zip(unit_ids, direction):
+        dec = DynamicFrThreshold()
+        dec.fit(unit_id=unit_id, direction=d, **params)
+        singles.append(dec)
+    multi = MultiDynamicFrThreshold()
+    multi.fit(unit_ids=unit_ids, direction=direction, **params)
+
+    t_single, t_multi = [], []
+    n_mismatch = 0
+    for i in range(n_bin):
+        X = counts[i + 1:i + 1 + B_bins]
+        start = time.perf_counter()
+        y = [dec.predict(X[:, unit_id]) for dec, unit_id in zip(singles, unit_ids)]
+        t_single.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        multi.predict(X)
+        t_multi.append(time.perf_counter() - start)
+        n_mismatch += not np.array_equal(np.array(y, dtype=bool), multi.trigger)
+
+    t_single, t_multi = np.array(t_single[B2_bins:]) * 1e3, np.array(t_multi[B2_bins:]) * 1e3
+    print(f"{n_unit} x DynamicFrThreshold: mean {t_single.mean():.3f} ms, p99 {np.percentile(t_single, 99):.3f} ms per bin")
+    print(f"MultiDynamicFrThreshold:   mean {t_multi.mean():.3f} ms, p99 {np.percentile(t_multi, 99):.3f} ms per bin")
+    print(f"trigger mismatches: {n_mismatch}/{n_bin}")
+
+
+def bench_predict_batch(n_bin=36000, B_bins=10, B2_bins=600, seed=0):
+    """Sequential predict vs predict_batch over one hour of 0.1 s bins; decisions must match exactly."""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(rng.gamma(2.0, 0.25, n_bin)).astype(int)  # bursty unit
+    params = dict(unit_id=0, target_fr=0.2, bin_size=0.1, B_bins=B_bins)
+    for name, make in [('FrThreshold', lambda: FrThreshold(nspike=4)),
+                       ('DynamicFrThreshold', lambda: DynamicFrThreshold()),
+                       ('RateController', lambda: RateController())]:
+        decoders = []
+        for _ in range(2):
+            dec = make()
+            if name == 'DynamicFrThreshold':
+                dec.fit(B2_bins=B2_bins, **params)
+            elif name == 'RateController':
+                dec.fit(**params)
+            decoders.append(dec)
+
+        start = time.perf_counter()
+        y_seq = run_decoder(decoders[0], counts, B_bins)[0]
+        t_seq = time.perf_counter() - start
+        start = time.perf_counter()
+        y_batch = decoders[1].predict_batch(counts, B_bins)
+        t_batch = time.perf_counter() - start
+        print(f"{name:>18}: predict {t_seq * 1e3:8.1f} ms, predict_batch {t_batch * 1e3:7.1f} ms "
+              f"({t_seq / t_batch:5.1f}x), identical: {np.array_equal(y_seq, y_batch)}")
+
+
+def bench_predict_batch_multi(n_unit=16, n_bin=6000, B_bins=10, B2_bins=600, seed=0):
+    """Sequential predict vs predict_batch for the multi-unit and spike decoders; decisions must match exactly."""
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((n_bin, n_unit + 1), dtype=int)
+    counts[:, 1:] = rng.poisson(rng.gamma(2.0, 0.25, (n_bin, n_unit)))
+    # the binner's windows: the last B_bins bins, zero before the session
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.concatenate((np.zeros((B_bins - 1, n_unit + 1), dtype=int), counts)), B_bins, axis=0).transpose(0, 2, 1)
+    unit_ids = np.arange(1, n_unit + 1)
+    multi = [MultiDynamicFrThreshold() for _ in range(2)]
+    for dec in multi:
+        dec.fit(unit_ids=unit_ids, target_fr=0.2, bin_size=0.1, B_bins=B_bins, B2_bins=B2_bins,
+                direction=['up' if i % 3 else 'down' for i in range(n_unit)])
+    spikes = [Spikes(unit_ids=unit_ids) for _ in range(2)]
+
+    for name, (dec_seq, dec_batch) in [('MultiDynamic', multi), ('Spikes', spikes)]:
+        start = time.perf_counter()
+        y_seq = np.array([dec_seq.predict(X) for X in windows], dtype=np.uint16)
+        t_seq = time.perf_counter() - start
+        start = time.perf_counter()
+        y_batch = dec_batch.predict_batch(counts, B_bins) if name == 'MultiDynamic' else dec_batch.predict_batch(counts)
+        t_batch = time.perf_counter() - start
+        print(f"{name:>18}: predict {t_seq * 1e3:8.1f} ms, predict_batch {t_batch * 1e3:7.1f} ms "
+              f"({t_seq / t_batch:5.1f}x), identical: {np.array_equal(y_seq, y_batch)}")
+
+    spk_ids = rng.integers(0, n_unit + 1, n_bin * 10)
+    singles = [SingleSpike(unit_id=3) for _ in range(2)]
+    spike = SpikeRecord()
+    start = time.perf_counter()
+    y_seq = []
+    for spk_id in spk_ids:
+        spike.spk_id = int(spk_id)
+        y_seq.append(singles[0].predict(spike) or 0)
+    t_seq = time.perf_counter() - start
+    start = time.perf_counter()
+    y_batch = singles[1].predict_batch(spk_ids)
+    t_batch = time.perf_counter() - start
+    print(f"{'SingleSpike':>18}: predict {t_seq * 1e3:8.1f} ms, predict_batch {t_batch * 1e3:7.1f} ms "
+          f"({t_seq / t_batch:5.1f}x), identical: {np.array_equal(y_seq, y_batch)}")
+
+
+
+def check_predict_batch_chunks(n_unit=4, n_bin=5000, B_bins=10, B2_bins=300, seed=0):
+    """predict_batch over a session split into chunks (some empty or shorter than B_bins) must equal one call."""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(0.5, size=(n_bin, n_unit + 1))
+    params = dict(target_fr=0.5, bin_size=0.1, B_bins=B_bins)
+
+    def make():
+        fr, dynamic, rate, multi = FrThreshold(), DynamicFrThreshold(), RateController(), MultiDynamicFrThreshold()
+        fr.fit(unit_id=2, nspike=8, B_bins=B_bins)
+        dynamic.fit(unit_id=2, B2_bins=B2_bins, **params)
+        rate.fit(unit_id=2, **params)
+        multi.fit(unit_ids=np.arange(1, n_unit + 1), B2_bins=B2_bins, direction='down', **params)
+        return {'FrThreshold': fr, 'DynamicFrThreshold': dynamic, 'RateController': rate, 'MultiDynamic': multi}
+
+    whole = {name: dec.predict_batch(counts) for name, dec in make().items()}
+    chunked = make()
+    parts = np.split(np.arange(n_bin), [0, 3, 150, B2_bins, B2_bins + 1, 2000, 2000, n_bin - 1])
+    for name, dec in chunked.items():
+        y = np.concatenate([dec.predict_batch(counts[part]) for part in parts])
+        print(f"{name:>18}: {len(parts)} chunks equal one call: {np.array_equal(y, whole[name])}")
+
+
+if __name__ == "__main__":
+    bench_multi_dynamic()
+    bench_predict_batch()
+    bench_predict_batch_multi()
+    check_predict_batch_chunks()
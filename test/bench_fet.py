@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import struct
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from nctrl.stream import FET_DTYPE, FetReader
+from nctrl.utils import FastBinner
+
+
+class BmiOutput:
+    """Per-spike object as built from each 28-byte record by spiketag's read_bmi."""
+    def __init__(self, buf):
+        self.output = struct.unpack('<7i', buf)
+        self.timestamp, self.grp_id = self.output[:2]
+        self.spk_id = self.output[-1]
+
+
+def bench_fet(n_spikes=1000000, n_units=32, seed=0):
+    """Replay a fet.bin into a binner: one object per spike vs FetReader batches with input_batch."""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(n_spikes, dtype=FET_DTYPE)
+    records['frame_id'] = np.sort(rng.integers(0, n_spikes * 25, n_spikes))  # ~1 kHz
+    records['spike_id'] = rng.integers(0, n_units + 1, n_spikes)
+    fetfile = os.path.join(tempfile.mkdtemp(), 'fet.bin')
+    records.tofile(fetfile)
+
+    binners = [FastBinner(0.1, n_units + 1, 10) for _ in range(2)]
+    start = time.perf_counter()
+    with open(fetfile, 'rb', buffering=0) as f:
+        while True:
+            buf = f.read(FET_DTYPE.itemsize)
+            if not buf:
+                break
+            binners[0].input(BmiOutput(buf))
+    t_spike = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reader = FetReader(fetfile)
+    for batch in reader:
+        binners[1].input_batch(batch['frame_id'], batch['spike_id'])
+    reader.close()
+    t_batch = time.perf_counter() - start
+
+    same = np.array_equal(binners[0].output, binners[1].output) and binners[0].last_bin == binners[1].last_bin
+    print(f"per-spike objects: {t_spike / n_spikes * 1e9:.0f} ns/spike")
+    print(f"FetReader batches: {t_batch / n_spikes * 1e9:.0f} ns/spike ({t_spike / t_batch:.0f}x), same bins: {same}")
+    os.remove(fetfile)
+
+
+if __name__ == "__main__":
+    bench_fet()
@@ -0,0 +1,98 @@
+import gc
+import os
+import sys
+import time
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from nctrl.decoder import DynamicFrThreshold
+from nctrl.tuning import RuntimeTuning
+from nctrl.utils import FastBinner
+
+
+class Spike:
+    __slots__ = ('timestamp', 'grp_id', 'spk_id')
+
+    def __init__(self, timestamp, spk_id):
+        self.timestamp, self.grp_id, self.spk_id = timestamp, 0, spk_id
+
+
+class Node:
+    """A GUI-like object: attributes, a parent link (a reference cycle) and children."""
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.children = []
+        self.data = {'pos': [0.0, 0.0], 'color': (1, 1, 1)}
+
+
+def gui_churn(stop, n_live=100000, n_frame=2000, fps=60):
+    """Keep a large live heap and recreate cyclic objects every frame, like views rebuilding visuals."""
+    live = [Node() for _ in range(n_live)]
+    while not stop.is_set():
+        root = Node()
+        root.children = [Node(root) for _ in range(n_frame)]
+        live[np.random.randint(n_live)] = root
+        time.sleep(1 / fps)
+
+
+def run_loop(duration=10.0, rate=2000, bin_size=0.01, tuning=None, seed=0):
+    """
+    Feed a Poisson spike train through a binner and DynamicFrThreshold in real time.
+
+    Returns the decode latency per bin: from the arrival time of the spike
+    that closes a bin to the end of the decode, in ms.
+    """
+    rng = np.random.default_rng(seed)
+    arrivals = np.cumsum(rng.exponential(1 / rate, int(duration * rate)))
+    spk_ids = rng.integers(0, 4, len(arrivals))
+    binner = FastBinner(bin_size, 4, 10, id=1)
+    dec = DynamicFrThreshold()
+    dec.fit(unit_id=1, target_fr=1, bin_size=bin_size, B_bins=10, B2_bins=500)
+
+    @binner.connect
+    def on_decode(X):
+        dec.predict(X)
+
+    if tuning is not None:
+        tuning.apply()
+    latencies = []
+    next_gc = tuning.gc_interval if tuning is not None else np.inf
+    start = time.perf_counter()
+    for arrival, spk_id in zip(arrivals, spk_ids):
+        while time.perf_counter() - start < arrival:
+            time.sleep(0)
+        spike = Spike(int(arrival * 25000), int(spk_id))
+        closes_bin = int(spike.timestamp * binner.time_to_bin) != binner.last_bin
+        binner.input(spike)
+        if closes_bin:
+            latencies.append(time.perf_counter() - start - arrival)
+        elif arrival >= next_gc:
+            # safe point: this spike did not close a bin (same rule as the BMI loop)
+            tuning.collect()
+            next_gc = arrival + tuning.gc_interval
+    if tuning is not None:
+        tuning.restore()
+    return np.array(latencies) * 1e3
+
+
+def bench_jitter(duration=10.0, cpus=None):
+    """Decode latency with a GUI-like allocating thread, with the default GC and with RuntimeTuning."""
+    for name, tuning in [('default GC', None), ('tuned', RuntimeTuning(cpus=cpus, gc_interval=0.5))]:
+        stop = threading.Event()
+        gui = threading.Thread(target=gui_churn, args=(stop,), daemon=True)
+        gui.start()
+        time.sleep(1.0)  # let the GUI heap build up
+        n_collections = sum(stat['collections'] for stat in gc.get_stats())
+        latency = run_loop(duration, tuning=tuning)
+        n_collections = sum(stat['collections'] for stat in gc.get_stats()) - n_collections
+        stop.set()
+        gui.join()
+        gc.collect()
+        print(f"{name:>10}: decode latency p50 {np.percentile(latency, 50):.3f} ms, "
+              f"p99 {np.percentile(latency, 99):.3f} ms, p99.9 {np.percentile(latency, 99.9):.3f} ms, "
+              f"max {latency.max():.3f} ms, {n_collections} GC collections")
+
+
+if __name__ == "__main__":
+    bench_jitter(cpus=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from nctrl.log import LOG_FORMAT, LogSampler, setup_logging, stop_logging
+
+logger = logging.getLogger('nctrl.bench')
+
+
+def hot_loop(log_call, n_iter=200000):
+    """Time each iteration of a Print-like predict loop in ns."""
+    latency = np.empty(n_iter, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i in range(n_iter):
+        start = clock()
+        log_call(i)
+        latency[i] = clock() - start
+    return latency
+
+
+def report(name, latency):
+    print(f"{name:>26}: mean {latency.mean():7.0f} ns, p99 {np.percentile(latency, 99):7.0f} ns, "
+          f"p99.9 {np.percentile(latency, 99.9):8.0f} ns, max {latency.max() / 1e3:8.1f} us")
+
+
+def bench_logging(n_iter=200000):
+    tmpdir = tempfile.mkdtemp()
+    logfile = os.path.join(tmpdir, 'bench.log')
+
+    report('no logging', hot_loop(lambda i: None, n_iter))
+
+    # previous setup: synchronous file + console handlers, every 100th spike
+    root = logging.getLogger()
+    handlers = [logging.FileHandler(logfile, mode='w'), logging.StreamHandler(open(os.devnull, 'w'))]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+    def sync_call(i):
+        if i % 100 == 0:
+            logger.info(f"\033[1m\033[32m{i / 25000:.2f}ms:\033[0m \033[34mGroup {i % 4}\033[0m \033[35mSpike {i}\033[0m")
+    report('synchronous, every 100', hot_loop(sync_call, n_iter))
+    for handler in handlers:
+        root.removeHandler(handler)
+        handler.close()
+
+    # queue-based setup, every 100th spike and at most once per second
+    setup_logging(filename=logfile, console=False)
+    sampler = LogSampler(interval=1.0, every=100)
+
+    def queued_call(i):
+        if sampler.ready():
+            logger.info('spike', extra={'fields': {'timestamp_s': f'{i / 25000:.3f}', 'spike': i,
+                                                   'suppressed': sampler.reset()}})
+    report('queued + sampled', hot_loop(queued_call, n_iter))
+
+    def queued_every_call(i):
+        if i % 100 == 0:
+            logger.info('spike', extra={'fields': {'spike': i}})
+    report('queued, every 100', hot_loop(queued_every_call, n_iter))
+    stop_logging()
+
+
+if __name__ == "__main__":
+    bench_logging()
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'teensy_sim'))
+from nctrl.output import OUTPUT_DTYPE, Laser, NullOutput, MemoryOutput, DatagramOutput
+
+
+def drive(output, ys, timestamps):
+    """Call the output like the decoder does; returns (calls/s, slowest call in s)."""
+    start = time.perf_counter()
+    for y, timestamp in zip(ys, timestamps):
+        output(y, timestamp)
+    rate = len(ys) / (time.perf_counter() - start)
+    slowest = 0.0
+    for y, timestamp in zip(ys, timestamps):
+        t = time.perf_counter()
+        output(y, timestamp)
+        slowest = max(slowest, time.perf_counter() - t)
+    return rate, slowest
+
+
+class Receiver(threading.Thread):
+    """Downstream system draining a datagram socket; counts the triggers received."""
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.sock.settimeout(0.5)
+        self.n_triggers = 0
+        self.start()
+
+    def run(self):
+        try:
+            while True:
+                record = np.frombuffer(self.sock.recv(64), OUTPUT_DTYPE)[0]
+                self.n_triggers += record['kind'] == b't'
+        except OSError:  # timed out after the run, or closed
+            pass
+
+
+def check_memory_fork(n_runs=3, n_triggers=5):
+    """Each BMI start forks a new process; MemoryOutput must append across them, not restart at 0."""
+    output = MemoryOutput(capacity=n_runs * n_triggers)
+    for run in range(n_runs):
+        pid = os.fork()
+        if pid == 0:
+            for t in range(n_triggers):
+                output(1, run * 1000 + t)
+            os._exit(0)
+        os.waitpid(pid, 0)
+    expected = [run * 1000 + t for run in range(n_runs) for t in range(n_triggers)]
+    assert output.trigger_times.tolist() == expected, output.trigger_times
+    print(f"memory across {n_runs} forked runs: {len(output)}/{len(expected)} records kept")
+
+
+def bench_output(n_calls=200000, trigger_rate=0.1, seed=0):
+    """Decoder-like calls (y=1 with probability `trigger_rate`, else 0) through each output backend."""
+    rng = np.random.default_rng(seed)
+    ys = [1 if trigger else 0 for trigger in rng.random(n_calls) < trigger_rate]
+    timestamps = [int(t) for t in np.arange(n_calls) * 250]  # 10 ms bins
+    n_triggers = sum(ys)
+
+    def report(name, rate, slowest, delivered):
+        print(f"{name:>14}: {rate / 1e6:.2f} M calls/s ({1e9 / rate:.0f} ns/call), "
+              f"slowest call {slowest * 1e6:.0f} us, {delivered}")
+
+    output = NullOutput()
+    report('null', *drive(output, ys, timestamps), 'discarded')
+
+    # drive() calls twice: the second pass fills the array and is dropped
+    output = MemoryOutput(capacity=n_triggers)
+    rate, slowest = drive(output, ys, timestamps)
+    assert np.array_equal(output.trigger_times, np.array(timestamps)[np.array(ys) == 1])
+    report('memory', rate, slowest, f'{len(output)}/{2 * n_triggers} recorded, '
+                                    f'{output.dropped_total.value:.0f} dropped when full')
+
+    for name, family, address in [('datagram udp', socket.AF_INET, ('127.0.0.1', 0)),
+                                  ('datagram unix', socket.AF_UNIX, os.path.join(tempfile.mkdtemp(), 'nctrl.sock'))]:
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.bind(address)
+        receiver = Receiver(sock)
+        port = address if family == socket.AF_UNIX else '127.0.0.1:%d' % sock.getsockname()[1]
+        output = DatagramOutput(port)
+        dropped = output.dropped_total.value
+        rate, slowest = drive(output, ys, timestamps)
+        receiver.join()
+        # a receiver that falls behind fills the socket buffer: the call drops the trigger rather than wait
+        # (unix), or the kernel discards it on the receiving side (udp, not seen by the sender)
+        report(name, rate, slowest, f'{receiver.n_triggers}/{2 * n_triggers} received, '
+                                    f'{output.dropped_total.value - dropped:.0f} dropped')
+        output.close()
+        sock.close()
+
+    from teensy_sim import TeensySim
+    with TeensySim() as sim:
+        output = Laser(sim.port)
+        output.on()
+        n_before = len(sim.triggers)
+        rate, slowest = drive(output, ys, timestamps)
+        deadline = time.monotonic() + 5
+        while len(sim.triggers) - n_before < 2 * n_triggers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        report('laser (pty)', rate, slowest, f'{len(sim.triggers) - n_before}/{2 * n_triggers} received')
+        output.close()
+
+
+if __name__ == "__main__":
+    check_memory_fork()
+    bench_output()
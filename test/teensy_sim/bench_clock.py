@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from nctrl.output import Laser
+from teensy_sim import TeensySim
+
+FPGA_RATE = 25000
+
+
+def run_triggers(laser, sim, t_fpga, duration=8.0, spike_interval=1e-3, trigger_every=50, fpga_drift_ppm=-20.0):
+    """
+    Drive `laser` with a synthetic FPGA spike stream and return the firing errors (us).
+
+    Each spike is read after a random transport delay, and every
+    `trigger_every`-th spike triggers the laser after extra random host
+    jitter, as a slow decoder or a busy host would. The error is the
+    simulated fire time minus (spike time + latency) on the Teensy clock.
+    """
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    i_spike = int((t0 - t_fpga) / spike_interval)  # the FPGA clock keeps running between runs
+    n_triggers = len(sim.triggers)
+    expected = []
+    while time.perf_counter() - t0 < duration:
+        t_spike = t_fpga + i_spike * spike_interval
+        timestamp = int((t_spike - t_fpga) * (1 + fpga_drift_ppm * 1e-6) * FPGA_RATE)
+        read_time = t_spike + 2e-4 + rng.exponential(3e-4)
+        time.sleep(max(0.0, read_time - time.perf_counter()))  # sleep, so the simulator thread gets the GIL
+        if i_spike % 16 == 0:
+            laser.clock.observe_fpga(timestamp, time.perf_counter())
+        if i_spike % trigger_every == 0:
+            time.sleep(rng.uniform(0, 3e-3))  # host jitter between the spike and the serial write
+            laser(1, timestamp)
+            expected.append(sim.micros(t_spike) + laser.latency * 1000)
+        i_spike += 1
+
+    time.sleep(0.1)
+    fired = np.array([t[1] for t in sim.triggers[n_triggers:]], dtype=np.int64)
+    expected = np.array(expected, dtype=np.int64) % (1 << 32)
+    n = min(len(fired), len(expected))
+    return (fired[:n] - expected[:n] + (1 << 31)) % (1 << 32) - (1 << 31)
+
+
+def report(name, error):
+    error = error[len(error) // 4:]  # skip the warm-up of the clock fit
+    print(f"{name:>9}: mean {error.mean():8.1f} us  std {error.std():7.1f} us  "
+          f"median {np.median(error):8.1f} us  p99 |err| {np.percentile(np.abs(error), 99):7.1f} us  ({len(error)} triggers)")
+
+
+def bench_clock(drift_ppm=30.0):
+    """Compare trigger timing with relative latency and with clock-synced absolute targets."""
+    with TeensySim(drift_ppm=drift_ppm, offset=1234.5) as sim:
+        laser = Laser(sim.port)
+        laser.on()
+        laser.set_duration(10)
+        laser.set_latency(5)
+        t_fpga = time.perf_counter()
+
+        report('relative', run_triggers(laser, sim, t_fpga))
+
+        laser.start_sync(interval=0.5)
+        report('absolute', run_triggers(laser, sim, t_fpga))
+        print(laser.clock)
+        laser.close()
+
+
+if __name__ == "__main__":
+    bench_clock()
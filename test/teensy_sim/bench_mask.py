@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from nctrl.output import Laser
+from teensy_sim import TeensySim
+
+
+def bench_mask(n_updates=20000):
+    """Send random 16-bit masks through Laser to the pty simulator."""
+    masks = np.random.randint(1, 2**16, n_updates).astype(np.uint16)
+    masks[1::2] = 0  # force a change on every update
+
+    with TeensySim() as sim:
+        laser = Laser(sim.port)
+        laser.on()
+
+        start = time.perf_counter()
+        for mask in masks:
+            laser(mask)
+        elapsed = time.perf_counter() - start
+
+        deadline = time.monotonic() + 5
+        while sim.counts['s'] < n_updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        received = sim.counts['s']
+        laser.close()
+
+    print(f"host: {n_updates / elapsed:.0f} updates/s ({elapsed / n_updates * 1e6:.2f} us/update)")
+    print(f"simulator: {received}/{n_updates} masks received, last mask {sim.mask:#06x}")
+
+
+if __name__ == "__main__":
+    bench_mask()
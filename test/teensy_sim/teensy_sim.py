@@ -0,0 +1,203 @@
+import os
+import pty
+import tty
+import time
+import select
+import threading
+from collections import Counter
+
+
+class TeensySim:
+    """
+    A pty-backed stand-in for teensy/teensy.ino.
+
+    Opens a pseudo terminal and answers the firmware's serial protocol from a
+    background thread, so `nctrl.output.Laser` can be exercised without
+    hardware. Pass `sim.port` as the Laser port.
+
+    Attributes:
+        port (str): Path of the pty slave, usable as a serial port.
+        enable (bool): Laser enable state.
+        duration (int): Laser duration in ms.
+        latency (int): Laser latency in ms.
+        mask (int): Last TTL mask applied (only while enabled).
+        counts (Counter): Number of commands received, keyed by command byte.
+        triggers (list): (target, fire time, command) in device micros for
+            every trigger while enabled; relative triggers ('1', 'a') have no
+            target and fire `latency` after arrival, absolute ones ('T') at
+            their target, or on arrival if it already passed. A 'T' arriving
+            while the previous one is still pending is ignored.
+
+    `disconnect` and `reconnect` emulate a USB link loss: the pty is closed,
+    so the host gets I/O errors, and reopened under a new name. With
+    `link_dir`, the current pty is also linked as `link_dir`/ttyACM<n>, with
+    n counting up on every reconnect like a re-enumerated device.
+
+    Args:
+        drift_ppm (float, optional): Rate error of the simulated micros() clock. Defaults to 0.
+        offset (float, optional): Offset of the simulated clock from perf_counter (s). Defaults to 0.
+        link_dir (str, optional): Directory for ttyACM<n> links to the pty.
+    """
+    PARSE_TIMEOUT = 0.02  # the firmware's Serial.parseInt waits for more digits
+
+    def __init__(self, drift_ppm=0.0, offset=0.0, link_dir=None):
+        self.drift_ppm = drift_ppm
+        self.offset = offset
+        self.link_dir = link_dir
+        self.n_connects = 0
+        self.triggers = []
+        self.enable = False
+        self.duration = 500
+        self.latency = 0
+        self.mask = 0
+        self.counts = Counter()
+        self._buf = bytearray()
+        self._thread = None
+        self._running = False
+        self.open()
+
+    def open(self):
+        master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        if self.link_dir is not None:
+            link = os.path.join(self.link_dir, f'ttyACM{self.n_connects}')
+            os.symlink(self.port, link)
+            self.port = link
+        self.n_connects += 1
+        self.master = master
+
+    def close(self):
+        master, self.master = self.master, None
+        for fd in (master, self.slave):
+            try:
+                os.close(fd)
+            except (OSError, TypeError):
+                pass
+        if self.link_dir is not None and os.path.islink(self.port):
+            os.remove(self.port)
+
+    def disconnect(self):
+        """Drop the link: the host's reads and writes fail until `reconnect`."""
+        self.close()
+        self._buf.clear()
+
+    def reconnect(self, reset=True):
+        """Come back on a new port; with `reset`, as a rebooted firmware with default settings."""
+        if reset:
+            self.enable, self.duration, self.latency, self.mask = False, 500, 0, 0
+        self.open()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        self.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _run(self):
+        while self._running:
+            master = self.master
+            if master is None:
+                time.sleep(self.PARSE_TIMEOUT)  # disconnected
+                continue
+            try:
+                ready, _, _ = select.select([master], [], [], self.PARSE_TIMEOUT)
+            except (OSError, ValueError):
+                continue
+            if ready:
+                try:
+                    self._buf += os.read(master, 65536)
+                except OSError:
+                    time.sleep(self.PARSE_TIMEOUT)
+                    continue
+                self._parse(idle=False)
+            elif self._buf:
+                self._parse(idle=True)
+
+    def micros(self, host_time=None):
+        """The simulated Teensy micros() at perf_counter time `host_time` (default: now)."""
+        host_time = time.perf_counter() if host_time is None else host_time
+        return int((host_time * (1 + self.drift_ppm * 1e-6) + self.offset) * 1e6) % (1 << 32)
+
+    def _reply(self, line):
+        try:
+            os.write(self.master, (line + '\r\n').encode())
+        except (OSError, TypeError):
+            pass  # disconnected
+
+    def _parse(self, idle):
+        buf = self._buf
+        while buf:
+            cmd = chr(buf[0])
+            if cmd in 'dl':
+                end = 1
+                while end < len(buf) and chr(buf[end]).isdigit():
+                    end += 1
+                if end == len(buf) and not idle:
+                    return  # digits may still be arriving
+                value = int(buf[1:end] or b'0')
+                del buf[:end]
+                if cmd == 'd':
+                    self.duration = value
+                    self._reply(f'Laser duration is set to {value} ms')
+                else:
+                    self.latency = value
+                    self._reply(f'Laser latency is set to {value} ms')
+            elif cmd == 'T':
+                if len(buf) < 6:
+                    return
+                now = self.micros()
+                pending = self.triggers and self.triggers[-1][0] is not None \
+                    and (now - self.triggers[-1][1]) % (1 << 32) >= (1 << 31)
+                if self.enable and not pending:  # the firmware ignores triggers while one is scheduled
+                    target = int.from_bytes(buf[1:5], 'little')
+                    late = (now - target) % (1 << 32) < (1 << 31)
+                    self.triggers.append((target, now if late else target, chr(buf[5])))
+                del buf[:6]
+            elif cmd == 's':
+                if len(buf) < 3:
+                    return
+                if self.enable:
+                    self.mask = int.from_bytes(buf[1:3], 'little')
+                del buf[:3]
+            else:
+                del buf[:1]
+                if cmd in '1a' and self.enable:
+                    # relative trigger: the firmware waits `latency` from arrival
+                    self.triggers.append((None, (self.micros() + self.latency * 1000) % (1 << 32), cmd))
+                elif cmd == 'e':
+                    self.enable = True
+                    self._reply('Laser enabled')
+                elif cmd == 'E':
+                    self.enable = False
+                    self.mask = 0
+                    self._reply('Laser disabled')
+                elif cmd == 'c' and self.enable:
+                    self._reply('Laser is on')
+                elif cmd == 'C':
+                    self._reply('Laser is off')
+                elif cmd == 't':
+                    self._reply(f't {self.micros()}')
+            self.counts[cmd] += 1
+
+
+if __name__ == "__main__":
+    with TeensySim() as sim:
+        print(f"Teensy simulator on {sim.port}, Ctrl-C to quit")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(dict(sim.counts))
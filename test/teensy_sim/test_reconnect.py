@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from nctrl.output import Laser
+from teensy_sim import TeensySim
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def drive(laser, duration, rate=500):
+    """Trigger at `rate` Hz like the decoder would; returns the slowest call (s)."""
+    slowest = 0.0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        laser(1)
+        slowest = max(slowest, time.perf_counter() - start)
+        time.sleep(1 / rate)
+    return slowest
+
+
+def test_reconnect(policy='drop', down=0.5):
+    """Force a link loss while triggering; the laser must come back with its settings on the new port."""
+    link_dir = tempfile.mkdtemp()
+    with TeensySim(link_dir=link_dir) as sim:
+        laser = Laser(sim.port, policy=policy, port_pattern=os.path.join(link_dir, 'ttyACM*'))
+        laser.set_duration(20)
+        laser.set_latency(3)
+        laser.on()
+        dropped, disconnects = laser.dropped_total.value, laser.disconnects_total.value
+        slowest = drive(laser, 0.5)
+
+        sim.disconnect()
+        slowest = max(slowest, drive(laser, 0.2))
+        assert not laser.connected, 'disconnect not detected'
+        slowest = max(slowest, drive(laser, down - 0.2))
+        n_before = len(sim.triggers)
+        sim.reconnect(reset=True)  # rebooted firmware on ttyACM1
+        assert wait_for(lambda: laser.connected), 'not reconnected'
+        assert laser.port == sim.port
+        assert wait_for(lambda: sim.enable and sim.duration == 20 and sim.latency == 3), \
+            f'settings not restored: enable {sim.enable}, duration {sim.duration}, latency {sim.latency}'
+        time.sleep(0.1)  # held triggers follow the settings
+        n_flushed = len(sim.triggers) - n_before
+        slowest = max(slowest, drive(laser, 0.5))
+        assert wait_for(lambda: len(sim.triggers) > n_before + n_flushed), 'no triggers after reconnect'
+        laser.close()
+
+    print(f"policy={policy}: slowest trigger call {slowest * 1e3:.3f} ms, "
+          f"dropped {laser.dropped_total.value - dropped:.0f}, sent on reconnect {n_flushed}, "
+          f"disconnects {laser.disconnects_total.value - disconnects:.0f}")
+    assert slowest < 5e-3, 'a trigger call blocked'
+    if policy == 'buffer':
+        assert n_flushed == laser._pending.maxlen, 'buffered triggers not sent'
+    else:
+        assert n_flushed == 0
+    return slowest
+
+
+def test_buffer_age():
+    """Buffered triggers older than max_age are dropped instead of firing late."""
+    link_dir = tempfile.mkdtemp()
+    with TeensySim(link_dir=link_dir) as sim:
+        laser = Laser(sim.port, policy='buffer', max_age=0.2, port_pattern=os.path.join(link_dir, 'ttyACM*'))
+        laser.on()
+        sim.disconnect()
+        # the kernel hangs the pty up asynchronously; the first failing write detects the loss
+        assert wait_for(lambda: laser(1) or not laser.connected)
+        time.sleep(0.5)
+        n_before = len(sim.triggers)
+        sim.reconnect()
+        assert wait_for(lambda: laser.connected and sim.enable)
+        time.sleep(0.1)
+        assert len(sim.triggers) == n_before, 'stale trigger fired'
+        laser.close()
+    print('stale buffered trigger dropped')
+
+
+def test_forked(duration=2.0):
+    """The BMI process is forked and triggers the laser itself; it must reconnect on its own."""
+    link_dir = tempfile.mkdtemp()
+    with TeensySim(link_dir=link_dir) as sim:
+        laser = Laser(sim.port, port_pattern=os.path.join(link_dir, 'ttyACM*'))
+        laser.set_duration(20)
+        laser.on()
+
+        def bmi():
+            # like the BMI process: the simulator's pty ends belong to the parent only
+            os.close(sim.master)
+            os.close(sim.slave)
+            drive(laser, duration)
+
+        process = multiprocessing.get_context('fork').Process(target=bmi)
+        process.start()
+        time.sleep(0.5)
+        sim.disconnect()
+        time.sleep(0.5)
+        n_before = len(sim.triggers)
+        sim.reconnect(reset=True)
+        process.join()
+        n_after = len(sim.triggers) - n_before
+        laser.close()
+
+    print(f'forked: {n_after} triggers after reconnect, duration restored: {sim.duration == 20}')
+    assert n_after > 0, 'the BMI process did not reconnect'
+    assert sim.enable and sim.duration == 20
+
+
+if __name__ == "__main__":
+    test_reconnect('drop')
+    test_reconnect('buffer')
+    test_buffer_age()
+    test_forked()